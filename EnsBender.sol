@@ -28,6 +28,24 @@ contract SuperBaseRegistrar is ERC1155Holder {
         string calldata label,
         address owner
     ) public payable {
+        _register(label, owner);
+    }
+
+    /// Registers labels[i] for owners[i] in a single transaction
+    function registerBatch(
+        string[] calldata labels,
+        address[] calldata owners
+    ) public payable {
+        require(labels.length == owners.length, "labels and owners length mismatch");
+        for (uint256 i = 0; i < labels.length; i++) {
+            _register(labels[i], owners[i]);
+        }
+    }
+
+    function _register(
+        string calldata label,
+        address owner
+    ) internal {
         wrapper.setSubnodeOwner(
             PARENT_NODE,
             label,
@@ -0,0 +1,67 @@
+"""Microbenchmark: inline entity-secret encryption vs. the ciphertext pool.
+
+Compares the per-call cost of ``encrypt_entity_secret()`` (env lookup, PEM
+parse and RSA-OAEP on every call) with taking a pre-computed ciphertext from
+``EntitySecretCiphertextPool``.  A throwaway RSA key and secret are generated
+when the Circle variables are not set, so this runs without credentials:
+
+    python bench/bench_entity_secret.py --iterations 2000
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Crypto.PublicKey import RSA
+
+
+def _ensure_credentials():
+    if not os.getenv('CIRCLE_PUBLIC_KEY'):
+        os.environ['CIRCLE_PUBLIC_KEY'] = RSA.generate(4096).publickey().export_key().decode()
+    if not os.getenv('CIRCLE_HEX_ENCODED_ENTITY_SECRET_KEY'):
+        os.environ['CIRCLE_HEX_ENCODED_ENTITY_SECRET_KEY'] = os.urandom(32).hex()
+
+
+def _time_calls(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "mean_us": sum(samples) / len(samples) * 1e6,
+        "p50_us": samples[len(samples) // 2] * 1e6,
+        "p99_us": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    _ensure_credentials()
+    import circle_bender
+
+    inline = _time_calls(circle_bender.encrypt_entity_secret, args.iterations)
+
+    # Warm pool: pre-fill it completely so every take is a queue pop
+    pool = circle_bender.EntitySecretCiphertextPool(args.iterations)
+    pool.start()
+    while pool._queue.qsize() < args.iterations:
+        time.sleep(0.05)
+    pool.stop()
+    pooled = _time_calls(pool.get, args.iterations)
+
+    for label, stats in (("encrypt_entity_secret", inline), ("pool.get (warm)", pooled)):
+        print(f"{label:24s} mean {stats['mean_us']:10.1f} us  p50 {stats['p50_us']:10.1f} us  "
+              f"p99 {stats['p99_us']:10.1f} us")
+    print(f"speedup (mean): {inline['mean_us'] / pooled['mean_us']:.0f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""In-memory stand-in for the parts of the Circle W3S API the backend uses.
+
+Serves wallet sets, wallets, balances, transfers, transaction lists/lookups
+and contract execution with a configurable per-request latency, so the
+backend can be load-tested without credentials or testnet funds.  Point the
+backend at it with CIRCLE_API_BASE_URL:
+
+    FAKE_CIRCLE_LATENCY_MS=80 uvicorn fake_circle:app --app-dir bench --port 9101
+
+Configuration (environment):
+    FAKE_CIRCLE_LATENCY_MS     delay added to every response (default 50)
+    FAKE_CIRCLE_CONFIRM_MS     time until a submitted transaction reads COMPLETE (default 0)
+    FAKE_CIRCLE_CONTRIBUTORS   inbound transfers listed per destination address (default 3)
+    FAKE_CIRCLE_SEED_WALLETS   wallets "seed-wallet-0".. that exist from the start (default 0),
+                               matching the projects load_test.py seeds
+"""
+import os
+import time
+import uuid
+import asyncio
+import hashlib
+from datetime import datetime, timezone
+
+from fastapi import FastAPI, Request
+
+LATENCY_SECONDS = float(os.getenv('FAKE_CIRCLE_LATENCY_MS', '50')) / 1000
+CONFIRM_SECONDS = float(os.getenv('FAKE_CIRCLE_CONFIRM_MS', '0')) / 1000
+CONTRIBUTORS = int(os.getenv('FAKE_CIRCLE_CONTRIBUTORS', '3'))
+SEED_WALLETS = int(os.getenv('FAKE_CIRCLE_SEED_WALLETS', '0'))
+
+# Same token id the backend uses for ETH on Sepolia
+ETH_SEPOLIA_TOKEN_ID = '979869da-9115-5f7d-917d-12d434e56ae7'
+
+app = FastAPI()
+
+_transactions = {}
+_idempotency = {}
+# Wallets in creation order, so list pagination is stable
+_wallets = {f"seed-wallet-{i}": {"id": f"seed-wallet-{i}", "walletSetId": "seed-wallet-set"}
+            for i in range(SEED_WALLETS)}
+stats = {"requests": 0, "transaction_lists": 0, "transaction_gets": 0, "wallet_balance_lists": 0,
+         "wallet_balance_calls": 0}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _digest(value: str) -> int:
+    return int(hashlib.sha256(value.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def _address(value: str) -> str:
+    return "0x" + hashlib.sha256(value.encode("utf-8")).hexdigest()[:40]
+
+
+@app.middleware("http")
+async def add_latency(request: Request, call_next):
+    stats["requests"] += 1
+    if LATENCY_SECONDS > 0:
+        await asyncio.sleep(LATENCY_SECONDS)
+    return await call_next(request)
+
+
+def _record_transaction(key: str, kind: str, body: dict) -> dict:
+    # Replays of an idempotency key return the original transaction
+    if key and key in _idempotency:
+        return _transactions[_idempotency[key]]
+    transaction = {"id": str(uuid.uuid4()), "operation": kind, "createDate": _now(),
+                   "submitted_at": time.time(), "walletId": body.get("walletId"), "body": body}
+    _transactions[transaction["id"]] = transaction
+    if key:
+        _idempotency[key] = transaction["id"]
+    return transaction
+
+
+@app.post("/v1/w3s/developer/walletSets")
+async def create_wallet_set(request: Request):
+    body = await request.json()
+    return {"data": {"walletSet": {"id": str(uuid.uuid4()), "name": body.get("name")}}}
+
+
+@app.post("/v1/w3s/developer/wallets")
+async def create_wallets(request: Request):
+    body = await request.json()
+    wallets = []
+    for metadata in body.get("metadata") or [{}] * int(body.get("count", 1)):
+        wallet_id = str(uuid.uuid4())
+        wallet = {"id": wallet_id, "address": _address(wallet_id), "refId": metadata.get("refId"),
+                  "name": metadata.get("name"), "walletSetId": body.get("walletSetId"),
+                  "blockchain": "ETH-SEPOLIA", "state": "LIVE"}
+        _wallets[wallet_id] = wallet
+        wallets.append(wallet)
+    return {"data": {"wallets": wallets}}
+
+
+def _token_balances(wallet_id: str) -> list:
+    amount = f"{_digest(wallet_id) % 100000 / 10000:.4f}"
+    return [{"amount": amount, "token": {"id": ETH_SEPOLIA_TOKEN_ID}}]
+
+
+@app.get("/v1/w3s/wallets/{wallet_id}/balances")
+async def wallet_balances(wallet_id: str):
+    stats["wallet_balance_calls"] += 1
+    return {"data": {"tokenBalances": _token_balances(wallet_id)}}
+
+
+@app.get("/v1/w3s/developer/wallets/balances")
+async def developer_wallet_balances(request: Request):
+    """Balances of every wallet (of one wallet set when ``walletSetId`` is given), paginated."""
+    stats["wallet_balance_lists"] += 1
+    params = request.query_params
+    wallet_set_id = params.get("walletSetId")
+    ids = [wallet_id for wallet_id, wallet in _wallets.items()
+           if wallet_set_id is None or wallet["walletSetId"] == wallet_set_id]
+    if params.get("pageAfter"):
+        after = params["pageAfter"]
+        ids = ids[ids.index(after) + 1:] if after in ids else []
+    ids = ids[:min(int(params.get("pageSize", 10)), 50)]
+    return {"data": {"wallets": [{"id": wallet_id, "blockchain": "ETH-SEPOLIA",
+                                  "tokenBalances": _token_balances(wallet_id)} for wallet_id in ids]}}
+
+
+@app.post("/v1/w3s/developer/transactions/transfer")
+async def transfer(request: Request):
+    body = await request.json()
+    transaction = _record_transaction(body.get("idempotencyKey"), "TRANSFER", body)
+    return {"data": {"id": transaction["id"], "state": "INITIATED"}}
+
+
+@app.post("/v1/w3s/developer/transactions/contractExecution")
+async def contract_execution(request: Request):
+    body = await request.json()
+    transaction = _record_transaction(body.get("idempotencyKey"), "CONTRACT_EXECUTION", body)
+    return {"data": {"id": transaction["id"], "state": "INITIATED"}}
+
+
+def _view(transaction: dict) -> dict:
+    settled = time.time() - transaction["submitted_at"] >= CONFIRM_SECONDS
+    return {"id": transaction["id"], "operation": transaction["operation"], "walletId": transaction["walletId"],
+            "state": "COMPLETE" if settled else "SENT", "createDate": transaction["createDate"]}
+
+
+@app.get("/v1/w3s/transactions/{transaction_id}")
+async def get_transaction(transaction_id: str):
+    stats["transaction_gets"] += 1
+    transaction = _transactions.get(transaction_id)
+    if transaction is None:
+        return {"data": {"transaction": {"id": transaction_id, "state": "COMPLETE"}}}
+    return {"data": {"transaction": _view(transaction)}}
+
+
+def _list_outbound(params) -> dict:
+    """Submitted transactions of the given wallets, newest first, paginated like Circle."""
+    stats["transaction_lists"] += 1
+    wallet_ids = set(params["walletIds"].split(","))
+    since = params.get("from", "")
+    page_size = int(params.get("pageSize", 10))
+    transactions = sorted((t for t in _transactions.values()
+                           if t["walletId"] in wallet_ids and t["createDate"] >= since),
+                          key=lambda t: t["createDate"], reverse=True)
+    page_after = params.get("pageAfter")
+    if page_after:
+        ids = [t["id"] for t in transactions]
+        transactions = transactions[ids.index(page_after) + 1:] if page_after in ids else []
+    return {"data": {"transactions": [_view(t) for t in transactions[:page_size]]}}
+
+
+@app.get("/v1/w3s/transactions")
+async def list_transactions(request: Request):
+    if request.query_params.get("walletIds"):
+        return _list_outbound(request.query_params)
+    destination = request.query_params.get("destinationAddress", "")
+    # A fixed, deterministic inbound history per destination; one page only
+    if request.query_params.get("pageAfter") or request.query_params.get("from"):
+        return {"data": {"transactions": []}}
+    transactions = [{
+        "id": f"{destination}-{i}",
+        "transactionType": "INBOUND",
+        "state": "COMPLETE",
+        "tokenId": ETH_SEPOLIA_TOKEN_ID,
+        "sourceAddress": _address(f"{destination}-source-{i}"),
+        "destinationAddress": destination,
+        "amounts": [f"{(_digest(destination) + i) % 1000 / 1000 + 0.001:.3f}"],
+        "createDate": f"2024-01-01T00:00:{i:02d}Z",
+    } for i in range(CONTRIBUTORS)]
+    return {"data": {"transactions": transactions}}
+
+
+@app.get("/v2/notifications/publicKey/{key_id}")
+async def notification_public_key(key_id: str):
+    return {"data": {"publicKey": ""}}
+
+
+@app.get("/_stats")
+async def fake_stats():
+    return dict(stats, transactions=len(_transactions))
@@ -0,0 +1,85 @@
+"""Stand-in for the OpenAI chat completions endpoint with configurable latency.
+
+Answers ``POST /v1/chat/completions`` both as a single JSON body and as an
+SSE stream of chunks, after a fixed time-to-first-token plus a per-token
+delay.  Point the backend at it with OPENAI_BASE_URL:
+
+    FAKE_OPENAI_LATENCY_MS=400 uvicorn fake_openai:app --app-dir bench --port 9102
+    OPENAI_BASE_URL=http://127.0.0.1:9102/v1 ...
+
+Configuration (environment):
+    FAKE_OPENAI_LATENCY_MS       time to first token (default 300)
+    FAKE_OPENAI_TOKEN_MS         delay between streamed tokens (default 5)
+    FAKE_OPENAI_ANSWER_TOKENS    tokens per answer (default 60)
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+LATENCY_SECONDS = float(os.getenv('FAKE_OPENAI_LATENCY_MS', '300')) / 1000
+TOKEN_SECONDS = float(os.getenv('FAKE_OPENAI_TOKEN_MS', '5')) / 1000
+ANSWER_TOKENS = int(os.getenv('FAKE_OPENAI_ANSWER_TOKENS', '60'))
+
+app = FastAPI()
+stats = {"requests": 0}
+
+
+def _tokens():
+    return [("Bite my shiny metal answer" if i == 0 else f" token{i}") for i in range(ANSWER_TOKENS)]
+
+
+def _usage(messages) -> dict:
+    prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in messages)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": ANSWER_TOKENS,
+            "total_tokens": prompt_tokens + ANSWER_TOKENS}
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+    chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+             "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    stats["requests"] += 1
+    body = await request.json()
+    model = body.get("model", "gpt-4o")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    await asyncio.sleep(LATENCY_SECONDS)
+
+    if body.get("stream"):
+        async def stream():
+            yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+            for token in _tokens():
+                if TOKEN_SECONDS > 0:
+                    await asyncio.sleep(TOKEN_SECONDS)
+                yield _chunk(completion_id, model, {"content": token})
+            yield _chunk(completion_id, model, {}, finish_reason="stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": model, "choices": [], "usage": _usage(body.get("messages", []))}
+                yield f"data: {json.dumps(usage)}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    await asyncio.sleep(TOKEN_SECONDS * ANSWER_TOKENS)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(_tokens())},
+                     "finish_reason": "stop"}],
+        "usage": _usage(body.get("messages", [])),
+    }
+
+
+@app.get("/_stats")
+async def fake_stats():
+    return stats
@@ -0,0 +1,89 @@
+"""Import-time profile of the application module.
+
+Runs ``python -X importtime -c "import main"`` in fresh interpreters (so
+nothing is cached in ``sys.modules``) and reports the median total import
+time together with the most expensive top-level packages:
+
+    python bench/import_profile.py --runs 5 --top 15 --output imports.json
+    python bench/import_profile.py --baseline imports.json --max-regression 1.2
+
+With --baseline the total is compared against an earlier report, and with
+--max-regression the script exits non-zero when the total grew by more than
+that factor, so it can guard CI against an eager import creeping back in.
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def profile_once(module: str) -> dict:
+    """Cumulative import time in microseconds per top-level package, plus the total."""
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE="")
+    env.setdefault('OPENAI_API_KEY', 'import-profile')
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    packages = defaultdict(int)
+    total = 0
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        if name == module:
+            total = cumulative
+        elif indent == 3:
+            # Direct imports of the profiled module: what it costs to load each dependency
+            packages[name.split(".")[0]] += cumulative
+    return {"total_us": total, "packages": dict(packages)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="earlier JSON report to compare the total against")
+    parser.add_argument("--max-regression", type=float,
+                        help="fail when total / baseline total exceeds this factor")
+    args = parser.parse_args(argv)
+
+    runs = [profile_once(args.module) for _ in range(args.runs)]
+    packages = defaultdict(list)
+    for run in runs:
+        for name, micros in run["packages"].items():
+            packages[name].append(micros)
+    top = sorted(((name, statistics.median(values)) for name, values in packages.items()),
+                 key=lambda item: item[1], reverse=True)[:args.top]
+    report = {
+        "module": args.module,
+        "runs": args.runs,
+        "total_ms": round(statistics.median(run["total_us"] for run in runs) / 1000, 1),
+        "packages_ms": {name: round(micros / 1000, 1) for name, micros in top},
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        report["total_vs_baseline"] = round(report["total_ms"] / baseline["total_ms"], 3)
+        if args.max_regression and report["total_vs_baseline"] > args.max_regression:
+            exit_code = 1
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,362 @@
+"""End-to-end load test of the backend against local Circle/OpenAI stand-ins.
+
+Starts ``fake_circle`` and ``fake_openai`` (see their docstrings), seeds a
+fresh SQLite database with N projects, starts the backend pointed at the
+fakes and drives each endpoint with a fixed number of requests at a given
+concurrency.  Per scenario it reports throughput and p50/p95/p99 latency as
+JSON; queued work (registrations, payout jobs) is also timed end to end.
+
+    python bench/load_test.py --projects 1000 --concurrency 32 --output results.json
+    python bench/load_test.py --scenarios leaderboard,ask_llm --baseline results.json
+
+With --baseline, each scenario's p95 is compared against an earlier run and
+the ratio is added to the output.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from typing import Awaitable, Callable, Dict, List
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+# Requests per scenario when --requests is not given; payouts collect from every project
+DEFAULT_REQUESTS = {
+    "leaderboard": 500,
+    "leaderboard_full": 200,
+    "random_project": 500,
+    "ask_llm": 200,
+    "ask_llm_with_context": 200,
+    "ask_llm_stream": 100,
+    "register_project": 100,
+    "pay_to_luckies": 5,
+}
+
+# Rate-limit classes of circle_ratelimit, overridden together by --circle-rate
+CIRCLE_RATE_CLASSES = ("balances", "transfers", "contract_execution", "wallets", "transactions", "other")
+
+# How often queued work is polled for completion
+POLL_SECONDS = 0.05
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted ``samples``."""
+    if not samples:
+        return 0.0
+    rank = max(0, min(len(samples) - 1, int(round(fraction * len(samples) + 0.5)) - 1))
+    return samples[rank]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    samples = sorted(latencies)
+    completed = len(samples)
+    return {
+        "requests": completed + errors,
+        "errors": errors,
+        "throughput_rps": round(completed / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(sum(samples) / completed * 1000, 2) if completed else 0.0,
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+        "max_ms": round(samples[-1] * 1000, 2) if samples else 0.0,
+    }
+
+
+class Recorder:
+    """Latency samples of one named measurement."""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+
+
+async def run_scenario(operation: Callable[[int, Dict[str, Recorder]], Awaitable[None]], requests: int,
+                       concurrency: int) -> Dict[str, dict]:
+    """Call ``operation(i, recorders)`` ``requests`` times with ``concurrency`` workers."""
+    recorders: Dict[str, Recorder] = {}
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            await operation(i, recorders)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {name: summarize(recorder.latencies, recorder.errors, elapsed) for name, recorder in recorders.items()}
+
+
+async def timed(recorders: Dict[str, Recorder], name: str, call: Callable[[], Awaitable[httpx.Response]]):
+    recorder = recorders.setdefault(name, Recorder())
+    start = time.perf_counter()
+    try:
+        response = await call()
+    except httpx.HTTPError:
+        recorder.errors += 1
+        return None
+    latency = time.perf_counter() - start
+    if response.status_code >= 400 or (response.headers.get("content-type", "").startswith("application/json")
+                                       and isinstance(response.json(), dict) and "error" in response.json()):
+        recorder.errors += 1
+        return None
+    recorder.latencies.append(latency)
+    return response
+
+
+async def wait_until(recorders: Dict[str, Recorder], name: str, client: httpx.AsyncClient, url: str,
+                     done: Callable[[dict], bool], failed: Callable[[dict], bool], started: float, timeout: float):
+    """Poll ``url`` until ``done(body)`` and record the time since ``started``.
+
+    An outcome that is ``failed(body)`` is counted as an error instead of a latency sample.
+    """
+    recorder = recorders.setdefault(name, Recorder())
+    while time.perf_counter() - started < timeout:
+        body = (await client.get(url)).json()
+        if done(body):
+            if failed(body):
+                recorder.errors += 1
+            else:
+                recorder.latencies.append(time.perf_counter() - started)
+            return body
+        await asyncio.sleep(POLL_SECONDS)
+    recorder.errors += 1
+
+
+def scenarios(client: httpx.AsyncClient, project_names: List[str], run_id: str, timeout: float):
+    async def leaderboard(i, recorders):
+        await timed(recorders, "leaderboard", lambda: client.get("/leaderboard", params={"limit": 50}))
+
+    async def leaderboard_full(i, recorders):
+        await timed(recorders, "leaderboard_full", lambda: client.post("/leaderboard"))
+
+    async def random_project(i, recorders):
+        await timed(recorders, "random_project", lambda: client.get("/random-project"))
+
+    async def ask_llm(i, recorders):
+        await timed(recorders, "ask_llm",
+                    lambda: client.post("/ask-llm", data={"question": f"How do I win hackathon {run_id}-{i}?"}))
+
+    async def ask_llm_with_context(i, recorders):
+        await timed(recorders, "ask_llm_with_context",
+                    lambda: client.post("/ask-llm-with-context",
+                                        data={"question": f"Which DeFi projects won prizes ({run_id}-{i})?"}))
+
+    async def ask_llm_stream(i, recorders):
+        await timed(recorders, "ask_llm_stream",
+                    lambda: client.post("/ask-llm", data={"question": f"Stream me tips {run_id}-{i}",
+                                                          "stream": "true"}))
+
+    async def register_project(i, recorders):
+        started = time.perf_counter()
+        response = await timed(recorders, "register_project",
+                               lambda: client.post("/register-project", data={"project": f"bench-{run_id}-{i}"}))
+        if response is not None:
+            await wait_until(recorders, "register_project_e2e", client, response.json()["status_url"],
+                             lambda body: body.get("status") in ("registered", "failed"),
+                             lambda body: body["status"] == "failed", started, timeout)
+
+    async def pay_to_luckies(i, recorders):
+        started = time.perf_counter()
+        winners = random.sample(project_names, min(2, len(project_names)))
+        response = await timed(recorders, "pay_to_luckies",
+                               lambda: client.post("/pay-to-luckies", json={"winner_project_names": winners}))
+        if response is not None:
+            await wait_until(recorders, "pay_to_luckies_job", client, response.json()["status_url"],
+                             lambda body: body.get("status") in ("completed", "failed"),
+                             # A completed job with an error had transfers that failed
+                             lambda body: body["status"] == "failed" or bool(body.get("error")), started, timeout)
+
+    return {
+        "leaderboard": leaderboard,
+        "leaderboard_full": leaderboard_full,
+        "random_project": random_project,
+        "ask_llm": ask_llm,
+        "ask_llm_with_context": ask_llm_with_context,
+        "ask_llm_stream": ask_llm_stream,
+        "register_project": register_project,
+        "pay_to_luckies": pay_to_luckies,
+    }
+
+
+async def seed(database_url: str, count: int) -> List[str]:
+    """Create the projects table and insert ``count`` projects directly."""
+    os.environ['DATABASE_URL'] = database_url
+    sys.path.insert(0, REPO_DIR)
+    from sqlalchemy import insert
+    import database
+
+    await database.create_tables()
+    names = [f"seed-project-{i}" for i in range(count)]
+    async with database.SessionLocal() as db:
+        await db.execute(insert(database.Project), [
+            {"name": name, "wallet_id": f"seed-wallet-{i}", "wallet_address": f"0x{i:040x}",
+             "ens_address": f"https://app.ens.domains/{name}.benderbite.eth"}
+            for i, name in enumerate(names)])
+        await db.commit()
+    await database.engine.dispose()
+    return names
+
+
+def spawn(module: str, app_dir: str, port: int, env: dict, log) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{module}:app", "--app-dir", app_dir, "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_ready(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited with code {process.returncode}")
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout:.0f}s")
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _credentials() -> dict:
+    from Crypto.PublicKey import RSA
+    return {
+        "CIRCLE_API_KEY": "bench",
+        "CIRCLE_PUBLIC_KEY": RSA.generate(2048).publickey().export_key().decode(),
+        "CIRCLE_HEX_ENCODED_ENTITY_SECRET_KEY": os.urandom(32).hex(),
+        "OPENAI_API_KEY": "bench",
+    }
+
+
+async def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="benderbite-bench-")
+    database_url = f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}"
+    project_names = await seed(database_url, args.projects)
+
+    circle_url = f"http://127.0.0.1:{args.port_base + 1}"
+    openai_url = f"http://127.0.0.1:{args.port_base + 2}"
+    backend_url = f"http://127.0.0.1:{args.port_base}"
+    env = dict(os.environ, **_credentials(),
+               DATABASE_URL=database_url,
+               CIRCLE_API_BASE_URL=circle_url,
+               OPENAI_BASE_URL=f"{openai_url}/v1",
+               CIRCLE_WEBHOOK_VERIFY="0",
+               CIRCLE_WALLET_SET_ID="bench-wallet-set",
+               LEDGER_RECONCILE_SECONDS="0",
+               FAKE_CIRCLE_LATENCY_MS=str(args.circle_latency_ms),
+               FAKE_CIRCLE_CONFIRM_MS=str(args.confirm_ms),
+               FAKE_CIRCLE_SEED_WALLETS=str(args.projects),
+               FAKE_OPENAI_LATENCY_MS=str(args.openai_latency_ms),
+               FAKE_OPENAI_TOKEN_MS=str(args.openai_token_ms))
+    if args.circle_rate > 0:
+        env["CIRCLE_GLOBAL_RATE"] = str(args.circle_rate)
+        env["CIRCLE_RATE_LIMITS"] = ",".join(f"{name}={args.circle_rate}" for name in CIRCLE_RATE_CLASSES)
+
+    log = open(os.path.join(workdir, "servers.log"), "wb")
+    processes = [
+        spawn("fake_circle", BENCH_DIR, args.port_base + 1, env, log),
+        spawn("fake_openai", BENCH_DIR, args.port_base + 2, env, log),
+    ]
+    try:
+        await wait_ready(f"{circle_url}/_stats", processes[0])
+        await wait_ready(f"{openai_url}/_stats", processes[1])
+        processes.append(spawn("main", REPO_DIR, args.port_base, env, log))
+        await wait_ready(f"{backend_url}/llm-cache/stats", processes[2])
+
+        run_id = f"{int(time.time())}"
+        limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency)
+        results = {}
+        async with httpx.AsyncClient(base_url=backend_url, limits=limits, timeout=args.timeout) as client:
+            available = scenarios(client, project_names, run_id, args.timeout)
+            for name in args.scenarios:
+                requests = args.requests or DEFAULT_REQUESTS[name]
+                print(f"running {name}: {requests} requests, concurrency {args.concurrency}", file=sys.stderr)
+                results.update(await run_scenario(available[name], requests, args.concurrency))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        log.close()
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "projects": args.projects,
+            "concurrency": args.concurrency,
+            "circle_latency_ms": args.circle_latency_ms,
+            "openai_latency_ms": args.openai_latency_ms,
+            "circle_rate": args.circle_rate,
+            "server_log": log.name,
+        },
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict):
+    """Add each scenario's p95 ratio against ``baseline`` (>1 means slower)."""
+    for name, stats in report["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if before and before.get("p95_ms"):
+            stats["p95_vs_baseline"] = round(stats["p95_ms"] / before["p95_ms"], 3)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=200, help="projects to seed")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=0, help="requests per scenario (default: per scenario)")
+    parser.add_argument("--scenarios", default=",".join(DEFAULT_REQUESTS),
+                        help="comma-separated subset of: " + ", ".join(DEFAULT_REQUESTS))
+    parser.add_argument("--circle-latency-ms", type=float, default=50)
+    parser.add_argument("--confirm-ms", type=float, default=0, help="fake time until transactions complete")
+    parser.add_argument("--openai-latency-ms", type=float, default=300)
+    parser.add_argument("--openai-token-ms", type=float, default=5)
+    parser.add_argument("--circle-rate", type=float, default=1000,
+                        help="client-side Circle rate limit per second; 0 keeps the production limits")
+    parser.add_argument("--timeout", type=float, default=120, help="per request and per queued job")
+    parser.add_argument("--port-base", type=int, default=9100)
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    parser.add_argument("--baseline", help="earlier JSON report to compare p95 latencies against")
+    args = parser.parse_args(argv)
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in DEFAULT_REQUESTS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    report = asyncio.run(run(args))
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            compare(report, json.load(file))
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
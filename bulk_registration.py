@@ -0,0 +1,163 @@
+"""Bulk project registration on a shared Circle wallet set.
+
+Registering a project used to create a dedicated wallet set and then a
+single wallet in a second call.  Here all project wallets live in one shared
+wallet set (created once and remembered in ``shared_wallet_sets``, or given
+via CIRCLE_WALLET_SET_ID), and wallets are created in batches with the wallet
+API's multi-metadata ``count`` form, so onboarding N projects costs about
+N / BULK_WALLET_BATCH_SIZE wallet calls.  The resulting rows are inserted into
+``projects`` in one transaction; a name another worker stored in the meantime
+is left as it is.  Projects whose ENS registration failed are not stored
+here but handed to the registrations pipeline, which retries it from their
+existing wallet.
+
+Configuration (environment):
+    CIRCLE_WALLET_SET_ID     use this existing wallet set for every project
+    CIRCLE_WALLET_SET_NAME   name of the shared set when it has to be created
+                             (default "benderbite-projects")
+    BULK_WALLET_BATCH_SIZE   wallets per creation call (default and max 200)
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import List, Optional
+
+from sqlalchemy import Column, Float, String, select
+
+import circle_bender_async
+import ens_batcher
+import registrations
+from database import IS_SQLITE, Base, Project, SessionLocal
+from project_registry import registry
+
+if IS_SQLITE:
+    from sqlalchemy.dialects.sqlite import insert as upsert
+else:
+    from sqlalchemy.dialects.postgresql import insert as upsert
+
+logger = logging.getLogger(__name__)
+
+CIRCLE_WALLET_SET_NAME = os.getenv('CIRCLE_WALLET_SET_NAME', 'benderbite-projects')
+BULK_WALLET_BATCH_SIZE = min(int(os.getenv('BULK_WALLET_BATCH_SIZE', '200')),
+                             circle_bender_async.MAX_WALLETS_PER_REQUEST)
+
+
+class SharedWalletSet(Base):
+    __tablename__ = "shared_wallet_sets"
+
+    name = Column(String, primary_key=True)
+    wallet_set_id = Column(String, nullable=False)
+    created_at = Column(Float, nullable=False)
+
+
+_wallet_set_lock = asyncio.Lock()
+_wallet_set_id: Optional[str] = os.getenv('CIRCLE_WALLET_SET_ID')
+
+
+async def shared_wallet_set_id() -> str:
+    """Id of the wallet set every project wallet is created in."""
+    global _wallet_set_id
+    if _wallet_set_id:
+        return _wallet_set_id
+    async with _wallet_set_lock:
+        if _wallet_set_id:
+            return _wallet_set_id
+        async with SessionLocal() as db:
+            row = await db.get(SharedWalletSet, CIRCLE_WALLET_SET_NAME)
+            if row is None:
+                wallet_set_id = await circle_bender_async.create_wallet_set(CIRCLE_WALLET_SET_NAME)
+                row = SharedWalletSet(name=CIRCLE_WALLET_SET_NAME, wallet_set_id=wallet_set_id,
+                                      created_at=time.time())
+                db.add(row)
+                await db.commit()
+                logger.info(f"Created shared wallet set {wallet_set_id}")
+            _wallet_set_id = row.wallet_set_id
+        return _wallet_set_id
+
+
+async def _create_batch(wallet_set_id: str, names: List[str]) -> dict:
+    wallets = await circle_bender_async.create_wallets(
+        wallet_set_id, [{"name": name, "refId": name} for name in names])
+    return {wallet.get('refId'): wallet for wallet in wallets}
+
+
+async def _taken(names: List[str]) -> set:
+    """Those of ``names`` stored as projects or being registered, by any worker process."""
+    async with SessionLocal() as db:
+        stored = await db.scalars(select(Project.name).where(Project.name.in_(names)))
+        in_flight = await db.scalars(select(registrations.Registration.project_name)
+                                     .where(registrations.Registration.project_name.in_(names),
+                                            registrations.Registration.status.notin_(registrations.FINAL_STATUSES)))
+        return set(stored) | set(in_flight)
+
+
+async def register_projects(names: List[str]) -> dict:
+    """Create wallets and ENS names for ``names`` and store them as projects.
+
+    Names that are already registered (or repeated) are skipped and names
+    that are not valid ENS labels are reported under ``invalid`` before
+    anything is created.  Projects whose wallet batch failed are reported
+    and not inserted; those whose ENS registration failed are queued as
+    registrations and reported under ``queued``.
+    """
+    seen = set()
+    candidates, skipped, invalid = [], [], {}
+    for name in names:
+        if not name or name in seen or registry.get(name) is not None:
+            skipped.append(name)
+        else:
+            try:
+                ens_batcher.validate_label(name)
+                candidates.append(name)
+            except ValueError as e:
+                invalid[name] = str(e)
+        seen.add(name)
+    taken = await _taken(candidates) if candidates else set()
+    skipped += [name for name in candidates if name in taken]
+    new_names = [name for name in candidates if name not in taken]
+    if not new_names:
+        return {"registered": [], "skipped": skipped, "invalid": invalid, "failed": [], "queued": []}
+
+    wallet_set_id = await shared_wallet_set_id()
+    batches = [new_names[i:i + BULK_WALLET_BATCH_SIZE] for i in range(0, len(new_names), BULK_WALLET_BATCH_SIZE)]
+    results = await asyncio.gather(*(_create_batch(wallet_set_id, batch) for batch in batches),
+                                   return_exceptions=True)
+
+    wallets, failed = {}, []
+    for batch, result in zip(batches, results):
+        if isinstance(result, Exception):
+            logger.error(f"Wallet batch of {len(batch)} failed: {result}")
+            failed.extend(batch)
+        else:
+            wallets.update(result)
+    for name in new_names:
+        if name not in wallets and name not in failed:
+            failed.append(name)
+
+    created = [name for name in new_names if name in wallets]
+    # Submitted together, these are coalesced by ens_batcher (registerBatch once ENS_BATCH_REGISTRATION is on)
+    ens_addresses = await asyncio.gather(*(ens_batcher.register(name, wallets[name].get('address')) for name in created))
+
+    rows = {name: {"name": name, "wallet_id": wallets[name].get('id'), "wallet_address": wallets[name].get('address'),
+                   "ens_address": ens_address}
+            for name, ens_address in zip(created, ens_addresses) if ens_address is not None}
+    registered, queued = [], []
+    async with SessionLocal() as db:
+        if rows:
+            # A name another worker stored since the check above is left to it (and skipped here)
+            inserted = await db.execute(upsert(Project).values(list(rows.values()))
+                                        .on_conflict_do_nothing(index_elements=[Project.name])
+                                        .returning(Project.id, Project.name))
+            registered = [Project(id=project_id, **rows[name]) for project_id, name in inserted]
+            await db.commit()
+        for name in created:
+            if name not in rows:
+                queued.append(await registrations.submit_with_wallet(db, name, wallets[name].get('id'),
+                                                                     wallets[name].get('address')))
+    stored = {project.name for project in registered}
+    skipped += [name for name in rows if name not in stored]
+    registered = [registry.upsert(project).as_dict() for project in registered]
+
+    logger.info(f"Bulk registered {len(registered)} projects in {len(batches)} wallet call(s)")
+    return {"registered": registered, "skipped": skipped, "invalid": invalid, "failed": failed, "queued": queued}
@@ -1,22 +1,19 @@
 import os
+import json
 import uuid
+import queue
 import logging
+import threading
+import time
 from decimal import Decimal, getcontext
 
-from circle.web3 import developer_controlled_wallets as dc_wallets
-from circle.web3 import smart_contract_platform, developer_controlled_wallets
-from circle.web3 import utils as circle_utils
-
-import requests
 from dotenv import load_dotenv
 import base64
-from Crypto.PublicKey import RSA
-from Crypto.Cipher import PKCS1_OAEP
-from Crypto.Hash import SHA256
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
-# Configure logging
+import metrics
+from structured_logging import lazy, sampled
+
+# Logging is configured by the application (structured_logging.configure_logging)
 logger = logging.getLogger(__name__)
 
 # Load environment variables from a .env file
@@ -24,12 +21,21 @@ load_dotenv()
 
 ETH_SEPOLIA_ADDRESS = "979869da-9115-5f7d-917d-12d434e56ae7"
 
+# Base URL of the Circle API, overridable so a local stand-in can be used
+CIRCLE_API_BASE_URL = os.getenv('CIRCLE_API_BASE_URL', 'https://api.circle.com').rstrip('/')
+
+# The Circle SDKs, requests and PyCryptodome are imported where they are used:
+# the async service only needs the constants and the ciphertext pool from this
+# module, and importing them eagerly dominated the application's import time.
+
 def call_contract_execution(name, address):
+    import requests
+
     # Retrieve necessary environment variables
     api_token = os.getenv('CIRCLE_API_KEY')
     wallet_id = 'f89bfdb1-ccf3-517a-8046-12cffeb406de'  # Example wallet ID
     contract_address = '0x5ad32460313e15a165703bd38a65965f4e7c4d0c'  # Example contract address
-    encrypted_entity_secret = encrypt_entity_secret()
+    encrypted_entity_secret = next_entity_secret_ciphertext()
 
     # Generate a unique idempotency key
     idempotency_key = str(uuid.uuid4())
@@ -54,20 +60,23 @@ def call_contract_execution(name, address):
     }
 
     # Endpoint for contract execution
-    url = "https://api.circle.com/v1/w3s/developer/transactions/contractExecution"
+    url = f"{CIRCLE_API_BASE_URL}/v1/w3s/developer/transactions/contractExecution"
 
     try:
         # Send POST request
         response = requests.post(url, headers=headers, json=payload)
         response.raise_for_status()  # Raise an error for bad responses
-        print("Contract execution response:", response.json())
+        logger.debug("Contract execution response: %s", lazy(lambda: response.text))
         return f"https://app.ens.domains/{name}.benderbite.eth"
     except requests.exceptions.HTTPError as e:
-        logging.error(f"HTTP error occurred: {e.response.text}")
+        logger.error("HTTP error occurred: %s", e.response.text)
     except Exception as e:
-        logging.error(f"An error occurred: {e}")
+        logger.error("An error occurred: %s", e)
 
 def call_smartcontract():
+    from circle.web3 import smart_contract_platform, developer_controlled_wallets
+    from circle.web3 import utils as circle_utils
+
     api_key = os.getenv('CIRCLE_API_KEY')
     entity_secret = os.getenv("CIRCLE_HEX_ENCODED_ENTITY_SECRET_KEY")
     scpClient = circle_utils.init_smart_contract_platform_client(api_key=api_key,
@@ -77,9 +86,9 @@ def call_smartcontract():
     api_instance = smart_contract_platform.ViewUpdateApi(scpClient)
     try:
         resposne = api_instance.get_contract(id='0192a688-2cbf-7ee0-8eeb-33947bd7e95f')
-        print(resposne)
+        logger.info("Contract: %s", resposne)
     except smart_contract_platform.ApiException as e:
-        print("Exception when calling ViewUpdateApi->get_contract: %s\n" % e)
+        logger.error("Exception when calling ViewUpdateApi->get_contract: %s", e)
 
     api_instance = developer_controlled_wallets.TransactionsApi(scpClient)
     try:
@@ -91,15 +100,19 @@ def call_smartcontract():
             "feeLevel": 'HIGH'
         })
         resposne = api_instance.create_developer_transaction_contract_execution(request)
-        print(resposne)
+        logger.info("Contract execution: %s", resposne)
     except developer_controlled_wallets.ApiException as e:
-        print("Exception when calling TransactionsApi->create_developer_transaction_contract_execution: %s\n" % e)
+        logger.error("Exception when calling TransactionsApi->create_developer_transaction_contract_execution: %s", e)
 
 def initialize_wallet(project_label, wallet_label, reference_id):
+    import requests
+    from circle.web3 import developer_controlled_wallets as dc_wallets
+    from circle.web3 import utils as circle_utils
+
     # Begin wallet initialization
 
     # Encrypt the entity secret
-    encrypted_entity_secret = encrypt_entity_secret()
+    encrypted_entity_secret = next_entity_secret_ciphertext()
 
     # Generate a unique idempotency key
     idempotency_key = str(uuid.uuid4())
@@ -107,7 +120,7 @@ def initialize_wallet(project_label, wallet_label, reference_id):
     # Retrieve the API token from environment variables
     api_token = os.getenv('CIRCLE_API_KEY')
     if not api_token:
-        print("Error: CIRCLE_API_KEY is not set in the environment variables!")
+        logger.error("CIRCLE_API_KEY is not set in the environment variables!")
         return
 
     # Initialize the developer-controlled wallets client
@@ -134,7 +147,7 @@ def initialize_wallet(project_label, wallet_label, reference_id):
         wallet_set_id = wallet_set.actual_instance.id
 
         # Define the endpoint for wallet creation
-        wallets_endpoint = "https://api.circle.com/v1/w3s/developer/wallets"
+        wallets_endpoint = f"{CIRCLE_API_BASE_URL}/v1/w3s/developer/wallets"
 
         payload = f"""{{
             "blockchains": [
@@ -159,14 +172,23 @@ def initialize_wallet(project_label, wallet_label, reference_id):
 
         # Send a POST request to create the wallet
         response = requests.post(wallets_endpoint, headers=headers, data=payload)
-        print("Wallet created", response.text)
+        logger.debug("Wallet created: %s", lazy(lambda: response.text))
         wallet_data = response.json().get('data', {}).get('wallets', [])[0]
         return wallet_data.get('id'), wallet_data.get('address')
 
     except Exception as e:
-        print(f"Error creating wallet set: {e}")
+        logger.error("Error creating wallet set: %s", e)
 
 def encrypt_entity_secret():
+    with metrics.timer(metrics.ENTITY_SECRET_SECONDS, path="inline"):
+        return _encrypt_entity_secret()
+
+
+def _encrypt_entity_secret():
+    from Crypto.PublicKey import RSA
+    from Crypto.Cipher import PKCS1_OAEP
+    from Crypto.Hash import SHA256
+
     # Retrieve the public key and the entity secret from environment variables
     public_key_pem = os.getenv('CIRCLE_PUBLIC_KEY')
     hex_encoded_secret = os.getenv('CIRCLE_HEX_ENCODED_ENTITY_SECRET_KEY')
@@ -193,21 +215,113 @@ def encrypt_entity_secret():
 
     return encrypted_entity_secret
 
+
+class EntitySecretCiphertextPool:
+    """Bounded pool of pre-computed, single-use entity secret ciphertexts.
+
+    Circle rejects a reused ciphertext, so every request needs a fresh RSA-OAEP
+    encryption of the entity secret.  The key is parsed once and a background
+    thread keeps the pool topped up, which turns taking a ciphertext on the
+    request path into a queue pop.  When the pool is empty (or was never
+    started) a ciphertext is computed inline with the cached key.
+    """
+
+    def __init__(self, size: int):
+        self._queue = queue.Queue(maxsize=size)
+        self._cipher = None
+        self._secret = None
+        self._key_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _load_key(self):
+        with self._key_lock:
+            if self._cipher is None:
+                from Crypto.PublicKey import RSA
+                from Crypto.Cipher import PKCS1_OAEP
+                from Crypto.Hash import SHA256
+
+                entity_secret_bytes = bytes.fromhex(os.getenv('CIRCLE_HEX_ENCODED_ENTITY_SECRET_KEY'))
+                if len(entity_secret_bytes) != 32:
+                    raise ValueError("Invalid entity secret length. Expected 32 bytes.")
+                public_key = RSA.import_key(os.getenv('CIRCLE_PUBLIC_KEY'))
+                self._secret = entity_secret_bytes
+                self._cipher = PKCS1_OAEP.new(key=public_key, hashAlgo=SHA256)
+
+    def _encrypt(self) -> str:
+        started = time.perf_counter()
+        if self._cipher is None:
+            self._load_key()
+        ciphertext = base64.b64encode(self._cipher.encrypt(self._secret)).decode()
+        metrics.ENTITY_SECRET_SECONDS.labels("pool").observe(time.perf_counter() - started)
+        return ciphertext
+
+    def _refill(self):
+        while not self._stop.is_set():
+            try:
+                ciphertext = self._encrypt()
+            except Exception:
+                logger.exception("Could not pre-compute entity secret ciphertext")
+                self._stop.wait(5)
+                continue
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(ciphertext, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+    def start(self):
+        """Parse the key and start the refill thread; no-op when already running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if not os.getenv('CIRCLE_PUBLIC_KEY') or not os.getenv('CIRCLE_HEX_ENCODED_ENTITY_SECRET_KEY'):
+            logger.warning("Circle entity secret is not configured; ciphertext pool not started")
+            return
+        self._load_key()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refill, name="entity-secret-pool", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def get(self) -> str:
+        try:
+            ciphertext = self._queue.get_nowait()
+        except queue.Empty:
+            metrics.ENTITY_SECRET_POOL_TAKES.labels("miss").inc()
+            return self._encrypt()
+        metrics.ENTITY_SECRET_POOL_TAKES.labels("hit").inc()
+        return ciphertext
+
+
+entity_secret_pool = EntitySecretCiphertextPool(int(os.getenv('ENTITY_SECRET_POOL_SIZE', '64')))
+
+
+def next_entity_secret_ciphertext() -> str:
+    """Take a fresh single-use entity secret ciphertext from the pool."""
+    return entity_secret_pool.get()
+
 MASTER_WALLET_ID = "f89bfdb1-ccf3-517a-8046-12cffeb406de"
 MASTER_WALLET_ADDRESS = "0x11aaa9a23be5bc8388373a35343a4fbc94192599"
 
 
 def pay_to_winner(amount, winner_address):
+    import requests
+
     getcontext().prec = 28  # Set appropriate precision
 
-    logger.info(f"pay_to_winner called with amount: {amount}, winner_address: {winner_address}")
+    logger.info("pay_to_winner called with amount: %s, winner_address: %s", amount, winner_address)
 
     # Retrieve necessary environment variables
     api_token = os.getenv('CIRCLE_API_KEY')
-    logger.debug(f"CIRCLE_API_KEY retrieved: {'Yes' if api_token else 'No'}")
 
     # Construct the request URL and parameters
-    url = 'https://api.circle.com/v1/w3s/transactions'
+    url = f'{CIRCLE_API_BASE_URL}/v1/w3s/transactions'
 
     params = {
         'blockchain': 'ETH-SEPOLIA',
@@ -217,8 +331,7 @@ def pay_to_winner(amount, winner_address):
         'state': 'CONFIRMED'
     }
 
-    logger.debug(f"Request URL: {url}")
-    logger.debug(f"Request params: {params}")
+    logger.debug("Request URL: %s params: %s", url, params)
 
     headers = {
         'Authorization': f'Bearer {api_token}',
@@ -231,37 +344,35 @@ def pay_to_winner(amount, winner_address):
         # Send GET request
         logger.info("Sending GET request to Circle API to retrieve transactions")
         response = requests.get(url, headers=headers, params=params)
-        logger.debug(f"Response status code: {response.status_code}")
         response.raise_for_status()
         data = response.json()
-        logger.debug(f"Response data: {data}")
+        logger.debug("Response data: %s", lazy(json.dumps, data))
 
         data = data.get('data', [])
         transactions = data.get('transactions', [])
-        logger.info(f"Found {len(transactions)} transactions")
+        logger.info("Found %d transactions", len(transactions))
 
         source_address_amounts = {}
         total_contributed_amount = Decimal('0')
 
         for transaction in transactions:
-            logger.debug(f"Processing transaction ID: {transaction.get('id')}")
+            logger.debug("Processing transaction %s", transaction.get('id'),
+                         extra=sampled("pay_to_winner.transaction"))
             if (transaction.get('tokenId') == ETH_SEPOLIA_ADDRESS and
                 transaction.get('state') == 'CONFIRMED' and
                 transaction.get('transactionType') == 'INBOUND'):
 
                 source_address = transaction.get('sourceAddress')
-                logger.debug(f"Transaction source address: {source_address}")
                 amounts = transaction.get('amounts', [])
                 for amt_str in amounts:
                     amt = Decimal(amt_str)
-                    logger.debug(f"Amount in transaction: {amt}")
                     if source_address in source_address_amounts:
                         source_address_amounts[source_address] += amt
                     else:
                         source_address_amounts[source_address] = amt
                     total_contributed_amount += amt
 
-        logger.info(f"Total contributed amount: {total_contributed_amount}")
+        logger.info("Total contributed amount: %s", total_contributed_amount)
 
         if total_contributed_amount == Decimal('0'):
             logger.warning("No contributions found.")
@@ -269,21 +380,19 @@ def pay_to_winner(amount, winner_address):
 
         # Convert amount parameter to Decimal
         total_amount_to_pay = Decimal(amount)
-        logger.info(f"Total amount to pay: {total_amount_to_pay}")
+        logger.info("Total amount to pay: %s", total_amount_to_pay)
 
         # For each sourceAddress, compute amount to pay and call pay_from_master
         for source_address, contributed_amount in source_address_amounts.items():
-            logger.debug(f"Computing payment for source address: {source_address}")
             proportion = contributed_amount / total_contributed_amount
             amount_to_pay = total_amount_to_pay * proportion
             # Round amount_to_pay appropriately, e.g., to 6 decimal places
             amount_to_pay = amount_to_pay.quantize(Decimal('0.000001'))
             # Convert amount_to_pay to string
             amount_to_pay_str = format(amount_to_pay, 'f')
-            logger.info(f"Paying {amount_to_pay_str} to {source_address}")
+            logger.debug("Paying %s to %s", amount_to_pay_str, source_address, extra=sampled("pay_to_winner.payment"))
             # Call pay_from_master(amount_to_pay_str, source_address)
             transfer_result = pay_from_master(amount_to_pay_str, source_address)
-            logger.debug(f"Transfer result: {transfer_result}")
             # Append the payment details to the list
             payments.append({
                 'amount': amount_to_pay_str,
@@ -291,11 +400,12 @@ def pay_to_winner(amount, winner_address):
                 'transfer_result': transfer_result
             })
 
-        logger.info(f"Payments made: {payments}")
+        logger.info("Made %d payments", len(payments))
+        logger.debug("Payments made: %s", lazy(json.dumps, payments))
         return payments  # Return the list of payments
 
     except requests.exceptions.HTTPError as e:
-        logger.error(f"HTTP error occurred: {e.response.text}")
+        logger.error("HTTP error occurred: %s", e.response.text)
         return payments  # Return whatever payments have been processed so far
     except Exception as e:
         logger.exception("An error occurred in pay_to_winner")
@@ -314,17 +424,17 @@ def pay_from_master(amount: str, to_address: str):
 
 
 def create_transfer(from_wallet_id: str, from_token_id: str, amount: str, destination_address: str):
-    print("Creating transfer from wallet ID:", from_wallet_id, "from_token_id:", from_token_id,
-          "to address:", destination_address, "with amount:", amount)
-    entitySecretCipherText = encrypt_entity_secret()
+    import requests
+
+    logger.debug("Creating transfer from wallet ID: %s, token: %s, to address: %s, amount: %s",
+                 from_wallet_id, from_token_id, destination_address, amount, extra=sampled("create_transfer"))
+    entitySecretCipherText = next_entity_secret_ciphertext()
 
     # wallet_id = "f89bfdb1-ccf3-517a-8046-12cffeb406de"
 
     #generate new uuid for idempotency key
     idempotencyKey = uuid.uuid4()
 
-    # print(idempotencyKey)
-
     payload = {
         "idempotencyKey": str(idempotencyKey),
         "entitySecretCipherText": entitySecretCipherText,
@@ -340,17 +450,15 @@ def create_transfer(from_wallet_id: str, from_token_id: str, amount: str, destin
         "Authorization": "Bearer "+os.getenv('CIRCLE_API_KEY')
     }
 
-    url = "https://api.circle.com/v1/w3s/developer/transactions/transfer"
+    url = f"{CIRCLE_API_BASE_URL}/v1/w3s/developer/transactions/transfer"
 
     try:
         response = requests.post(url, json=payload, headers=headers)
-        logger.debug(f"Response status code: {response.status_code}")
-        logger.debug(f"Response text: {response.text}")
         response.raise_for_status()
-        logger.info(f"Transfer successful. Response: {response.text}")
+        logger.debug("Transfer successful. Response: %s", lazy(lambda: response.text))
         return response.json().get('data').get('id')
     except requests.exceptions.HTTPError as e:
-        logger.error(f"HTTP error during transfer: {e.response.text}")
+        logger.error("HTTP error during transfer: %s", e.response.text)
         return None
     except Exception as e:
         logger.exception("An error occurred during create_transfer")
@@ -358,10 +466,12 @@ def create_transfer(from_wallet_id: str, from_token_id: str, amount: str, destin
 
 
 def wallet_balance(wallet_id: str, ref_token_id: str = ETH_SEPOLIA_ADDRESS):
-    print("Getting wallet balance for wallet ID:", wallet_id)
+    import requests
+
+    logger.debug("Getting wallet balance for wallet ID: %s", wallet_id, extra=sampled("wallet_balance"))
     api_key = os.getenv('CIRCLE_API_KEY')
 
-    url = f"https://api.circle.com/v1/w3s/wallets/{wallet_id}/balances"
+    url = f"{CIRCLE_API_BASE_URL}/v1/w3s/wallets/{wallet_id}/balances"
     headers = {
         "Authorization": f"Bearer {api_key}",  # Using the API key for authentication
         "Content-Type": "application/json"  # Ensuring the payload is sent as JSON
@@ -371,7 +481,6 @@ def wallet_balance(wallet_id: str, ref_token_id: str = ETH_SEPOLIA_ADDRESS):
     # Parse the response to get the amount
     try:
         data = response.json()
-        print(data)
         token_balances = data.get("data", {}).get("tokenBalances", [])
 
         for token_balance in token_balances:
@@ -379,11 +488,9 @@ def wallet_balance(wallet_id: str, ref_token_id: str = ETH_SEPOLIA_ADDRESS):
             token_amount = token_balance.get("amount", "0")  # Default to 0 if amount is missing
             token_id = token_balance.get("token", "").get("id", "")  # Default to empty string if token ID is missing
             if token_id == ref_token_id:
-                print(f"Token amount: {token_amount}")
-                print(f"Token ID: {token_id}")
                 return token_amount
-        print("No token balances found.")
+        logger.debug("No %s balance found for wallet %s", ref_token_id, wallet_id)
         return "0"
     except Exception as e:
-        print(f"Error parsing wallet balance: {e}")
+        logger.error("Error parsing wallet balance: %s", e)
         return "0"
@@ -0,0 +1,419 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from decimal import Decimal, getcontext
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+import circle_ratelimit
+import metrics
+import tx_index
+import tx_tracker
+from structured_logging import lazy, sampled
+from circle_bender import (
+    CIRCLE_API_BASE_URL,
+    ETH_SEPOLIA_ADDRESS,
+    MASTER_WALLET_ADDRESS,
+    MASTER_WALLET_ID,
+    next_entity_secret_ciphertext,
+)
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# Wallet and contract used for ENS subdomain registration (see EnsBender.sol)
+ENS_WALLET_ID = 'f89bfdb1-ccf3-517a-8046-12cffeb406de'
+ENS_CONTRACT_ADDRESS = os.getenv('ENS_CONTRACT_ADDRESS', '0x5ad32460313e15a165703bd38a65965f4e7c4d0c')
+# Whether the registrar at ENS_CONTRACT_ADDRESS has registerBatch.  The registrar deployed at the
+# default address predates it; set this only after redeploying EnsBender.sol and pointing
+# ENS_CONTRACT_ADDRESS at the new contract.
+ENS_BATCH_REGISTRATION = os.getenv('ENS_BATCH_REGISTRATION', '').lower() in ('1', 'true', 'yes')
+
+# Largest "count" the wallet creation endpoint accepts
+MAX_WALLETS_PER_REQUEST = 200
+# Largest page the multi-wallet balance listing returns
+BALANCES_PAGE_SIZE = 50
+
+# Connection pool sizing for the shared client
+CIRCLE_MAX_CONNECTIONS = int(os.getenv('CIRCLE_MAX_CONNECTIONS', '20'))
+CIRCLE_TIMEOUT_SECONDS = float(os.getenv('CIRCLE_TIMEOUT_SECONDS', '30'))
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the process-wide Circle client, creating it on first use.
+
+    All calls go through this one client so TCP/TLS connections to Circle are
+    kept alive and reused instead of being opened per request.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=CIRCLE_API_BASE_URL,
+            timeout=CIRCLE_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=CIRCLE_MAX_CONNECTIONS,
+                max_keepalive_connections=CIRCLE_MAX_CONNECTIONS,
+            ),
+        )
+    return _client
+
+
+async def aclose():
+    """Close the shared client; called on application shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _headers():
+    return {
+        "Authorization": f"Bearer {os.getenv('CIRCLE_API_KEY')}",
+        "Content-Type": "application/json",
+        "accept": "application/json"
+    }
+
+
+async def request(endpoint_class: str, method: str, url: str, json: Optional[dict] = None, **kwargs) -> httpx.Response:
+    """Send a Circle request within the budget of ``endpoint_class``.
+
+    Throttled (429), unavailable (5xx) and failed-to-connect attempts are
+    retried with jittered backoff, honouring Retry-After.  POST bodies carry
+    their idempotency key unchanged across attempts, while the single-use
+    entity secret ciphertext is replaced for each retry.  The last response is
+    returned once retries are exhausted so callers keep handling errors via
+    ``raise_for_status``.
+    """
+    budget = circle_ratelimit.budget(endpoint_class)
+    endpoint = metrics.circle_endpoint(url)
+    attempt = 0
+    while True:
+        if attempt and json is not None and "entitySecretCiphertext" in json:
+            json = dict(json, entitySecretCiphertext=next_entity_secret_ciphertext())
+        started = time.perf_counter()
+        try:
+            async with budget.slot():
+                started = time.perf_counter()
+                response = await get_client().request(method, url, headers=_headers(), json=json, **kwargs)
+        except httpx.TransportError as e:
+            metrics.CIRCLE_REQUEST_SECONDS.labels(endpoint, method, "error").observe(time.perf_counter() - started)
+            if attempt >= circle_ratelimit.CIRCLE_MAX_RETRIES:
+                raise
+            delay = circle_ratelimit.retry_delay(attempt)
+            logger.warning(f"Circle {endpoint_class} request failed ({e!r}); retrying in {delay:.2f}s")
+        else:
+            metrics.CIRCLE_REQUEST_SECONDS.labels(endpoint, method, str(response.status_code)).observe(
+                time.perf_counter() - started)
+            if response.status_code == 429:
+                budget.on_throttle()
+            elif response.status_code < 500:
+                budget.on_success()
+            if (response.status_code not in circle_ratelimit.RETRYABLE_STATUS_CODES
+                    or attempt >= circle_ratelimit.CIRCLE_MAX_RETRIES):
+                return response
+            delay = circle_ratelimit.retry_delay(attempt, response.headers.get("retry-after"))
+            logger.warning(f"Circle {endpoint_class} request got {response.status_code}; "
+                           f"retrying in {delay:.2f}s")
+        metrics.CIRCLE_RETRIES.labels(endpoint_class).inc()
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+async def _track(transaction_id: str, kind: str, wallet_id: Optional[str], reference: Optional[str]):
+    """Hand a submitted transaction to tx_tracker without letting a tracking failure hide the submission."""
+    try:
+        await tx_tracker.track(transaction_id, kind, wallet_id, reference)
+    except Exception:
+        # Circle already accepted it; whoever waits on it tracks it again (see registrations._confirm)
+        logger.exception("Could not track submitted transaction %s", transaction_id)
+
+
+def ens_url(name: str) -> str:
+    return f"https://app.ens.domains/{name}.benderbite.eth"
+
+
+async def _submit_ens_execution(signature: str, parameters: list, idempotency_key: Optional[str]) -> str:
+    payload = {
+        "idempotencyKey": idempotency_key or str(uuid.uuid4()),
+        "walletId": ENS_WALLET_ID,
+        "contractAddress": ENS_CONTRACT_ADDRESS,
+        "abiFunctionSignature": signature,
+        "abiParameters": parameters,
+        "feeLevel": "HIGH",
+        "entitySecretCiphertext": next_entity_secret_ciphertext()
+    }
+    response = await request("contract_execution", "POST",
+                             "/v1/w3s/developer/transactions/contractExecution", json=payload)
+    response.raise_for_status()
+    logger.debug("Contract execution response: %s", lazy(lambda: response.text))
+    transaction_id = response.json().get('data', {}).get('id')
+    await _track(transaction_id, "contract_execution", ENS_WALLET_ID, reference="ens")
+    return transaction_id
+
+
+async def submit_ens_registration(name: str, address: str, idempotency_key: Optional[str] = None) -> str:
+    """Send ``register(name, address)`` to the ENS registrar and return the Circle transaction id.
+
+    Raises on failure.  The transaction is only submitted, not confirmed.
+    """
+    return await _submit_ens_execution("register(string,address)", [name, address], idempotency_key)
+
+
+async def submit_ens_batch(names: List[str], addresses: List[str], idempotency_key: Optional[str] = None) -> str:
+    """Register ``names[i]`` for ``addresses[i]`` in one ``registerBatch`` transaction; raises on failure."""
+    return await _submit_ens_execution("registerBatch(string[],address[])", [list(names), list(addresses)],
+                                       idempotency_key)
+
+
+async def call_contract_execution(name, address):
+    try:
+        await submit_ens_registration(name, address)
+        return ens_url(name)
+    except httpx.HTTPStatusError as e:
+        logger.error(f"HTTP error occurred: {e.response.text}")
+    except Exception as e:
+        logger.error(f"An error occurred: {e}")
+
+
+async def get_transaction(transaction_id: str) -> dict:
+    """Current Circle view of one transaction (``state``, ``txHash``, ...); raises on failure."""
+    response = await request("transactions", "GET", f"/v1/w3s/transactions/{transaction_id}")
+    response.raise_for_status()
+    return response.json().get('data', {}).get('transaction', {})
+
+
+async def create_wallet_set(name: str) -> str:
+    """Create a developer wallet set and return its id; raises on failure."""
+    wallet_set_payload = {
+        "idempotencyKey": str(uuid.uuid4()),
+        "name": name,
+        "entitySecretCiphertext": next_entity_secret_ciphertext()
+    }
+    response = await request("wallets", "POST", "/v1/w3s/developer/walletSets", json=wallet_set_payload)
+    response.raise_for_status()
+    return response.json().get('data', {}).get('walletSet', {}).get('id')
+
+
+async def create_wallets(wallet_set_id: str, metadata: List[dict],
+                         idempotency_key: Optional[str] = None) -> List[dict]:
+    """Create one SCA wallet per ``metadata`` entry ({"name", "refId"}) in a single call.
+
+    Returns Circle's wallet objects (with ``id``, ``address`` and ``refId``);
+    raises on failure.  Circle accepts up to ``MAX_WALLETS_PER_REQUEST`` per call.
+    """
+    wallet_payload = {
+        "blockchains": [
+            "ETH-SEPOLIA"
+        ],
+        "metadata": metadata,
+        "count": len(metadata),
+        "entitySecretCiphertext": next_entity_secret_ciphertext(),
+        "idempotencyKey": idempotency_key or str(uuid.uuid4()),
+        "accountType": "SCA",
+        "walletSetId": wallet_set_id
+    }
+    response = await request("wallets", "POST", "/v1/w3s/developer/wallets", json=wallet_payload)
+    response.raise_for_status()
+    logger.debug("Wallets created: %s", lazy(lambda: response.text))
+    return response.json().get('data', {}).get('wallets', [])
+
+
+async def initialize_wallet(project_label, wallet_label, reference_id, wallet_set_id: Optional[str] = None):
+    """Create a wallet for a project, in ``wallet_set_id`` or a new set named ``project_label``."""
+    if not os.getenv('CIRCLE_API_KEY'):
+        logger.error("CIRCLE_API_KEY is not set in the environment variables!")
+        return
+
+    try:
+        if wallet_set_id is None:
+            wallet_set_id = await create_wallet_set(project_label)
+        wallet_data = (await create_wallets(wallet_set_id, [{"name": wallet_label, "refId": reference_id}]))[0]
+        return wallet_data.get('id'), wallet_data.get('address')
+
+    except httpx.HTTPStatusError as e:
+        logger.error(f"HTTP error creating wallet: {e.response.text}")
+    except Exception as e:
+        logger.error(f"Error creating wallet set: {e}")
+
+
+async def create_transfer(from_wallet_id: str, from_token_id: str, amount: str, destination_address: str,
+                          idempotency_key: Optional[str] = None, reference: Optional[str] = None):
+    """Submit a transfer and return its transaction id, or None on failure.
+
+    Pass a stable ``idempotency_key`` when the transfer may be resubmitted
+    (e.g. by a resumed payout job) so Circle executes it at most once.  The
+    transfer is handed to tx_tracker, under ``reference`` when given, which
+    follows it to its final state.
+    """
+    logger.debug("Creating transfer from wallet ID: %s, token: %s, to address: %s, amount: %s",
+                 from_wallet_id, from_token_id, destination_address, amount, extra=sampled("create_transfer"))
+
+    payload = {
+        "idempotencyKey": idempotency_key or str(uuid.uuid4()),
+        "entitySecretCiphertext": next_entity_secret_ciphertext(),
+        "amounts": [amount],
+        "destinationAddress": destination_address,
+        "feeLevel": "HIGH",
+        "tokenId": from_token_id,
+        "walletId": from_wallet_id
+    }
+
+    try:
+        response = await request("transfers", "POST", "/v1/w3s/developer/transactions/transfer", json=payload)
+        response.raise_for_status()
+        logger.debug("Transfer successful. Response: %s", lazy(lambda: response.text),
+                     extra=sampled("create_transfer.response"))
+        transaction_id = response.json().get('data').get('id')
+    except httpx.HTTPStatusError as e:
+        logger.error(f"HTTP error during transfer: {e.response.text}")
+        return None
+    except Exception:
+        logger.exception("An error occurred during create_transfer")
+        return None
+    await _track(transaction_id, "transfer", from_wallet_id, reference)
+    return transaction_id
+
+
+async def pay_to_master(amount: str, from_address: str, idempotency_key: Optional[str] = None,
+                        reference: Optional[str] = None):
+    return await create_transfer(from_address, ETH_SEPOLIA_ADDRESS, amount, MASTER_WALLET_ADDRESS, idempotency_key,
+                                 reference)
+
+
+async def pay_from_master(amount: str, to_address: str, idempotency_key: Optional[str] = None,
+                          reference: Optional[str] = None):
+    return await create_transfer(MASTER_WALLET_ID, ETH_SEPOLIA_ADDRESS, amount, to_address, idempotency_key,
+                                 reference)
+
+
+async def fetch_wallet_balance(wallet_id: str, ref_token_id: str = ETH_SEPOLIA_ADDRESS) -> str:
+    """Like ``wallet_balance`` but raises instead of reporting failures as "0"."""
+    response = await request("balances", "GET", f"/v1/w3s/wallets/{wallet_id}/balances")
+    response.raise_for_status()
+    token_balances = response.json().get("data", {}).get("tokenBalances", [])
+
+    for token_balance in token_balances:
+        token_id = token_balance.get("token", {}).get("id", "")
+        if token_id == ref_token_id:
+            return token_balance.get("amount", "0")
+    logger.debug("No %s balance found for wallet %s", ref_token_id, wallet_id, extra=sampled("wallet_balance.empty"))
+    return "0"
+
+
+def _token_amount(token_balances: list, ref_token_id: str) -> str:
+    for token_balance in token_balances:
+        if token_balance.get("token", {}).get("id", "") == ref_token_id:
+            return token_balance.get("amount", "0")
+    return "0"
+
+
+async def fetch_wallet_balances(wallet_set_id: Optional[str] = None,
+                                ref_token_id: str = ETH_SEPOLIA_ADDRESS,
+                                wallet_ids: Optional[Iterable[str]] = None) -> Dict[str, Decimal]:
+    """Balance in ``ref_token_id`` of every developer wallet, optionally only those in ``wallet_set_id``.
+
+    Pages through ``GET /v1/w3s/developer/wallets/balances`` (BALANCES_PAGE_SIZE
+    wallets per call) instead of one balance call per wallet; wallets without
+    the token map to zero.  With ``wallet_ids`` paging stops as soon as all of
+    them have been seen.  Raises on failure.
+    """
+    wanted = set(wallet_ids) if wallet_ids is not None else None
+    params = {"blockchain": "ETH-SEPOLIA", "pageSize": BALANCES_PAGE_SIZE}
+    if wallet_set_id:
+        params["walletSetId"] = wallet_set_id
+    balances = {}
+    page_after = None
+    while True:
+        page_params = dict(params, pageAfter=page_after) if page_after else params
+        response = await request("balances", "GET", "/v1/w3s/developer/wallets/balances", params=page_params)
+        response.raise_for_status()
+        wallets = response.json().get("data", {}).get("wallets", [])
+        for wallet in wallets:
+            balances[wallet["id"]] = Decimal(_token_amount(wallet.get("tokenBalances", []), ref_token_id))
+            if wanted is not None:
+                wanted.discard(wallet["id"])
+        if len(wallets) < BALANCES_PAGE_SIZE or wanted == set():
+            return balances
+        page_after = wallets[-1]["id"]
+
+
+async def wallet_balance(wallet_id: str, ref_token_id: str = ETH_SEPOLIA_ADDRESS):
+    logger.debug("Getting wallet balance for wallet ID: %s", wallet_id, extra=sampled("wallet_balance"))
+    try:
+        return await fetch_wallet_balance(wallet_id, ref_token_id)
+    except Exception as e:
+        logger.error("Error fetching wallet balance: %s", e)
+        return "0"
+
+
+async def pay_to_winner(amount, winner_address, idempotency_seed: Optional[str] = None,
+                        reference: Optional[str] = None):
+    """Split ``amount`` among the addresses that funded ``winner_address``.
+
+    With an ``idempotency_seed`` (a UUID string) every contributor transfer
+    gets a key derived from the seed and the contributor address, so calling
+    this again for the same payout cannot pay anyone twice.
+    """
+    getcontext().prec = 28  # Set appropriate precision
+
+    logger.info("pay_to_winner called with amount: %s, winner_address: %s", amount, winner_address)
+
+    payments = []  # List to store the payments
+
+    try:
+        # Contributions come from the local inbound-transaction index, which
+        # only fetches the pages added since its last refresh
+        await tx_index.refresh(winner_address)
+        source_address_amounts = await tx_index.contributions(winner_address)
+        total_contributed_amount = sum(source_address_amounts.values(), Decimal('0'))
+
+        logger.info("Total contributed amount: %s", total_contributed_amount)
+
+        if total_contributed_amount == Decimal('0'):
+            logger.warning("No contributions found.")
+            return payments  # Return empty list
+
+        total_amount_to_pay = Decimal(amount)
+
+        # Compute every contributor's share first, then send the transfers concurrently
+        shares = []
+        for source_address, contributed_amount in source_address_amounts.items():
+            proportion = contributed_amount / total_contributed_amount
+            amount_to_pay = (total_amount_to_pay * proportion).quantize(Decimal('0.000001'))
+            shares.append((source_address, format(amount_to_pay, 'f')))
+
+        def key_for(source_address):
+            if idempotency_seed is None:
+                return None
+            return str(uuid.uuid5(uuid.UUID(idempotency_seed), source_address))
+
+        results = await asyncio.gather(
+            *(pay_from_master(amount_to_pay_str, source_address, key_for(source_address), reference)
+              for source_address, amount_to_pay_str in shares)
+        )
+        for (source_address, amount_to_pay_str), transfer_result in zip(shares, results):
+            payments.append({
+                'amount': amount_to_pay_str,
+                'source_address': source_address,
+                'transfer_result': transfer_result
+            })
+
+        logger.info("Made %d payment(s) for %s", len(payments), winner_address)
+        logger.debug("Payments made: %s", lazy(json.dumps, payments))
+        return payments
+
+    except httpx.HTTPStatusError as e:
+        logger.error(f"HTTP error occurred: {e.response.text}")
+        return payments  # Return whatever payments have been processed so far
+    except Exception:
+        logger.exception("An error occurred in pay_to_winner")
+        return payments  # Return whatever payments have been processed so far
@@ -0,0 +1,192 @@
+"""Client-side rate limiting and retry scheduling for outbound Circle traffic.
+
+Each endpoint class (balances, transfers, contract execution, ...) gets its own
+budget: a token bucket bounding requests per second plus an in-flight
+concurrency limit.  Both adapt AIMD-style: a 429 cuts the rate and the
+concurrency multiplicatively, every success grows them back additively up to
+the configured ceiling, so sustained throughput settles just under the
+provider's limit instead of hitting it repeatedly.  All classes also draw from
+a shared account-wide bucket.
+
+Configuration (environment):
+    CIRCLE_RATE_LIMITS     per-class ceilings in requests/second, e.g.
+                           "balances=10,transfers=5" (unlisted classes keep
+                           their defaults)
+    CIRCLE_GLOBAL_RATE     account-wide ceiling in requests/second (default 30)
+    CIRCLE_MAX_RETRIES     retries after a throttled or failed attempt (default 5)
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATES = {
+    "balances": 10.0,
+    "transfers": 5.0,
+    "contract_execution": 5.0,
+    "wallets": 5.0,
+    "transactions": 10.0,
+    "other": 5.0,
+}
+
+CIRCLE_GLOBAL_RATE = float(os.getenv('CIRCLE_GLOBAL_RATE', '30'))
+CIRCLE_MAX_RETRIES = int(os.getenv('CIRCLE_MAX_RETRIES', '5'))
+
+# Exponential backoff bounds for retries without a Retry-After header
+RETRY_BASE_SECONDS = 0.5
+RETRY_MAX_SECONDS = 30.0
+
+# Status codes worth retrying; everything else is returned to the caller
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def _parse_rates(spec: Optional[str]) -> Dict[str, float]:
+    rates = dict(DEFAULT_RATES)
+    for item in (spec or "").split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            rates[name.strip()] = float(value)
+    return rates
+
+
+class TokenBucket:
+    """Token bucket whose refill rate backs off on throttling and recovers on success."""
+
+    def __init__(self, max_rate: float, burst: Optional[float] = None, min_rate: float = 0.5):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate = max_rate
+        self.capacity = burst if burst is not None else max(1.0, max_rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    def on_success(self):
+        # Additive increase: regain the full rate over roughly ten seconds of successes
+        self.rate = min(self.max_rate, self.rate + self.max_rate / (10 * max(self.rate, 1.0)))
+
+    def on_throttle(self):
+        self.rate = max(self.min_rate, self.rate * 0.7)
+        self._tokens = min(self._tokens, 0)
+
+
+class AdaptiveConcurrency:
+    """In-flight request limit with additive increase / multiplicative decrease."""
+
+    def __init__(self, max_limit: int, initial: Optional[int] = None):
+        self.max_limit = max_limit
+        self.limit = float(initial or max_limit)
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def on_success(self):
+        # Waiters re-check the limit whenever a slot is released
+        self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+    def on_throttle(self):
+        self.limit = max(1.0, self.limit / 2)
+
+
+class EndpointBudget:
+    """Rate and concurrency budget of one endpoint class."""
+
+    def __init__(self, name: str, max_rate: float, global_bucket: Optional[TokenBucket] = None):
+        self.name = name
+        self.bucket = TokenBucket(max_rate)
+        self.concurrency = AdaptiveConcurrency(max(1, int(max_rate)))
+        self.global_bucket = global_bucket
+        self.throttled = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self.concurrency.slot():
+            await self.bucket.acquire()
+            if self.global_bucket is not None:
+                await self.global_bucket.acquire()
+            yield
+
+    def on_success(self):
+        self.bucket.on_success()
+        self.concurrency.on_success()
+        if self.global_bucket is not None:
+            self.global_bucket.on_success()
+
+    def on_throttle(self):
+        self.throttled += 1
+        self.bucket.on_throttle()
+        self.concurrency.on_throttle()
+        if self.global_bucket is not None:
+            self.global_bucket.on_throttle()
+        logger.warning(f"Circle throttled '{self.name}': rate now {self.bucket.rate:.2f}/s, "
+                       f"concurrency {int(self.concurrency.limit)}")
+
+
+def retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Seconds to wait before retry number ``attempt`` (0-based).
+
+    A Retry-After header (delta-seconds or HTTP-date) wins, capped at
+    RETRY_MAX_SECONDS; otherwise full jitter over an exponentially growing
+    window.
+    """
+    if retry_after:
+        try:
+            return min(max(0.0, float(retry_after)), RETRY_MAX_SECONDS)
+        except ValueError:
+            try:
+                return min(max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time()),
+                           RETRY_MAX_SECONDS)
+            except (TypeError, ValueError):
+                pass
+    return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt))
+
+
+_budgets: Dict[str, EndpointBudget] = {}
+_global_bucket: Optional[TokenBucket] = None
+_budgets_loop = None
+
+
+def budget(endpoint_class: str) -> EndpointBudget:
+    """Return the shared budget for ``endpoint_class``, creating it on first use."""
+    global _budgets_loop, _global_bucket
+    loop = asyncio.get_running_loop()
+    if _budgets_loop is not loop:
+        # asyncio primitives are bound to their loop; start fresh on a new one
+        _budgets.clear()
+        _global_bucket = TokenBucket(CIRCLE_GLOBAL_RATE)
+        _budgets_loop = loop
+    if endpoint_class not in _budgets:
+        rates = _parse_rates(os.getenv('CIRCLE_RATE_LIMITS'))
+        _budgets[endpoint_class] = EndpointBudget(
+            endpoint_class, rates.get(endpoint_class, rates["other"]), _global_bucket)
+    return _budgets[endpoint_class]
@@ -0,0 +1,140 @@
+# Database setup; SQLite (aiosqlite) by default, any async SQLAlchemy URL via DATABASE_URL
+import os
+import asyncio
+import logging
+
+from sqlalchemy import Column, Integer, String, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, declarative_base
+from sqlalchemy.util import await_only
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Plain sqlite:// and postgresql:// URLs are mapped to their async drivers
+_ASYNC_DRIVERS = {
+    "sqlite://": "sqlite+aiosqlite://",
+    "postgresql://": "postgresql+asyncpg://",
+    "postgres://": "postgresql+asyncpg://",
+}
+
+
+def _async_url(url: str) -> str:
+    for prefix, async_prefix in _ASYNC_DRIVERS.items():
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+    return url
+
+
+DATABASE_URL = _async_url(os.getenv('DATABASE_URL', 'sqlite+aiosqlite:///./projects.db'))
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# WAL lets readers proceed while a write is in progress; the rest trades a
+# little durability on power loss (not on crashes) for far fewer fsyncs
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-32000",
+    "PRAGMA mmap_size=134217728",
+)
+SQLITE_WRITE_LOCK_TIMEOUT = float(os.getenv('SQLITE_WRITE_LOCK_TIMEOUT', '30'))
+
+engine = create_async_engine(DATABASE_URL, pool_size=DB_POOL_SIZE, max_overflow=DB_POOL_SIZE, pool_pre_ping=True)
+
+if IS_SQLITE:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+metrics.instrument_engine(engine.sync_engine)
+
+
+class SQLiteSession(Session):
+    """Session whose write transactions take turns on the process-wide SQLite write lock.
+
+    SQLite has a single writer and ``busy_timeout`` makes the others poll for it
+    instead of queueing, so with dozens of writers in one process some of them
+    starve past the timeout ("database is locked").  Writers of this process
+    queue in order on an asyncio lock instead, taken at a session's first write
+    and released when its transaction ends; ``busy_timeout`` only arbitrates
+    between processes.
+    """
+
+
+_write_lock = None
+_write_lock_loop = None
+
+
+def _loop_write_lock() -> asyncio.Lock:
+    """The write lock of the running event loop (tests run one loop each)."""
+    global _write_lock, _write_lock_loop
+    loop = asyncio.get_running_loop()
+    if _write_lock_loop is not loop:
+        _write_lock, _write_lock_loop = asyncio.Lock(), loop
+    return _write_lock
+
+
+def _acquire_write_lock(session: Session):
+    if "write_lock" in session.info:
+        return
+    if not session.in_transaction():
+        session.begin()  # so that the transaction's end releases the lock
+    lock = _loop_write_lock()
+    try:
+        await_only(asyncio.wait_for(lock.acquire(), SQLITE_WRITE_LOCK_TIMEOUT))
+    except asyncio.TimeoutError:
+        # Never wedge a writer: fall back to SQLite's own busy handling
+        logger.warning("Waited %.0fs for the SQLite write lock, writing without it", SQLITE_WRITE_LOCK_TIMEOUT)
+        return
+    session.info["write_lock"] = lock
+
+
+@event.listens_for(SQLiteSession, "do_orm_execute")
+def _lock_before_statement(orm_execute_state):
+    if not orm_execute_state.is_select:
+        _acquire_write_lock(orm_execute_state.session)
+
+
+@event.listens_for(SQLiteSession, "before_flush")
+def _lock_before_flush(session, flush_context, instances):
+    _acquire_write_lock(session)
+
+
+@event.listens_for(SQLiteSession, "after_transaction_end")
+def _unlock_after_transaction(session, transaction):
+    if transaction.parent is None and "write_lock" in session.info:
+        session.info.pop("write_lock").release()
+
+
+SessionLocal = async_sessionmaker(engine, sync_session_class=SQLiteSession if IS_SQLITE else Session,
+                                  autoflush=False, expire_on_commit=False)
+Base = declarative_base()
+
+
+async def get_db():
+    """FastAPI dependency: one session per request, closed when the response is done."""
+    async with SessionLocal() as db:
+        yield db
+
+
+async def create_tables():
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+
+class Project(Base):
+    __tablename__ = "projects"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True)
+    wallet_id = Column(String)
+    wallet_address = Column(String)
+    ens_address = Column(String)
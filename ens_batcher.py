@@ -0,0 +1,140 @@
+"""Coalesce ENS subdomain registrations into batched contract calls.
+
+Every ENS registration used to be its own ``register(string,address)``
+transaction, i.e. one Circle call and one on-chain transaction per name.
+Registrations submitted within a short window are now collected and sent
+together through the registrar's ``registerBatch(string[],address[])``; a
+lone registration still goes through ``register``.  Each caller awaits its
+own future, which resolves with the Circle transaction id covering its name
+(shared by the batch) or raises its error.
+
+``registerBatch`` only exists in registrars deployed from the current
+EnsBender.sol.  The registrar at the default ENS_CONTRACT_ADDRESS is older, so
+batching stays off until the contract is redeployed, ENS_CONTRACT_ADDRESS
+points at the new deployment and ENS_BATCH_REGISTRATION is set.  Until then
+every collected name is sent as its own ``register`` call.
+
+Labels are checked before they join a batch, so one bad name fails only its
+own caller.  If Circle still rejects a batch, its names are resent one by one
+and every caller gets its own result.
+
+Configuration (environment):
+    ENS_BATCH_WINDOW_MS     how long the first pending registration waits for others (default 50)
+    ENS_BATCH_MAX_SIZE      names per transaction; a full batch is sent immediately (default 50)
+    ENS_CONTRACT_ADDRESS    registrar contract (default: the deployed single-name registrar)
+    ENS_BATCH_REGISTRATION  set to 1 once ENS_CONTRACT_ADDRESS has registerBatch (default off)
+"""
+import os
+import uuid
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+import circle_bender_async
+
+logger = logging.getLogger(__name__)
+
+ENS_BATCH_WINDOW_MS = float(os.getenv('ENS_BATCH_WINDOW_MS', '50'))
+ENS_BATCH_MAX_SIZE = int(os.getenv('ENS_BATCH_MAX_SIZE', '50'))
+
+# Namespace for idempotency keys derived from the callers' keys
+_BATCH_KEY_NAMESPACE = uuid.UUID('8a1f4a3e-52f4-4c8b-9a53-0f6c2d6f9e21')
+# The name wrapper rejects longer labels
+MAX_LABEL_BYTES = 255
+
+
+def validate_label(name: str):
+    """Raise ValueError unless ``name`` can be registered as a benderbite.eth subdomain label."""
+    if not name:
+        raise ValueError("ENS label is empty")
+    if len(name.encode("utf-8")) > MAX_LABEL_BYTES:
+        raise ValueError(f"ENS label {name!r} is longer than {MAX_LABEL_BYTES} bytes")
+    if "." in name or any(character.isspace() for character in name):
+        raise ValueError(f"ENS label {name!r} contains a dot or whitespace")
+    if name != name.lower():
+        # Normalised ENS names are lowercase; a mixed-case label would never resolve
+        raise ValueError(f"ENS label {name!r} is not lowercase")
+
+
+class EnsBatcher:
+    def __init__(self, window_seconds: float = ENS_BATCH_WINDOW_MS / 1000, max_size: int = ENS_BATCH_MAX_SIZE,
+                 batch_enabled: bool = circle_bender_async.ENS_BATCH_REGISTRATION):
+        self.window_seconds = window_seconds
+        self.max_size = max_size
+        self.batch_enabled = batch_enabled
+        self._pending: List[Tuple[str, str, Optional[str], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._inflight = set()
+
+    async def submit(self, name: str, address: str, idempotency_key: Optional[str] = None) -> str:
+        """Queue ``name`` -> ``address`` and wait for the transaction that registers it."""
+        validate_label(name)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((name, address, idempotency_key, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:self.max_size], self._pending[self.max_size:]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.window_seconds, self._flush)
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._send(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    @staticmethod
+    def _batch_key(keys: List[Optional[str]]) -> Optional[str]:
+        # Resubmitting the same keyed registrations together reuses the same key
+        if any(key is None for key in keys):
+            return None
+        return str(uuid.uuid5(_BATCH_KEY_NAMESPACE, "|".join(keys)))
+
+    @staticmethod
+    async def _send_one(name: str, address: str, key: Optional[str], future: asyncio.Future):
+        try:
+            transaction_id = await circle_bender_async.submit_ens_registration(name, address, key)
+        except Exception as e:
+            logger.error(f"ENS registration of {name} failed: {e}")
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(transaction_id)
+
+    async def _send(self, batch):
+        if len(batch) == 1 or not self.batch_enabled:
+            await asyncio.gather(*(self._send_one(*entry) for entry in batch))
+            return
+        names = [name for name, _, _, _ in batch]
+        addresses = [address for _, address, _, _ in batch]
+        keys = [key for _, _, key, _ in batch]
+        try:
+            transaction_id = await circle_bender_async.submit_ens_batch(names, addresses, self._batch_key(keys))
+        except Exception as e:
+            logger.warning(f"ENS batch of {len(batch)} name(s) was rejected ({e}); registering them one by one")
+            await asyncio.gather(*(self._send_one(*entry) for entry in batch))
+            return
+        logger.info(f"Submitted ENS registration of {len(batch)} name(s) in transaction {transaction_id}")
+        for _, _, _, future in batch:
+            if not future.done():
+                future.set_result(transaction_id)
+
+
+batcher = EnsBatcher()
+
+
+async def register(name: str, address: str) -> Optional[str]:
+    """Batched replacement for ``call_contract_execution``: the ENS URL, or None on failure."""
+    try:
+        await batcher.submit(name, address)
+        return circle_bender_async.ens_url(name)
+    except Exception as e:
+        logger.error(f"An error occurred: {e}")
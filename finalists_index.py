@@ -0,0 +1,196 @@
+"""In-process BM25 index over the hackathon finalists corpus in ``input/``.
+
+Each ``*.txt`` file under the input directory is split into one chunk per
+project (a project starts at the line before its ethglobal.com showcase URL),
+and the chunks are indexed with Okapi BM25.  ``context_for`` returns the
+best-matching projects for a question, trimmed to a token budget, so the
+LLM prompt only carries the relevant part of the corpus.  The index notices
+added, removed or modified input files and rebuilds itself on the next query.
+
+Configuration (environment):
+    FINALISTS_INPUT_DIR     directory holding the corpus files (default ./input)
+    FINALISTS_TOP_K         maximum number of projects per prompt (default 5)
+    FINALISTS_TOKEN_BUDGET  approximate token budget of the context (default 3000)
+"""
+import os
+import re
+import math
+import time
+import hashlib
+import logging
+import threading
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FINALISTS_INPUT_DIR = os.getenv('FINALISTS_INPUT_DIR', './input')
+FINALISTS_TOP_K = int(os.getenv('FINALISTS_TOP_K', '5'))
+FINALISTS_TOKEN_BUDGET = int(os.getenv('FINALISTS_TOKEN_BUDGET', '3000'))
+
+# How often (seconds) the input directory is checked for changes
+CHANGE_CHECK_SECONDS = 2.0
+
+# Rough characters-per-token ratio used for budgeting without a tokenizer
+CHARS_PER_TOKEN = 4
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+SHOWCASE_URL_PATTERN = re.compile(r"^https?://(www\.)?ethglobal\.com/showcase/\S+$")
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by did do does for from has have how i in is it me of on or "
+    "so that the their there this to was what when where which who why will with you".split()
+)
+
+
+class ProjectChunk(NamedTuple):
+    source: str   # file name the chunk came from
+    name: str     # project title line
+    text: str
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_projects(text: str) -> List[Tuple[str, str]]:
+    """Split a finalists file into ``(title, block)`` pairs, one per project."""
+    lines = text.splitlines()
+    starts = [i - 1 for i, line in enumerate(lines)
+              if i > 0 and SHOWCASE_URL_PATTERN.match(line.strip())]
+    projects = []
+    for n, start in enumerate(starts):
+        end = starts[n + 1] if n + 1 < len(starts) else len(lines)
+        block = "\n".join(lines[start:end]).strip()
+        if block:
+            projects.append((lines[start].strip(), block))
+    return projects
+
+
+class FinalistsIndex:
+    """BM25 index over project chunks, rebuilt when the input files change."""
+
+    def __init__(self, input_dir: str = FINALISTS_INPUT_DIR):
+        self.input_dir = input_dir
+        self.chunks: List[ProjectChunk] = []
+        self.version = ""
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._term_freqs: List[Counter] = []
+        self._lengths: List[int] = []
+        self._avg_length = 0.0
+        self._idf: Dict[str, float] = {}
+
+    def _input_files(self) -> List[str]:
+        if not os.path.isdir(self.input_dir):
+            return []
+        return sorted(os.path.join(self.input_dir, name) for name in os.listdir(self.input_dir)
+                      if name.endswith(".txt"))
+
+    def _current_signature(self):
+        signature = []
+        for path in self._input_files():
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _build(self, signature):
+        chunks = []
+        digest = hashlib.sha256()
+        for path, _, _ in signature:
+            with open(path, "r", encoding="utf-8") as file:
+                text = file.read()
+            digest.update(text.encode("utf-8"))
+            projects = split_projects(text)
+            if not projects and text.strip():
+                # Not in showcase format: index the whole file as one chunk
+                projects = [(os.path.basename(path), text.strip())]
+            chunks.extend(ProjectChunk(os.path.basename(path), name, block) for name, block in projects)
+
+        term_freqs = [Counter(tokenize(chunk.text)) for chunk in chunks]
+        lengths = [sum(tf.values()) for tf in term_freqs]
+        document_freqs = Counter(term for tf in term_freqs for term in tf)
+        n = len(chunks)
+
+        self.chunks = chunks
+        self._term_freqs = term_freqs
+        self._lengths = lengths
+        self._avg_length = (sum(lengths) / n) if n else 0.0
+        self._idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_freqs.items()}
+        self._signature = signature
+        # Content hash of the corpus, stable across processes and restarts
+        self.version = digest.hexdigest()[:16]
+        logger.info(f"Indexed {n} finalist projects from {len(signature)} file(s)")
+
+    def refresh(self, force: bool = False):
+        """Rebuild the index if the input files changed since the last build."""
+        now = time.monotonic()
+        if not force and now - self._checked_at < CHANGE_CHECK_SECONDS:
+            return
+        with self._lock:
+            self._checked_at = now
+            signature = self._current_signature()
+            if force or signature != self._signature:
+                self._build(signature)
+
+    def search(self, question: str, top_k: int = FINALISTS_TOP_K) -> List[Tuple[float, ProjectChunk]]:
+        """Return up to ``top_k`` ``(score, chunk)`` pairs with a positive BM25 score."""
+        self.refresh()
+        terms = set(tokenize(question)) & self._idf.keys()
+        scored = []
+        for i, tf in enumerate(self._term_freqs):
+            score = 0.0
+            norm = K1 * (1 - B + B * self._lengths[i] / (self._avg_length or 1))
+            for term in terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self._idf[term] * freq * (K1 + 1) / (freq + norm)
+            if score > 0:
+                scored.append((score, i))
+        scored.sort(reverse=True)
+        return [(score, self.chunks[i]) for score, i in scored[:top_k]]
+
+    def context_for(self, question: str, top_k: int = FINALISTS_TOP_K,
+                    token_budget: int = FINALISTS_TOKEN_BUDGET) -> str:
+        """Prompt context with the projects most relevant to ``question``.
+
+        Chunks are added best-first until the token budget is spent.  When no
+        project matches the question lexically, projects are taken in corpus
+        order so broad questions still get some context.
+        """
+        hits = [chunk for _, chunk in self.search(question, top_k)]
+        if not hits:
+            hits = self.chunks[:top_k]
+
+        parts = []
+        remaining = token_budget
+        for chunk in hits:
+            cost = estimate_tokens(chunk.text)
+            if cost > remaining:
+                if not parts:
+                    # Always include at least the best project, truncated to fit
+                    parts.append(chunk.text[:remaining * CHARS_PER_TOKEN])
+                    remaining = 0
+                continue
+            parts.append(chunk.text)
+            remaining -= cost
+        return "\n\n---\n\n".join(parts)
+
+
+_default_index: Optional[FinalistsIndex] = None
+
+
+def get_index() -> FinalistsIndex:
+    """Process-wide index over ``FINALISTS_INPUT_DIR``."""
+    global _default_index
+    if _default_index is None:
+        _default_index = FinalistsIndex()
+    return _default_index
@@ -0,0 +1,76 @@
+# Production serving: several uvicorn worker processes forked from one preloaded app
+#
+#     gunicorn -c gunicorn.conf.py main:app
+#
+# The master imports main once and builds the read-only state (finalists
+# index, database schema) before forking, so workers start in milliseconds and
+# share those pages copy-on-write instead of each building its own copy.
+# Clients, pools and background tasks are created per worker by the app's
+# lifespan; only the worker holding LEADER_LOCK_PATH resumes unfinished jobs.
+# Logging is set up again in each worker after the fork, since the log writer
+# thread does not survive it.  Metrics go to PROMETHEUS_MULTIPROC_DIR so that
+# /metrics reports all workers.
+#
+# Configuration (environment):
+#     WEB_CONCURRENCY           worker processes (default 2 x CPUs + 1, at most 8)
+#     HOST, PORT                listen address (default 0.0.0.0:8282)
+#     PROMETHEUS_MULTIPROC_DIR  per-worker metric files (default <tmp>/benderbite-metrics),
+#                               emptied on every start
+import asyncio
+import gc
+import glob
+import multiprocessing
+import os
+import tempfile
+
+# Must be set before the app (and with it prometheus_client) is preloaded
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'benderbite-metrics'))
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+# Samples of a previous run's processes would be added to this run's
+for stale in glob.glob(os.path.join(os.environ['PROMETHEUS_MULTIPROC_DIR'], '*.db')):
+    os.remove(stale)
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8282')}"
+workers = int(os.getenv('WEB_CONCURRENCY', str(min(2 * multiprocessing.cpu_count() + 1, 8))))
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+# SSE streams and long polls are normal; rely on uvicorn's keep-alive instead
+timeout = 120
+graceful_timeout = 30
+# Logging goes through structured_logging in each worker
+accesslog = None
+
+
+def when_ready(server):
+    """Build shared read-only state in the master, after the app was preloaded."""
+    import main
+    from database import create_tables, engine
+    from structured_logging import configure_logging
+
+    configure_logging()
+
+    main.finalists_index.refresh(force=True)
+
+    async def prepare_database():
+        await create_tables()
+        # No connection may cross the fork
+        await engine.dispose()
+
+    asyncio.run(prepare_database())
+    # Keep the preloaded objects out of the workers' garbage collections, which
+    # would otherwise touch (and so copy) every shared page
+    gc.freeze()
+    server.log.info("Preloaded app state; forking %d worker(s)", workers)
+
+
+def post_fork(server, worker):
+    from structured_logging import configure_logging
+
+    configure_logging()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    # Drop the live gauges of a worker that is gone
+    multiprocess.mark_process_dead(worker.pid)
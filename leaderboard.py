@@ -0,0 +1,276 @@
+"""Materialized project leaderboard refreshed in the background.
+
+The ranking is rebuilt from the project registry and the balance ledger on a
+fixed interval and kept as an immutable, already sorted snapshot.  Requests
+page through the snapshot directly.  Each snapshot carries a content-derived
+ETag that only changes when the ranking itself changes, so clients polling
+with If-None-Match get cheap 304s between refreshes.
+
+Clients can also subscribe to changes.  Every new snapshot records a diff
+against the previous one (entries whose rank or balance changed, entries that
+left), and subscribers are sent the diffs since the version they last saw.
+The background refresh stays the only producer, so the balance reads do not
+grow with the number of viewers.  A subscriber that falls behind holds no
+queue.  When it catches up it is sent the diffs it missed merged into one,
+or a full snapshot if they are no longer in the kept history.  A ledger
+change (``notify_changed``) brings the next rebuild forward.
+
+Versions are counted per process, so with several workers version N of one
+worker is not version N of another.  A reconnecting subscriber therefore
+resumes from its version only if it also presents that version's ETag and the
+ETag matches what this process had at that version; otherwise it starts over
+from a full snapshot.
+
+Configuration (environment):
+    LEADERBOARD_REFRESH_SECONDS  interval between rebuilds (default 15)
+    LEADERBOARD_DIFF_HISTORY     diffs kept for subscribers catching up (default 64)
+    LEADERBOARD_MAX_SUBSCRIBERS  concurrent subscribers per process (default 1000)
+"""
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import deque
+from decimal import Decimal, InvalidOperation
+from typing import AsyncIterator, Dict, List, Optional
+
+import ledger
+from project_registry import registry
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_REFRESH_SECONDS = float(os.getenv('LEADERBOARD_REFRESH_SECONDS', '15'))
+LEADERBOARD_DIFF_HISTORY = int(os.getenv('LEADERBOARD_DIFF_HISTORY', '64'))
+LEADERBOARD_MAX_SUBSCRIBERS = int(os.getenv('LEADERBOARD_MAX_SUBSCRIBERS', '1000'))
+
+# Rebuild this long after a ledger change, so a burst of webhooks costs one rebuild
+CHANGE_DEBOUNCE_SECONDS = 1.0
+# Idle subscribers get a heartbeat this often
+HEARTBEAT_SECONDS = 15.0
+
+
+def _as_decimal(amount) -> Decimal:
+    try:
+        return Decimal(str(amount))
+    except (InvalidOperation, ValueError):
+        return Decimal(0)
+
+
+class LeaderboardSnapshot:
+    """One immutable ranking, sorted by balance descending."""
+
+    def __init__(self, entries: List[dict], version: int):
+        self.entries = entries
+        self.version = version
+        self.generated_at = time.time()
+        digest = hashlib.sha1()
+        for entry in entries:
+            digest.update(f"{entry['name']}\0{entry['balance']}\0{entry['wallet_address']}\n".encode("utf-8"))
+        self.etag = f'"{digest.hexdigest()}"'
+
+    def page(self, offset: int = 0, limit: Optional[int] = None) -> List[dict]:
+        end = None if limit is None else offset + limit
+        return self.entries[offset:end]
+
+    def as_message(self, limit: Optional[int] = None) -> dict:
+        return {"version": self.version, "etag": self.etag, "leaderboard": self.page(0, limit),
+                "total": len(self.entries), "generated_at": self.generated_at}
+
+
+def _diff(old: Optional[LeaderboardSnapshot], new: LeaderboardSnapshot) -> dict:
+    """Entries of ``new`` that differ from ``old`` and names that are no longer ranked."""
+    previous = {entry["name"]: entry for entry in old.entries} if old is not None else {}
+    changed = []
+    for entry in new.entries:
+        before = previous.pop(entry["name"], None)
+        if before is None or (before["rank"], before["balance"], before["wallet_address"]) != \
+                (entry["rank"], entry["balance"], entry["wallet_address"]):
+            changed.append(dict(entry, previous_rank=before["rank"] if before is not None else None))
+    removed = [{"name": name, "previous_rank": entry["rank"]} for name, entry in previous.items()]
+    return {"from_version": old.version if old is not None else 0, "version": new.version, "etag": new.etag,
+            "changed": changed, "removed": removed, "total": len(new.entries)}
+
+
+def _merge(diffs: List[dict]) -> dict:
+    """One diff equivalent to applying ``diffs`` in order."""
+    changed: Dict[str, dict] = {}
+    removed: Dict[str, dict] = {}
+    first_rank: Dict[str, Optional[int]] = {}
+    for diff in diffs:
+        for entry in diff["changed"]:
+            first_rank.setdefault(entry["name"], entry["previous_rank"])
+            removed.pop(entry["name"], None)
+            changed[entry["name"]] = entry
+        for entry in diff["removed"]:
+            first_rank.setdefault(entry["name"], entry["previous_rank"])
+            changed.pop(entry["name"], None)
+            removed[entry["name"]] = entry
+    return {
+        "from_version": diffs[0]["from_version"],
+        "version": diffs[-1]["version"],
+        "etag": diffs[-1]["etag"],
+        "changed": sorted((dict(entry, previous_rank=first_rank[name]) for name, entry in changed.items()),
+                          key=lambda entry: entry["rank"]),
+        # Added and removed again in between: the subscriber never saw it
+        "removed": [{"name": name, "previous_rank": first_rank[name]} for name in removed
+                    if first_rank[name] is not None],
+        "total": diffs[-1]["total"],
+    }
+
+
+def _top(diff: dict, limit: Optional[int]) -> dict:
+    """``diff`` as seen by a subscriber showing only the first ``limit`` ranks."""
+    if limit is None:
+        return diff
+    changed = [entry for entry in diff["changed"] if entry["rank"] <= limit]
+    removed = [entry for entry in diff["removed"] if entry["previous_rank"] <= limit]
+    # Pushed below the shown ranks: gone for this subscriber
+    removed += [{"name": entry["name"], "previous_rank": entry["previous_rank"]} for entry in diff["changed"]
+                if entry["rank"] > limit and entry["previous_rank"] is not None and entry["previous_rank"] <= limit]
+    return dict(diff, changed=changed, removed=removed)
+
+
+def event_id(message: dict) -> str:
+    """SSE event id of a snapshot or diff message: its version and the version's ETag."""
+    etag = message["etag"].strip('"')
+    return f"{message['version']}-{etag}"
+
+
+def parse_event_id(value: str) -> tuple:
+    """``(version, etag)`` from an ``event_id`` value, or ``(None, None)`` if it is not one."""
+    version, _, etag = value.partition("-")
+    if not version.isdigit() or not etag:
+        return None, None
+    return int(version), f'"{etag}"'
+
+
+class Leaderboard:
+    def __init__(self):
+        self.snapshot: Optional[LeaderboardSnapshot] = None
+        self._version = 0
+        self._refresh_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._diffs = deque(maxlen=LEADERBOARD_DIFF_HISTORY)
+        # (version, etag) of the current snapshot and of every version a kept diff starts from
+        self._etags = deque(maxlen=LEADERBOARD_DIFF_HISTORY + 1)
+        self._changed = asyncio.Event()
+        self._wake = asyncio.Event()
+        self.subscribers = 0
+
+    async def refresh(self) -> LeaderboardSnapshot:
+        async with self._refresh_lock:
+            projects = list(registry)
+            balances = await ledger.balances_for(project.wallet_id for project in projects)
+
+            rows = []
+            for project in projects:
+                entry = project.as_dict()
+                entry["balance"] = balances.get(project.wallet_id, "0")
+                rows.append((_as_decimal(entry["balance"]), entry))
+            rows.sort(key=lambda row: (-row[0], row[1]["name"]))
+
+            entries = []
+            for rank, (_, entry) in enumerate(rows, start=1):
+                entry["rank"] = rank
+                entries.append(entry)
+
+            snapshot = LeaderboardSnapshot(entries, self._version + 1)
+            if self.snapshot is None or snapshot.etag != self.snapshot.etag:
+                self._version += 1
+                if self.snapshot is not None:
+                    self._diffs.append(_diff(self.snapshot, snapshot))
+                self.snapshot = snapshot
+                self._etags.append((snapshot.version, snapshot.etag))
+                # Wake every subscriber waiting on the previous version
+                changed, self._changed = self._changed, asyncio.Event()
+                changed.set()
+                logger.debug(f"Leaderboard version {self._version} with {len(entries)} projects")
+            return self.snapshot
+
+    async def current(self) -> LeaderboardSnapshot:
+        """Latest snapshot, building the first one on demand."""
+        if self.snapshot is None:
+            return await self.refresh()
+        return self.snapshot
+
+    def notify_changed(self):
+        """Rebuild soon instead of at the next interval, e.g. after a balance changed."""
+        self._wake.set()
+
+    def _resumable(self, version: Optional[int], etag: Optional[str]) -> Optional[int]:
+        """``version`` if this process ranked it with ``etag``, else None (another worker's version)."""
+        if version is None or etag is None:
+            return None
+        return version if dict(self._etags).get(version) == etag else None
+
+    def _diffs_since(self, version: int) -> Optional[List[dict]]:
+        """Diffs from ``version`` to the current one, or None when they are not all kept."""
+        diffs = [diff for diff in self._diffs if diff["from_version"] >= version]
+        if not diffs or diffs[0]["from_version"] != version:
+            return None
+        return diffs
+
+    async def subscribe(self, since: Optional[int] = None, etag: Optional[str] = None,
+                        limit: Optional[int] = None,
+                        heartbeat: float = HEARTBEAT_SECONDS) -> AsyncIterator[tuple]:
+        """Yield ``(event, message)`` for every change of the first ``limit`` ranks.
+
+        The first message is a ``"snapshot"``, unless ``since`` names a version
+        whose ETag is ``etag`` and whose diffs are still kept; after that come
+        ``"diff"`` messages, or a new ``"snapshot"`` when the subscriber fell
+        too far behind.  ``("heartbeat", None)`` is yielded after ``heartbeat``
+        idle seconds.
+        """
+        self.subscribers += 1
+        try:
+            await self.current()
+            version = self._resumable(since, etag)
+            while True:
+                changed = self._changed
+                snapshot = await self.current()
+                if version == snapshot.version:
+                    try:
+                        await asyncio.wait_for(changed.wait(), heartbeat)
+                    except asyncio.TimeoutError:
+                        yield "heartbeat", None
+                    continue
+                diffs = self._diffs_since(version) if version is not None else None
+                if diffs is None:
+                    yield "snapshot", snapshot.as_message(limit)
+                else:
+                    diff = _top(_merge(diffs), limit)
+                    if diff["changed"] or diff["removed"] or limit is None:
+                        yield "diff", diff
+                version = snapshot.version
+        finally:
+            self.subscribers -= 1
+
+    async def _refresh_forever(self, interval: float):
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Leaderboard refresh failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), interval)
+                await asyncio.sleep(CHANGE_DEBOUNCE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def start(self, interval: float = LEADERBOARD_REFRESH_SECONDS):
+        if interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._refresh_forever(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+ranking = Leaderboard()
@@ -0,0 +1,278 @@
+"""Local per-wallet balance ledger fed by Circle transaction webhooks.
+
+Circle posts a notification for every state change of a transaction touching
+one of our developer-controlled wallets.  Once a transaction settles the
+amount is credited (INBOUND) or debited (OUTBOUND) on the wallet's ledger row,
+so balance reads are a single local query instead of one Circle call per
+project.  A periodic reconciliation sweep overwrites the ledger with live
+balances to repair anything a lost or out-of-order webhook left behind.
+
+Configuration (environment):
+    CIRCLE_WEBHOOK_VERIFY     verify X-Circle-Signature headers (default "1");
+                              set to "0" when replaying payloads locally
+    LEDGER_RECONCILE_SECONDS  interval of the reconciliation sweep (default 300,
+                              0 disables it)
+    LEDGER_BULK_MIN_WALLETS   live reads of at least this many wallets use the
+                              paginated multi-wallet balance listing (default 20)
+"""
+import os
+import time
+import base64
+import asyncio
+import logging
+from decimal import Decimal
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import Column, Float, String, select
+from sqlalchemy.exc import IntegrityError
+
+import bulk_registration
+import circle_bender_async
+from circle_bender import ETH_SEPOLIA_ADDRESS
+from database import IS_SQLITE, Base, SessionLocal
+from project_registry import registry
+from structured_logging import sampled
+
+if IS_SQLITE:
+    from sqlalchemy.dialects.sqlite import insert as upsert
+else:
+    from sqlalchemy.dialects.postgresql import insert as upsert
+
+logger = logging.getLogger(__name__)
+
+CIRCLE_WEBHOOK_VERIFY = os.getenv('CIRCLE_WEBHOOK_VERIFY', '1') != '0'
+LEDGER_RECONCILE_SECONDS = float(os.getenv('LEDGER_RECONCILE_SECONDS', '300'))
+# Upper bound on concurrent balance calls made by a reconciliation sweep
+LEDGER_RECONCILE_CONCURRENCY = int(os.getenv('LEDGER_RECONCILE_CONCURRENCY', '10'))
+# Below this many wallets, one call per wallet is cheaper than listing them all
+LEDGER_BULK_MIN_WALLETS = int(os.getenv('LEDGER_BULK_MIN_WALLETS', '20'))
+
+# Transaction states after which the transferred amount is final
+SETTLED_STATES = {"CONFIRMED", "COMPLETE"}
+# Rows per INSERT ... ON CONFLICT, well under SQLite's bound-parameter limit
+UPSERT_CHUNK_SIZE = 500
+
+
+class WalletBalance(Base):
+    __tablename__ = "wallet_balances"
+
+    wallet_id = Column(String, primary_key=True)
+    token_id = Column(String, primary_key=True)
+    amount = Column(String, nullable=False, default="0")
+    updated_at = Column(Float, nullable=False)
+    source = Column(String)  # "webhook" or "reconcile"
+
+
+class LedgerEvent(Base):
+    """One row per (transaction, direction) already applied to the ledger."""
+    __tablename__ = "ledger_events"
+
+    event_key = Column(String, primary_key=True)
+    notification_id = Column(String)
+    applied_at = Column(Float, nullable=False)
+
+
+_public_keys: Dict[str, object] = {}
+
+
+async def _circle_public_key(key_id: str):
+    key = _public_keys.get(key_id)
+    if key is None:
+        response = await circle_bender_async.request("other", "GET", f"/v2/notifications/publicKey/{key_id}")
+        response.raise_for_status()
+        der = base64.b64decode(response.json()["data"]["publicKey"])
+        from Crypto.PublicKey import ECC  # only needed once webhooks arrive
+        key = _public_keys[key_id] = ECC.import_key(der)
+    return key
+
+
+async def verify_signature(headers, body: bytes) -> bool:
+    """Check the ECDSA signature Circle attaches to each notification."""
+    if not CIRCLE_WEBHOOK_VERIFY:
+        return True
+    signature = headers.get('x-circle-signature')
+    key_id = headers.get('x-circle-key-id')
+    if not signature or not key_id:
+        return False
+    try:
+        key = await _circle_public_key(key_id)
+        from Crypto.Hash import SHA256
+        from Crypto.Signature import DSS
+        DSS.new(key, 'fips-186-3', encoding='der').verify(SHA256.new(body), base64.b64decode(signature))
+        return True
+    except (ValueError, TypeError):
+        return False
+    except Exception:
+        logger.exception("Could not verify Circle notification signature")
+        return False
+
+
+def _event_key(transaction: dict) -> str:
+    return f"{transaction.get('id')}:{transaction.get('transactionType')}"
+
+
+async def apply_notification(db, payload: dict) -> bool:
+    """Apply one Circle notification to the ledger.
+
+    Returns True when the ledger changed.  Non-transaction notifications,
+    transactions that have not settled yet and transactions that were already
+    applied are ignored, so Circle's at-least-once delivery is safe to replay.
+    """
+    if not str(payload.get('notificationType', '')).startswith('transactions.'):
+        return False
+    transaction = payload.get('notification') or {}
+    wallet_id = transaction.get('walletId')
+    if not wallet_id or transaction.get('state') not in SETTLED_STATES:
+        return False
+
+    transaction_type = transaction.get('transactionType')
+    if transaction_type == 'INBOUND':
+        sign = Decimal(1)
+    elif transaction_type == 'OUTBOUND':
+        sign = Decimal(-1)
+    else:
+        return False
+    delta = sign * sum((Decimal(a) for a in transaction.get('amounts', [])), Decimal(0))
+    token_id = transaction.get('tokenId') or ETH_SEPOLIA_ADDRESS
+
+    try:
+        db.add(LedgerEvent(event_key=_event_key(transaction),
+                           notification_id=payload.get('notificationId'),
+                           applied_at=time.time()))
+        await db.flush()
+    except IntegrityError:
+        await db.rollback()
+        logger.debug("Notification for transaction %s already applied", transaction.get('id'),
+                     extra=sampled("ledger.duplicate"))
+        return False
+
+    # Create the row without racing another writer, then lock and update it
+    await db.execute(upsert(WalletBalance)
+                     .values(wallet_id=wallet_id, token_id=token_id, amount="0", updated_at=0.0)
+                     .on_conflict_do_nothing(index_elements=[WalletBalance.wallet_id, WalletBalance.token_id]))
+    row = await db.scalar(select(WalletBalance)
+                          .where(WalletBalance.wallet_id == wallet_id, WalletBalance.token_id == token_id)
+                          .with_for_update())
+    row.amount = format(Decimal(row.amount or "0") + delta, 'f')
+    row.updated_at = time.time()
+    row.source = "webhook"
+    await db.commit()
+    logger.info("Ledger %s %s on wallet %s", transaction_type, delta, wallet_id)
+    return True
+
+
+async def set_balances(db, balances: Dict[str, str], observed_at: float, token_id: str = ETH_SEPOLIA_ADDRESS):
+    """Overwrite wallet balances with values read from Circle at ``observed_at``.
+
+    A row that a webhook updated after the read started is left alone, as the
+    webhook already reflects a newer state than the live read.  Each chunk is
+    one INSERT ... ON CONFLICT, so concurrent writers of the same new wallet
+    cannot collide on its key.  The caller commits.
+    """
+    items = list(balances.items())
+    for start in range(0, len(items), UPSERT_CHUNK_SIZE):
+        statement = upsert(WalletBalance).values([
+            {"wallet_id": wallet_id, "token_id": token_id, "amount": amount, "updated_at": observed_at,
+             "source": "reconcile"}
+            for wallet_id, amount in items[start:start + UPSERT_CHUNK_SIZE]])
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=[WalletBalance.wallet_id, WalletBalance.token_id],
+            set_={"amount": statement.excluded.amount, "updated_at": statement.excluded.updated_at,
+                  "source": statement.excluded.source},
+            where=WalletBalance.updated_at <= statement.excluded.updated_at))
+
+
+async def get_balances(db, wallet_ids: Iterable[str], token_id: str = ETH_SEPOLIA_ADDRESS) -> Dict[str, str]:
+    """Return ledger balances for the given wallets; unknown wallets are omitted."""
+    wallet_ids = list(wallet_ids)
+    if not wallet_ids:
+        return {}
+    rows = await db.execute(select(WalletBalance.wallet_id, WalletBalance.amount)
+                            .where(WalletBalance.token_id == token_id, WalletBalance.wallet_id.in_(wallet_ids)))
+    return {wallet_id: amount for wallet_id, amount in rows}
+
+
+async def _fetch_live(wallet_ids, token_id: str = ETH_SEPOLIA_ADDRESS) -> Dict[str, str]:
+    semaphore = asyncio.Semaphore(LEDGER_RECONCILE_CONCURRENCY)
+
+    async def fetch(wallet_id):
+        async with semaphore:
+            return await circle_bender_async.fetch_wallet_balance(wallet_id, token_id)
+
+    wallet_ids = list(wallet_ids)
+    observed_at = time.time()
+    balances = {}
+    if len(wallet_ids) >= LEDGER_BULK_MIN_WALLETS:
+        try:
+            # Project wallets all live in the shared set; anything outside it is read individually below
+            listed = await circle_bender_async.fetch_wallet_balances(
+                wallet_set_id=await bulk_registration.shared_wallet_set_id(), ref_token_id=token_id,
+                wallet_ids=wallet_ids)
+            balances = {wallet_id: format(listed[wallet_id], 'f') for wallet_id in wallet_ids if wallet_id in listed}
+        except Exception as e:
+            logger.warning("Bulk balance listing failed, reading wallets one by one: %r", e)
+
+    # Wallets the listing did not cover (or a short list of wallets) are read individually
+    remaining = [wallet_id for wallet_id in wallet_ids if wallet_id not in balances]
+    amounts = await asyncio.gather(*(fetch(wallet_id) for wallet_id in remaining), return_exceptions=True)
+    for wallet_id, amount in zip(remaining, amounts):
+        if isinstance(amount, Exception):
+            # Keep whatever the ledger has rather than recording a bogus zero
+            logger.error(f"Could not fetch balance of wallet {wallet_id}: {amount}")
+        else:
+            balances[wallet_id] = amount
+
+    async with SessionLocal() as db:
+        await set_balances(db, balances, observed_at, token_id)
+        await db.commit()
+    return balances
+
+
+async def balances_for(wallet_ids: Iterable[str], token_id: str = ETH_SEPOLIA_ADDRESS) -> Dict[str, str]:
+    """Balances for the given wallets, read from the ledger.
+
+    Wallets the ledger has never seen (e.g. registered before the webhook
+    subscription existed) are fetched live once and seeded into the ledger.
+    """
+    wallet_ids = [wallet_id for wallet_id in wallet_ids if wallet_id]
+    async with SessionLocal() as db:
+        balances = await get_balances(db, wallet_ids, token_id)
+    missing = [wallet_id for wallet_id in wallet_ids if wallet_id not in balances]
+    if missing:
+        balances.update(await _fetch_live(missing, token_id))
+    return balances
+
+
+async def reconcile_once():
+    wallet_ids = [project.wallet_id for project in registry if project.wallet_id]
+    await _fetch_live(wallet_ids)
+    logger.info(f"Ledger reconciled {len(wallet_ids)} wallets")
+
+
+async def reconcile_forever(interval: float = LEDGER_RECONCILE_SECONDS):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await reconcile_once()
+        except Exception:
+            logger.exception("Ledger reconciliation sweep failed")
+
+
+_reconcile_task: Optional[asyncio.Task] = None
+
+
+def start():
+    global _reconcile_task
+    if LEDGER_RECONCILE_SECONDS > 0 and _reconcile_task is None:
+        _reconcile_task = asyncio.get_running_loop().create_task(reconcile_forever())
+
+
+async def stop():
+    global _reconcile_task
+    if _reconcile_task is not None:
+        _reconcile_task.cancel()
+        try:
+            await _reconcile_task
+        except asyncio.CancelledError:
+            pass
+        _reconcile_task = None
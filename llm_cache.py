@@ -0,0 +1,170 @@
+"""Persistent cache of LLM answers with request coalescing.
+
+Answers are keyed on the endpoint, the normalized question and a version hash
+of the context corpus, so editing the corpus naturally invalidates context
+answers.  Lookups go to an in-memory LRU first and then to the
+``llm_answers`` table, which survives restarts.  Entries expire after a TTL and
+the table is trimmed to a maximum size, dropping least recently used rows.
+Concurrent identical questions share a single upstream call.
+
+Configuration (environment):
+    LLM_CACHE_TTL_SECONDS    answer lifetime (default 86400)
+    LLM_CACHE_MAX_ENTRIES    rows kept in the table (default 10000)
+    LLM_CACHE_MEMORY_SIZE    entries kept in the in-memory LRU (default 1000)
+"""
+import os
+import re
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import Column, Float, String, Text, delete, func, select
+
+from database import Base, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_TTL_SECONDS = float(os.getenv('LLM_CACHE_TTL_SECONDS', '86400'))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '10000'))
+LLM_CACHE_MEMORY_SIZE = int(os.getenv('LLM_CACHE_MEMORY_SIZE', '1000'))
+
+# Trim the table back to LLM_CACHE_MAX_ENTRIES after this many inserts
+TRIM_EVERY_INSERTS = 100
+
+
+class LLMAnswer(Base):
+    __tablename__ = "llm_answers"
+
+    cache_key = Column(String, primary_key=True)
+    endpoint = Column(String, nullable=False)
+    question = Column(Text, nullable=False)
+    answer = Column(Text, nullable=False)
+    created_at = Column(Float, nullable=False)
+    last_used_at = Column(Float, nullable=False, index=True)
+
+
+def normalize_question(question: str) -> str:
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip("?!. ")
+
+
+def cache_key(endpoint: str, question: str, corpus_version: str = "") -> str:
+    raw = "\0".join((endpoint, normalize_question(question), corpus_version))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMAnswerCache:
+    def __init__(self, ttl: float = LLM_CACHE_TTL_SECONDS, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 memory_size: int = LLM_CACHE_MEMORY_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._inserts = 0
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    def _remember(self, key: str, answer: str, created_at: float):
+        self._memory[key] = (answer, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    async def lookup(self, key: str) -> Optional[str]:
+        """Return a fresh cached answer for ``key`` or None."""
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            answer, created_at = entry
+            if now - created_at < self.ttl:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return answer
+            del self._memory[key]
+
+        async with SessionLocal() as db:
+            row = await db.get(LLMAnswer, key)
+            if row is None:
+                return None
+            if now - row.created_at >= self.ttl:
+                await db.delete(row)
+                await db.commit()
+                self.stats["evictions"] += 1
+                return None
+            row.last_used_at = now
+            await db.commit()
+            self._remember(key, row.answer, row.created_at)
+            self.stats["db_hits"] += 1
+            return row.answer
+
+    async def store(self, key: str, endpoint: str, question: str, answer: str):
+        now = time.time()
+        self._remember(key, answer, now)
+        async with SessionLocal() as db:
+            await db.merge(LLMAnswer(cache_key=key, endpoint=endpoint, question=question, answer=answer,
+                                     created_at=now, last_used_at=now))
+            await db.commit()
+            self._inserts += 1
+            if self._inserts % TRIM_EVERY_INSERTS == 0:
+                await self._trim(db, now)
+
+    async def _trim(self, db, now: float):
+        expired = (await db.execute(delete(LLMAnswer).where(LLMAnswer.created_at <= now - self.ttl))).rowcount
+        overflow = await db.scalar(select(func.count()).select_from(LLMAnswer)) - self.max_entries
+        if overflow > 0:
+            oldest = (select(LLMAnswer.cache_key)
+                      .order_by(LLMAnswer.last_used_at)
+                      .limit(overflow)
+                      .scalar_subquery())
+            overflow = (await db.execute(delete(LLMAnswer).where(LLMAnswer.cache_key.in_(oldest)))).rowcount
+        await db.commit()
+        self.stats["evictions"] += expired + max(overflow, 0)
+
+    async def get_or_compute(self, endpoint: str, question: str, corpus_version: str,
+                             compute: Callable[[], Awaitable[str]]) -> str:
+        """Return the cached answer or compute it, sharing one call among concurrent askers."""
+        key = cache_key(endpoint, question, corpus_version)
+        answer = await self.lookup(key)
+        if answer is not None:
+            return answer
+
+        task = self._in_flight.get(key)
+        if task is None:
+            self.stats["misses"] += 1
+            # The upstream call runs as its own task, so it survives any one
+            # asker going away and every coalesced asker still gets the answer
+            task = asyncio.ensure_future(self._compute_and_store(key, endpoint, question, compute))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def count_streamed_miss(self, joined: bool):
+        """Count a streamed answer's lookup miss, like get_or_compute does for the others.
+
+        ``joined`` when it shares the stream of an identical question already being answered.
+        """
+        self.stats["coalesced" if joined else "misses"] += 1
+
+    async def _compute_and_store(self, key, endpoint, question, compute):
+        answer = await compute()
+        await self.store(key, endpoint, question, answer)
+        return answer
+
+    def _finish(self, key: str, task: asyncio.Future):
+        self._in_flight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Uncached LLM call failed: {task.exception()!r}")
+
+    def snapshot(self) -> dict:
+        hits = self.stats["memory_hits"] + self.stats["db_hits"]
+        lookups = hits + self.stats["misses"]
+        return dict(self.stats, hits=hits, hit_ratio=(hits / lookups) if lookups else 0.0,
+                    memory_entries=len(self._memory), in_flight=len(self._in_flight))
+
+
+answer_cache = LLMAnswerCache()
@@ -0,0 +1,127 @@
+"""Admission control and ordering for chat completion calls.
+
+At most LLM_CONCURRENCY completions run at once per process; further calls
+wait in a queue.  The queue is ordered by arrival time, but short questions
+are treated as if they arrived LLM_SHORT_QUESTION_BOOST seconds earlier.
+That lets quick answers overtake long prompts without starving them.  A call
+arriving at a full queue (LLM_MAX_QUEUE), or waiting longer than
+LLM_QUEUE_TIMEOUT_SECONDS for a slot, is rejected with ``SchedulerBusy``
+straight away, which the API reports as 503.  A completion that runs longer
+than LLM_TIMEOUT_SECONDS is abandoned with ``asyncio.TimeoutError``.
+
+Configuration (environment):
+    LLM_CONCURRENCY            completions in flight (default 8)
+    LLM_MAX_QUEUE              calls waiting for a slot before new ones are rejected (default 32)
+    LLM_QUEUE_TIMEOUT_SECONDS  longest wait for a slot (default 10)
+    LLM_TIMEOUT_SECONDS        longest completion, or gap between streamed chunks (default 60)
+    LLM_SHORT_QUESTION_CHARS   questions up to this length count as short (default 200)
+    LLM_SHORT_QUESTION_BOOST   head start of short questions in seconds (default 5)
+"""
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, TypeVar
+
+import metrics
+
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '8'))
+LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', '32'))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv('LLM_QUEUE_TIMEOUT_SECONDS', '10'))
+LLM_TIMEOUT_SECONDS = float(os.getenv('LLM_TIMEOUT_SECONDS', '60'))
+LLM_SHORT_QUESTION_CHARS = int(os.getenv('LLM_SHORT_QUESTION_CHARS', '200'))
+LLM_SHORT_QUESTION_BOOST = float(os.getenv('LLM_SHORT_QUESTION_BOOST', '5'))
+
+T = TypeVar("T")
+
+
+class SchedulerBusy(Exception):
+    """No completion slot is available within the queue limits."""
+
+
+class LLMScheduler:
+    def __init__(self, concurrency: int = LLM_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT_SECONDS, timeout: float = LLM_TIMEOUT_SECONDS):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.in_flight = 0
+        self.rejected = 0
+        self._waiting = []  # heap of (order key, arrival number, future)
+        self._arrivals = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return sum(not future.done() for _, _, future in self._waiting)
+
+    def check(self):
+        """Raise SchedulerBusy when a call arriving now would be rejected."""
+        if self.in_flight >= self.concurrency and self.queued >= self.max_queue:
+            self.rejected += 1
+            metrics.LLM_REJECTED.labels("queue_full").inc()
+            raise SchedulerBusy("Too many questions in flight; try again shortly")
+
+    def _order_key(self, question: str) -> float:
+        boost = LLM_SHORT_QUESTION_BOOST if len(question) <= LLM_SHORT_QUESTION_CHARS else 0.0
+        return time.monotonic() - boost
+
+    def _release(self):
+        # Hand the slot straight to the next waiter, so a newcomer cannot take it first
+        while self._waiting:
+            _, _, future = heapq.heappop(self._waiting)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _update_gauges(self):
+        metrics.LLM_IN_FLIGHT.set(self.in_flight)
+        metrics.LLM_QUEUED.set(self.queued)
+
+    @asynccontextmanager
+    async def slot(self, question: str):
+        """Hold one of the completion slots, queueing by ``question`` priority."""
+        self.check()
+        started = time.perf_counter()
+        if self.in_flight < self.concurrency and not self.queued:
+            self.in_flight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiting, (self._order_key(question), next(self._arrivals), future))
+            self._update_gauges()
+            try:
+                await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just as we gave up: pass it on
+                    self._release()
+                else:
+                    future.cancel()
+                self._update_gauges()
+                if isinstance(e, asyncio.TimeoutError):
+                    self.rejected += 1
+                    metrics.LLM_REJECTED.labels("queue_timeout").inc()
+                    raise SchedulerBusy("Timed out waiting for a completion slot") from None
+                raise
+        metrics.LLM_QUEUE_SECONDS.observe(time.perf_counter() - started)
+        self._update_gauges()
+        try:
+            yield
+        finally:
+            self._release()
+            self._update_gauges()
+
+    async def run(self, question: str, call: Callable[[], Awaitable[T]]) -> T:
+        """Await ``call()`` within a slot, abandoning it after the completion timeout."""
+        async with self.slot(question):
+            return await asyncio.wait_for(call(), self.timeout)
+
+    def snapshot(self) -> dict:
+        return {"in_flight": self.in_flight, "queued": self.queued, "concurrency": self.concurrency,
+                "max_queue": self.max_queue, "rejected": self.rejected}
+
+
+scheduler = LLMScheduler()
@@ -0,0 +1,167 @@
+"""Relay chat completion tokens to HTTP clients as Server-Sent Events.
+
+Events sent on the stream:
+    data: {"delta": "..."}          one per content fragment from the model (what a
+                                    client joining late missed comes as one)
+    event: done / data: {}          after the last fragment
+    event: error / data: {"error"}  if the upstream call fails mid-stream
+
+Concurrent identical questions share one upstream stream, the streaming
+counterpart of llm_cache's coalescing: the first asker starts the completion
+and later ones join it, replaying the fragments they missed.  When every
+client has disconnected the upstream OpenAI stream is closed, so generation
+stops instead of running to completion for nobody.  A scheduler ``slot`` is
+held from before the upstream call until the stream ends.
+"""
+import json
+import time
+import asyncio
+import logging
+from contextlib import nullcontext
+from typing import AsyncContextManager, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # keep reverse proxies from buffering the stream
+}
+
+
+def sse_event(data: dict, event: str = None) -> str:
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+class SharedCompletion:
+    """One streamed chat completion relayed to every client asking the same question.
+
+    The upstream stream runs as its own task and keeps the fragments it has
+    received, so a client joining late is first sent everything so far.  It
+    is closed once the last listening client has disconnected.
+    """
+
+    def __init__(self, async_client, messages, model: str = "gpt-4o",
+                 on_complete: Optional[Callable[[str], Awaitable[None]]] = None,
+                 slot: Optional[AsyncContextManager] = None, timeout: Optional[float] = None):
+        self.parts: List[str] = []
+        self.done = False
+        self.error: Optional[str] = None
+        self.listeners = 0
+        self.aborted = False
+        self._changed = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run(async_client, messages, model, on_complete, slot, timeout))
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _run(self, async_client, messages, model, on_complete, slot, timeout):
+        stream = None
+        started = time.perf_counter()
+        outcome = "disconnected"
+        options = {"timeout": timeout} if timeout is not None else {}
+        try:
+            async with slot or nullcontext():
+                stream = await async_client.chat.completions.create(model=model, messages=messages, stream=True,
+                                                                    stream_options={"include_usage": True}, **options)
+                async for chunk in stream:
+                    # The final chunk carries token usage and no choices
+                    metrics.record_openai_usage(model, getattr(chunk, "usage", None))
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        self.parts.append(delta)
+                        self._notify()
+            outcome = "ok"
+            if on_complete is not None:
+                await on_complete("".join(self.parts))
+        except asyncio.CancelledError:
+            # A client joining right as it is aborted must not take the partial answer for a whole one
+            self.error = "The answer was abandoned: every client disconnected"
+            raise
+        except Exception as e:
+            outcome = "error"
+            logger.exception("Completion stream failed")
+            self.error = str(e)
+        finally:
+            self.done = True
+            self._notify()
+            metrics.OPENAI_REQUEST_SECONDS.labels(model, "stream", outcome).observe(time.perf_counter() - started)
+            if stream is not None:
+                await stream.close()
+
+    async def listen(self, request: Request) -> AsyncIterator[str]:
+        """Yield SSE-formatted chunks of the completion for one client."""
+        self.listeners += 1
+        sent = 0
+        try:
+            while True:
+                changed = self._changed
+                if sent < len(self.parts):
+                    yield sse_event({"delta": "".join(self.parts[sent:])})
+                    sent = len(self.parts)
+                    continue
+                if self.done:
+                    if self.error is not None:
+                        yield sse_event({"error": self.error}, event="error")
+                    else:
+                        yield sse_event({}, event="done")
+                    return
+                if await request.is_disconnected():
+                    return
+                await changed.wait()
+        finally:
+            self.listeners -= 1
+            if not self.listeners and not self.done:
+                logger.info("Every client disconnected; aborting completion stream")
+                self.aborted = True
+                self._task.cancel()
+
+
+_completions: Dict[str, SharedCompletion] = {}
+
+
+def shared_completion(key: str) -> Optional[SharedCompletion]:
+    """The completion already streaming the answer for ``key``, if any (aborted ones are not joined)."""
+    completion = _completions.get(key)
+    return completion if completion is not None and not completion.aborted else None
+
+
+def start_completion(key: str, async_client, messages, model: str = "gpt-4o",
+                     on_complete: Optional[Callable[[str], Awaitable[None]]] = None,
+                     slot: Optional[AsyncContextManager] = None, timeout: Optional[float] = None) -> SharedCompletion:
+    """Start streaming a completion that later askers of ``key`` can join.
+
+    ``on_complete`` is awaited with the full answer once the stream finished normally.
+    ``timeout`` bounds the wait for the response and for each following chunk.
+    """
+    completion = SharedCompletion(async_client, messages, model, on_complete, slot, timeout)
+    _completions[key] = completion
+
+    def forget(_):
+        # An aborted completion may already have been replaced by a new one for the same question
+        if _completions.get(key) is completion:
+            del _completions[key]
+    completion._task.add_done_callback(forget)
+    return completion
+
+
+async def stream_text(answer: str):
+    """Yield an already known answer in the same event format as a live stream."""
+    yield sse_event({"delta": answer})
+    yield sse_event({}, event="done")
+
+
+def streaming_response(request: Request, completion: SharedCompletion) -> StreamingResponse:
+    return StreamingResponse(completion.listen(request), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+def text_streaming_response(answer: str) -> StreamingResponse:
+    return StreamingResponse(stream_text(answer), media_type="text/event-stream", headers=SSE_HEADERS)
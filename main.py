@@ -1,33 +1,125 @@
-from typing import List
+from typing import List, Optional
 
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI
 from fastapi import HTTPException
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends
+from fastapi import FastAPI, Form, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST
 import uvicorn
-# Assuming you're using OpenAI's library
-import openai
+import json
+import asyncio
 import logging
 import os
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from pydantic import BaseModel
-from openai import OpenAI
 
 # Additional imports for database functionality
-from sqlalchemy import create_engine, Column, Integer, String
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import Project, create_tables, get_db
 
 # Import your circle_bender module
 import circle_bender
+import circle_bender_async
+import bulk_registration
+import ens_batcher
+import ledger
+import metrics
+import payout_jobs
+import project_catalog
+import registrations
+import tx_tracker
+from leaderboard import LEADERBOARD_MAX_SUBSCRIBERS, event_id, parse_event_id, ranking
+from finalists_index import get_index
+from project_registry import registry
+from structured_logging import configure_logging
+from llm_cache import answer_cache, cache_key
+from llm_scheduler import SchedulerBusy, scheduler
+from llm_streaming import (SSE_HEADERS, shared_completion, sse_event, start_completion, streaming_response,
+                           text_streaming_response)
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-openai.api_key = OPENAI_API_KEY
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Lock file whose holder runs the once-per-deployment background work
+LEADER_LOCK_PATH = os.getenv('LEADER_LOCK_PATH', './.leader.lock')
+
+
+@lru_cache(maxsize=None)
+def openai_client():
+    """Async client so completions never block the event loop; OPENAI_BASE_URL points it
+    at a compatible server (e.g. bench/fake_openai.py).
+
+    Built on first use: the openai package is the most expensive import of the
+    app, and with a preloaded multi-worker server each worker needs its own
+    connection pool anyway.
+    """
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=os.getenv('OPENAI_BASE_URL') or None)
 
-app = FastAPI()
+
+def _acquire_leader_lock():
+    """Return an open lock file if this process is the leader, else None.
+
+    With several worker processes only one of them resumes unfinished payout
+    jobs and registrations and runs the ledger reconciliation; the others just
+    serve requests.  A single process is always the leader.
+    """
+    try:
+        import fcntl
+    except ImportError:  # no flock (Windows): single-process deployments only
+        return open(os.devnull)
+    lock_file = open(LEADER_LOCK_PATH, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Here rather than at import: with a preloading server the app is imported
+    # before the fork, and each worker needs its own log writer thread
+    configure_logging()
+    await create_tables()
+    await registry.load()
+    registry.start()
+    # Builds the index unless a preloading server already did so before forking
+    finalists_index.refresh()
+    circle_bender.entity_secret_pool.start()
+    leader_lock = _acquire_leader_lock()
+    if leader_lock is not None:
+        ledger.start()
+    ranking.start()
+    tx_tracker.start()
+    if leader_lock is not None:
+        await project_catalog.catalog.refresh(force=True)
+        await payout_jobs.resume_unfinished()
+    await registrations.start(resume=leader_lock is not None)
+    try:
+        yield
+    finally:
+        await registrations.stop()
+        await payout_jobs.stop()
+        await tx_tracker.stop()
+        await ranking.stop()
+        await ledger.stop()
+        await registry.stop()
+        await circle_bender_async.aclose()
+        circle_bender.entity_secret_pool.stop()
+        if leader_lock is not None:
+            leader_lock.close()
+
+
+app = FastAPI(lifespan=lifespan)
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -36,270 +128,374 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.PrometheusMiddleware)
+
+# Lexical index over the finalists corpus; only the top-k projects go into prompts
+finalists_index = get_index()
+
+
+def bender_messages(question: str):
+    prompt = f"Question: {question}"
+    return [
+        {"role": "system", "content": "You are an assistant named Bender. Your role is to help hackers "
+                                      "win hackathons and answer questions about hackathons. "
+                                      "Answer in the style of Bender from a cartoon."
+                                      "Be useful, balance between funny part that you are a Bender,"
+                                      "but the main goal to be usefully hackathon assistant."
+                                      "Show links to the projects that you will mention"
+         },
+        {"role": "user", "content": prompt}
+    ]
+
+
+def bender_context_messages(question: str):
+    prompt = f"Question: {question}"
+    finalists_content = finalists_index.context_for(question)
+    return [
+        {"role": "system", "content": "You are an assistant named Bender. Your role is to help hackers "
+                                      "win hackathons and answer questions about hackathons. "
+                                      "Answer in the style of Bender from a cartoon."
+                                      "Be useful, balance between funny part that you are a Bender,"
+                                      "but the main goal to be usefully hackathon assistant. "
+                                      "To answer use the information about past "
+                                      "hackathon winners to answer the question. "
+                                      "Show links to the projects that you will mention"
+                                      f"Info about winners: {finalists_content}"},
+        {"role": "user", "content": prompt}
+    ]
+
+
+async def complete(messages, model: str = "gpt-4o") -> str:
+    started = time.perf_counter()
+    try:
+        completion = await openai_client().chat.completions.create(
+            model=model,
+            messages=messages
+        )
+    except Exception:
+        metrics.OPENAI_REQUEST_SECONDS.labels(model, "complete", "error").observe(time.perf_counter() - started)
+        raise
+    metrics.OPENAI_REQUEST_SECONDS.labels(model, "complete", "ok").observe(time.perf_counter() - started)
+    metrics.record_openai_usage(model, completion.usage)
+    return completion.choices[0].message.content
 
-# Database setup using SQLite
-DATABASE_URL = "sqlite:///./projects.db"
-
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
-
-
-class Project(Base):
-    __tablename__ = "projects"
-
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, unique=True, index=True)
-    wallet_id = Column(String)
-    wallet_address = Column(String)
-    ens_address = Column(String)
-
-
-# Create the database tables
-Base.metadata.create_all(bind=engine)
-
-finalist_file_path = "./input/singapore.txt"
-if os.path.exists(finalist_file_path):
-    with open(finalist_file_path, "r", encoding="utf-8") as file:
-        finalists_content = file.read()
 
+async def cached_answer(request: Request, endpoint: str, question: str, corpus_version: str,
+                        build_messages, stream: bool):
+    """Answer from the LLM cache, calling the model (once per distinct question) on a miss.
 
-@app.post("/ask-llm")
-async def ask_llm(question: str = Form(...)):
+    Model calls go through the scheduler; when it is saturated the request is
+    turned away with a 503 instead of waiting behind everyone else.
+    """
+    if stream:
+        key = cache_key(endpoint, question, corpus_version)
+        answer = await answer_cache.lookup(key)
+        if answer is not None:
+            return text_streaming_response(answer)
+        # Join the stream of an identical question already being answered
+        completion = shared_completion(key)
+        answer_cache.count_streamed_miss(joined=completion is not None)
+        if completion is None:
+            try:
+                scheduler.check()
+            except SchedulerBusy as e:
+                raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+            completion = start_completion(key, openai_client(), build_messages(question),
+                                          on_complete=lambda text: answer_cache.store(key, endpoint, question, text),
+                                          slot=scheduler.slot(question), timeout=scheduler.timeout)
+        return streaming_response(request, completion)
     try:
-        prompt = f"Question: {question}"
-
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are an assistant named Bender. Your role is to help hackers "
-                                              "win hackathons and answer questions about hackathons. "
-                                              "Answer in the style of Bender from a cartoon."
-                                              "Be useful, balance between funny part that you are a Bender,"
-                                              "but the main goal to be usefully hackathon assistant."
-                                              "Show links to the projects that you will mention"
-                 },
-                {"role": "user", "content": prompt}
-            ]
-        )
-        answer = completion.choices[0].message.content
-
+        answer = await answer_cache.get_or_compute(
+            endpoint, question, corpus_version,
+            lambda: scheduler.run(question, lambda: complete(build_messages(question))))
         return {"answer": answer}
+    except SchedulerBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="The model took too long to answer")
     except Exception as e:
         return {"error": str(e)}
 
 
-def generate_wallet_id_and_address(project_name: str):
-    """Generate wallet_id and wallet_address using the project name as a base."""
-    wallet_id, wallet_address = circle_bender.initialize_wallet(project_name, project_name, project_name)
-    return wallet_id, wallet_address
+@app.post("/ask-llm")
+async def ask_llm(request: Request, question: str = Form(...), stream: bool = Form(False)):
+    """Answer a question; with ``stream=true`` tokens are relayed as Server-Sent Events."""
+    return await cached_answer(request, "ask-llm", question, "", bender_messages, stream)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(metrics.latest(), media_type=CONTENT_TYPE_LATEST)
 
-# Dependency to get a database session
 
+@app.get("/llm-cache/stats")
+async def llm_cache_stats():
+    return dict(answer_cache.snapshot(), scheduler=scheduler.snapshot())
+
+
+@app.get("/projects/search")
+async def search_projects(q: Optional[str] = Query(None, description="keywords, all of which must match"),
+                          sponsor: Optional[str] = Query(None, description="prize sponsor, e.g. Worldcoin"),
+                          prize: Optional[str] = Query(None, description="part of a prize name"),
+                          event: Optional[str] = Query(None, description="part of the event name"),
+                          offset: int = Query(0, ge=0),
+                          limit: int = Query(project_catalog.SEARCH_DEFAULT_LIMIT, ge=1,
+                                             le=project_catalog.SEARCH_MAX_LIMIT),
+                          db: AsyncSession = Depends(get_db)):
+    """Look up finalist projects in the structured catalog, without an LLM call."""
+    await project_catalog.catalog.refresh()
+    return await project_catalog.catalog.search(db, q, sponsor, prize, event, offset, limit)
 
-import random
 
 @app.get("/random-project")
 async def get_random_project():
     try:
-        db = SessionLocal()
-
-        projects = db.query(Project).all()
-        if not projects:
+        random_project = registry.random()
+        if random_project is None:
             raise HTTPException(status_code=404, detail="No projects found")
 
-        random_project = random.choice(projects)
-        return {
-            "name": random_project.name,
-            "wallet_id": random_project.wallet_id,
-            "wallet_address": random_project.wallet_address,
-            "ens_address": random_project.ens_address,
-        }
+        return random_project.as_dict()
     except Exception as e:
         return {"error": str(e)}
 
 @app.post("/ask-llm-with-context")
-async def ask_llm_with_context(question: str = Form(...)):
+async def ask_llm_with_context(request: Request, question: str = Form(...), stream: bool = Form(False)):
+    """Answer using the finalists corpus; with ``stream=true`` tokens are relayed as Server-Sent Events."""
+    finalists_index.refresh()
+    return await cached_answer(request, "ask-llm-with-context", question, finalists_index.version,
+                               bender_context_messages, stream)
+
+
+@app.post("/register-project", status_code=202)
+async def register_project(project: str = Form(...), db: AsyncSession = Depends(get_db)):
+    """
+    Queue a project registration and return its id right away. The wallet, the ENS
+    registration and its confirmation are handled by background workers; follow
+    progress at GET /registrations/{id} or its /events stream.
+    """
+    if not project:
+        raise HTTPException(status_code=400, detail="Project name is required")
     try:
-        prompt = f"Question: {question}"
-
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are an assistant named Bender. Your role is to help hackers "
-                                              "win hackathons and answer questions about hackathons. "
-                                              "Answer in the style of Bender from a cartoon."
-                                              "Be useful, balance between funny part that you are a Bender,"
-                                              "but the main goal to be usefully hackathon assistant. "
-                                              "To answer use the information about past "
-                                              "hackathon winners to answer the question. "
-                                              "Show links to the projects that you will mention"
-                                              f"Info about winners: {finalists_content}"},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        answer = completion.choices[0].message.content
+        # Checked before anything is created: the name only reaches ENS after its wallet exists
+        ens_batcher.validate_label(project)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if registry.get(project) is not None:
+        raise HTTPException(status_code=409, detail=f"Project {project} is already registered")
 
-        return {"answer": answer}
-    except Exception as e:
-        return {"error": str(e)}
+    registration = await registrations.submit(db, project)
+    registration_id = registration["registration_id"]
+    return {
+        "registration_id": registration_id,
+        "status": registration["status"],
+        "status_url": f"/registrations/{registration_id}",
+        "events_url": f"/registrations/{registration_id}/events",
+    }
+
+
+@app.get("/registrations/{registration_id}")
+async def registration_status(registration_id: str):
+    status = await registrations.status(registration_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="No such registration")
+    return status
+
+
+@app.get("/registrations/{registration_id}/events")
+async def registration_events(request: Request, registration_id: str):
+    """Server-Sent Events with the registration's state on every stage transition."""
+    if await registrations.status(registration_id) is None:
+        raise HTTPException(status_code=404, detail="No such registration")
+
+    async def stream():
+        async for state in registrations.events(registration_id):
+            if await request.is_disconnected():
+                return
+            yield sse_event(state, event="status")
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+class ProjectNames(BaseModel):
+    projects: List[str]
 
 
-@app.post("/register-project")
-async def register_project(project: str = Form(...)):
+@app.post("/register-projects")
+async def register_projects(projects: ProjectNames):
+    """
+    Register many projects at once: wallets are created in batches inside the shared
+    wallet set and all new projects are stored in one transaction. Names that are
+    already registered are reported under ``skipped``, names that are not valid ENS
+    labels under ``invalid``, and projects whose ENS registration failed are queued
+    as registrations (``queued``).
+    """
+    if not projects.projects:
+        raise HTTPException(status_code=400, detail="No project names provided")
     try:
-        if not project:
-            raise HTTPException(status_code=400, detail="Project name is required")
-
-        # Generate wallet ID and address
-        wallet_id, wallet_address = generate_wallet_id_and_address(project)
-        execution_result = circle_bender.call_contract_execution(project, wallet_address)
-        ens_address = execution_result  # Assuming the execution result is the ENS address
-
-        # Save the project to the database
-        db = SessionLocal()
-        db_project = Project(
-            name=project,
-            wallet_id=wallet_id,
-            wallet_address=wallet_address,
-            ens_address=ens_address
-        )
-        db.add(db_project)
-        db.commit()
-        db.refresh(db_project)
-        db.close()
-
-        return {
-            "wallet_id": wallet_id,
-            "wallet_address": wallet_address,
-            "ens_address": ens_address
-        }
+        return await bulk_registration.register_projects(projects.projects)
     except Exception as e:
+        logger.exception("Bulk registration failed")
         return {"error": str(e)}
 
 
+def _leaderboard_page(snapshot, offset: int, limit: Optional[int]):
+    return {
+        "leaderboard": snapshot.page(offset, limit),
+        "total": len(snapshot.entries),
+        "offset": offset,
+        "version": snapshot.version,
+        "generated_at": snapshot.generated_at,
+    }
+
+
 @app.post("/leaderboard")
-async def leaderboard():
+async def leaderboard(offset: int = Query(0, ge=0), limit: Optional[int] = Query(None, ge=1)):
+    """Page of the materialized ranking; omit ``limit`` for the whole board."""
     try:
-        db = SessionLocal()
-        projects = db.query(Project).all()
-        db.close()
-
-        project_list = []
-        for project in projects:
-            try:
-                # Fetch the balance using the wallet_id
-                balance = circle_bender.wallet_balance(project.wallet_id)
-            except Exception as e:
-                balance = 0  # Set balance to 0 if there's an error fetching it
-
-            project_list.append({
-                "name": project.name,
-                "wallet_id": project.wallet_id,
-                "wallet_address": project.wallet_address,
-                "ens_address": project.ens_address,
-                "balance": balance
-            })
-
-        # Sort the project list by balance in descending order
-        sorted_project_list = sorted(project_list, key=lambda x: float(x['balance']), reverse=True)
-
-        return {"leaderboard": sorted_project_list}
+        snapshot = await ranking.current()
+        return _leaderboard_page(snapshot, offset, limit)
     except Exception as e:
         return {"error": str(e)}
 
 
+@app.get("/leaderboard")
+async def leaderboard_conditional(request: Request, offset: int = Query(0, ge=0),
+                                  limit: Optional[int] = Query(None, ge=1)):
+    """Same as POST /leaderboard, with an ETag so unchanged rankings cost a 304."""
+    snapshot = await ranking.current()
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == snapshot.etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(_leaderboard_page(snapshot, offset, limit), headers=headers)
+
+
+@app.get("/leaderboard/events")
+async def leaderboard_events(request: Request, limit: Optional[int] = Query(None, ge=1),
+                             since: Optional[int] = Query(None, ge=0, description="last version seen"),
+                             etag: Optional[str] = Query(None, description="ETag of that version")):
+    """Server-Sent Events with the ranking and every later change to its first ``limit`` ranks.
+
+    Each event's id is ``<version>-<etag>``, so a reconnecting client
+    (Last-Event-ID) only gets the diff it missed, provided it reached a
+    worker that ranked that version the same way; otherwise it gets a full
+    snapshot.
+    """
+    if ranking.subscribers >= LEADERBOARD_MAX_SUBSCRIBERS:
+        raise HTTPException(status_code=503, detail="Too many leaderboard subscribers")
+    if since is None:
+        since, etag = parse_event_id(request.headers.get("last-event-id", ""))
+    elif etag is not None and not etag.startswith('"'):
+        etag = f'"{etag}"'
+
+    async def stream():
+        async for event, message in ranking.subscribe(since, etag, limit):
+            if await request.is_disconnected():
+                return
+            if message is None:
+                yield ": heartbeat\n\n"
+            else:
+                yield f"id: {event_id(message)}\n" + sse_event(message, event=event)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @app.post("/generate-ens")
 async def generate_ens(name: str = Form(...), address: str = Form(...)):
     try:
         if not name or not address:
             raise HTTPException(status_code=400, detail="Name and address are required")
 
-        # Call the contract execution function
-        execution_result = circle_bender.call_contract_execution(name, address)
+        # Registrations arriving together are sent as one registerBatch transaction
+        execution_result = await ens_batcher.register(name, address)
 
         return {"execution_result": execution_result}
     except Exception as e:
         return {"error": str(e)}
 
 
+@app.post("/circle/notifications")
+async def circle_notifications(request: Request, db: AsyncSession = Depends(get_db)):
+    """Ingest Circle webhook notifications into the balance ledger."""
+    body = await request.body()
+    if not await ledger.verify_signature(request.headers, body):
+        raise HTTPException(status_code=401, detail="Invalid notification signature")
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Notification body is not JSON")
+
+    applied = await ledger.apply_notification(db, payload)
+    if applied:
+        ranking.notify_changed()
+    return {"applied": applied}
+
+
 class WinnerProjects(BaseModel):
     winner_project_names: List[str]
 
 
-@app.post("/pay-to-luckies")
-async def pay_to_luckies(winner_projects: WinnerProjects):
+@app.post("/pay-to-luckies", status_code=202)
+async def pay_to_luckies(winner_projects: WinnerProjects,
+                         dry_run: bool = Query(False, description="only return the transfer plan"),
+                         db: AsyncSession = Depends(get_db)):
     """
-    Select winners, collect funds from each project's wallets, calculate the total amount,
-    divide it among the winners, and pay each winner their share.
+    Start a payout job: collect funds from each project's wallets, divide the total
+    among the winners and pay each winner their share. Returns the job id right away;
+    progress is available from GET /pay-to-luckies/{job_id}. With dry_run the netted
+    transfer plan is returned instead and nothing is sent.
     """
     winner_project_names = winner_projects.winner_project_names
-    try:
-        logger.info(f"pay_to_luckies called with winner_project_names: {winner_project_names}")
-        db = SessionLocal()
-
-        # Retrieve all projects from the database
-        projects = db.query(Project).all()
-        logger.debug(f"Retrieved projects from database: {[project.name for project in projects]}")
-
-        for winner_name in winner_project_names:
-            winner_project = db.query(Project).filter(Project.name == winner_name).first()
-            if not winner_project:
-                logger.error(f"There is no project with such name: {winner_name}")
-                return {"error": f"There is no project with such name: {winner_name}"}
-            else:
-                logger.debug(f"Found winner project in database: {winner_project.name}")
-
-        # Collect funds from each project's wallets
-        total_amount = 0.0
-        for project in projects:
-            logger.info(f"Processing project: {project.name}")
-            # Get the wallet balance
-            balance = circle_bender.wallet_balance(project.wallet_id)
-            logger.debug(f"Wallet balance for {project.name} (wallet_id: {project.wallet_id}): {balance}")
-            balance_amount = float(balance)
-            if balance_amount > 0:
-                logger.info(f"Transferring {balance} from {project.name} to master wallet")
-                # Transfer balance from the project's wallet to the master wallet
-                transfer_result = circle_bender.pay_to_master(balance, project.wallet_id)
-                logger.debug(f"Transfer result for {project.name}: {transfer_result}")
-                total_amount += balance_amount
-            else:
-                logger.info(f"No balance to transfer for {project.name}")
+    logger.info(f"pay_to_luckies called with winner_project_names: {winner_project_names}")
 
-        logger.info(f"Total amount collected: {total_amount}")
+    if not winner_project_names:
+        logger.error("No winner project names provided.")
+        raise HTTPException(status_code=400, detail="No winner project names provided.")
 
-        if not winner_project_names:
-            logger.error("No winner project names provided.")
-            raise HTTPException(status_code=400, detail="No winner project names provided.")
+    # One IN query for all winners instead of a lookup per name
+    known = set(await db.scalars(select(Project.name).where(Project.name.in_(winner_project_names))))
+    unknown = [winner_name for winner_name in winner_project_names if winner_name not in known]
+    if unknown:
+        logger.error(f"There is no project with such name: {', '.join(unknown)}")
+        raise HTTPException(status_code=404, detail=f"There is no project with such name: {', '.join(unknown)}")
 
-        # Calculate the amount per winner
-        amount_per_winner = total_amount / len(winner_project_names)
-        logger.info(f"Amount per winner: {amount_per_winner}")
+    if dry_run:
+        plan = await payout_jobs.build_plan(winner_project_names)
+        return JSONResponse(payout_jobs.describe_plan(plan))
 
-        payments = []  # List to store the payments
+    job_id = await payout_jobs.create_job(db, winner_project_names)
+    payout_jobs.start_job(job_id)
+    return {"job_id": job_id, "status_url": f"/pay-to-luckies/{job_id}"}
 
-        # Pay each winner their share
-        for winner_name in winner_project_names:
-            logger.info(f"Processing payment for winner: {winner_name}")
-            # Get the winner's project details
-            winner_project = db.query(Project).filter(Project.name == winner_name).first()
 
-            payment_result = circle_bender.pay_to_winner(
-                amount=str(amount_per_winner),
-                winner_address=winner_project.wallet_address
-            )
-            logger.debug(f"Payment result for {winner_name}: {payment_result}")
-            payments += payment_result
+@app.get("/pay-to-luckies/{job_id}")
+async def pay_to_luckies_status(job_id: str, db: AsyncSession = Depends(get_db)):
+    status = await payout_jobs.job_status(db, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="No such payout job")
+    return status
+
+
+@app.get("/transactions")
+async def tracked_transactions(reference: Optional[str] = Query(None, description="e.g. payout:<job id> or ens"),
+                               state: Optional[str] = Query(None),
+                               pending: Optional[bool] = Query(None, description="only (non-)final transactions"),
+                               offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=500),
+                               db: AsyncSession = Depends(get_db)):
+    """Submitted transfers and contract executions with the state the tracker last saw."""
+    return await tx_tracker.find(db, reference, state, pending, offset, limit)
+
+
+@app.get("/transactions/{transaction_id}")
+async def tracked_transaction(transaction_id: str):
+    transaction = await tx_tracker.get(transaction_id)
+    if transaction is None:
+        raise HTTPException(status_code=404, detail="No such transaction")
+    return transaction
 
-        logger.info(f"Payments completed: {payments}")
-        return {"winners": payments}
-    except Exception as e:
-        logger.exception("An error occurred in pay_to_luckies")
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
-# Start the app
+# Start the app: a reloading development server by default, or WEB_CONCURRENCY
+# worker processes (see gunicorn.conf.py for the preloading production setup)
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="164.92.123.157", port=8282, reload=True)
+    workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+    uvicorn.run("main:app", host=os.getenv('HOST', '164.92.123.157'), port=int(os.getenv('PORT', '8282')),
+                reload=workers == 1 and os.getenv('RELOAD', '1') != '0', workers=workers)
@@ -0,0 +1,168 @@
+"""Prometheus metrics for the backend and its dependencies.
+
+Everything recorded here is exposed by ``GET /metrics`` in the Prometheus
+text format:
+
+    http_request_duration_seconds        per route, method and status
+    http_requests_in_flight              per route and method
+    circle_request_duration_seconds      per Circle endpoint (path template), method and status
+    circle_request_retries_total         per rate-limit class
+    openai_request_duration_seconds      per model, mode (complete/stream) and outcome
+    openai_tokens_total                  per model and kind (prompt/completion)
+    entity_secret_encrypt_seconds        per path (inline/pool)
+    entity_secret_pool_takes_total       per result (hit/miss)
+    db_query_duration_seconds            per statement type
+
+Labels are kept to templates and small enumerations so the series count does
+not grow with traffic, and each observation is a lock plus a bucket scan, so
+this stays on in production.
+
+With several worker processes, set PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py
+does) before this module is imported.  Every process then writes its samples
+to files in that directory, and ``latest()`` aggregates all workers, so a
+scrape sees the whole server rather than whichever worker answered it.
+"""
+import os
+import re
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from starlette.routing import Match
+
+# Outbound calls are slower than local work; buckets reach a minute for retried calls
+DEPENDENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to serve a request, including streamed bodies",
+    ("route", "method", "status"), buckets=DEPENDENCY_BUCKETS)
+# Gauges of live state add up over the running workers
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests currently being served", ("route", "method"),
+    multiprocess_mode="livesum")
+
+CIRCLE_REQUEST_SECONDS = Histogram(
+    "circle_request_duration_seconds", "Duration of a single Circle API attempt",
+    ("endpoint", "method", "status"), buckets=DEPENDENCY_BUCKETS)
+CIRCLE_RETRIES = Counter(
+    "circle_request_retries_total", "Circle API attempts that were retried", ("endpoint_class",))
+
+OPENAI_REQUEST_SECONDS = Histogram(
+    "openai_request_duration_seconds", "Duration of a chat completion, until the last token when streaming",
+    ("model", "mode", "outcome"), buckets=DEPENDENCY_BUCKETS)
+OPENAI_TOKENS = Counter(
+    "openai_tokens_total", "Tokens reported by chat completion usage", ("model", "kind"))
+LLM_IN_FLIGHT = Gauge("llm_completions_in_flight", "Chat completions holding a scheduler slot",
+                      multiprocess_mode="livesum")
+LLM_QUEUED = Gauge("llm_completions_queued", "Chat completions waiting for a scheduler slot",
+                   multiprocess_mode="livesum")
+LLM_QUEUE_SECONDS = Histogram(
+    "llm_queue_wait_seconds", "Time a chat completion waited for a scheduler slot", buckets=DEPENDENCY_BUCKETS)
+LLM_REJECTED = Counter(
+    "llm_completions_rejected_total", "Chat completions turned away by the scheduler", ("reason",))
+
+ENTITY_SECRET_SECONDS = Histogram(
+    "entity_secret_encrypt_seconds", "Time to produce one entity secret ciphertext",
+    ("path",), buckets=FAST_BUCKETS)
+ENTITY_SECRET_POOL_TAKES = Counter(
+    "entity_secret_pool_takes_total", "Ciphertexts taken from the pool", ("result",))
+
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Duration of a database statement", ("statement",), buckets=FAST_BUCKETS)
+
+# Path segments that are identifiers rather than part of the endpoint
+_ID_SEGMENT = re.compile(r"/(?:[0-9a-fA-F]{8}-[0-9a-fA-F-]{27}|0x[0-9a-fA-F]+|[0-9a-fA-F]{16,}|\d+)(?=/|$)")
+
+
+def circle_endpoint(url: str) -> str:
+    """Path template of a Circle URL, e.g. /v1/w3s/wallets/{id}/balances."""
+    return _ID_SEGMENT.sub("/{id}", url.split("?", 1)[0])
+
+
+@contextmanager
+def timer(histogram: Histogram, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+
+
+def record_openai_usage(model: str, usage):
+    if usage is None:
+        return
+    OPENAI_TOKENS.labels(model, "prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    OPENAI_TOKENS.labels(model, "completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+
+def instrument_engine(sync_engine):
+    """Time every statement executed through ``sync_engine``."""
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_QUERY_SECONDS.labels(kind).observe(time.perf_counter() - started)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+class PrometheusMiddleware:
+    """ASGI middleware recording per-route latency and in-flight requests.
+
+    Routes are reported by their path template, so ``/pay-to-luckies/{job_id}``
+    is one series however many jobs exist; unmatched paths share "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _route(self, scope) -> str:
+        partial = "unmatched"
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+            if match == Match.PARTIAL and partial == "unmatched":
+                partial = route.path  # path matched, method did not (405)
+        return partial
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = self._route(scope)
+        method = scope["method"]
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels(route, method)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            HTTP_REQUEST_SECONDS.labels(route, method, str(status["code"])).observe(time.perf_counter() - start)
+
+
+def latest() -> bytes:
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
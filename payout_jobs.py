@@ -0,0 +1,295 @@
+"""Background payout jobs for /pay-to-luckies.
+
+A job divides every project's balance among the winners and pays each
+winner's share out to the winner's contributors.  The transfers come from a
+netted plan (see payout_planner): project wallets pay contributors directly
+and only what is left over goes to the master wallet, instead of collecting
+everything into the master wallet and paying it back out.  Instead of doing
+this inside one HTTP request, the request only creates a job; the work runs
+as a background task with bounded concurrency and every step is persisted in
+the ``payout_jobs`` / ``payout_steps`` tables together with the idempotency
+key it was (or will be) submitted with.  A restarted process resumes unfinished jobs
+from their steps: completed steps are skipped and interrupted ones are resent
+with the same idempotency key, so Circle executes each transfer at most once.
+A job interrupted by an error of its own (the database or Circle being
+unavailable) stays unfinished the same way and is run again after a pause.
+
+Configuration (environment):
+    PAYOUT_CONCURRENCY    transfers in flight per job (default 5)
+    PAYOUT_RETRY_SECONDS  pause before rerunning an interrupted job (default 30)
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from sqlalchemy import Column, Float, ForeignKey, Integer, String, Text, func, select, update
+
+import circle_bender_async
+import ledger
+import payout_planner
+import tx_index
+import tx_tracker
+from circle_bender import ETH_SEPOLIA_ADDRESS, MASTER_WALLET_ADDRESS
+from database import Base, Project, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+PAYOUT_CONCURRENCY = int(os.getenv('PAYOUT_CONCURRENCY', '5'))
+PAYOUT_RETRY_SECONDS = float(os.getenv('PAYOUT_RETRY_SECONDS', '30'))
+
+ACTIVE_STATUSES = ("pending", "paying")
+
+
+class PayoutJob(Base):
+    __tablename__ = "payout_jobs"
+
+    id = Column(String, primary_key=True)
+    status = Column(String, nullable=False, default="pending")
+    winners = Column(Text, nullable=False)  # JSON list of winner project names
+    total_collected = Column(String)
+    amount_per_winner = Column(String)
+    error = Column(Text)
+    created_at = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)
+
+
+class PayoutStep(Base):
+    __tablename__ = "payout_steps"
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(String, ForeignKey("payout_jobs.id"), index=True, nullable=False)
+    # "transfer" (from a project wallet to ``address``) or "share" (what a contributor of the
+    # winner ``project_name`` is owed; paid by transfers, not sent itself)
+    kind = Column(String, nullable=False)
+    project_name = Column(String, nullable=False)
+    wallet_id = Column(String)
+    address = Column(String)
+    amount = Column(String, nullable=False)
+    idempotency_key = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, done, failed
+    transfer_id = Column(String)
+    error = Column(Text)
+
+
+async def _touch(db, job: PayoutJob, **fields):
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.updated_at = time.time()
+    await db.commit()
+
+
+async def create_job(db, winner_project_names: List[str]) -> str:
+    """Persist a new payout job and return its id; the caller starts it."""
+    now = time.time()
+    job = PayoutJob(id=str(uuid.uuid4()), status="pending", winners=json.dumps(winner_project_names),
+                    created_at=now, updated_at=now)
+    db.add(job)
+    await db.commit()
+    return job.id
+
+
+async def _projects_by_name() -> Dict[str, tuple]:
+    """Every project from the database; another worker's registry may not have seen the newest ones yet."""
+    async with SessionLocal() as db:
+        rows = await db.execute(select(Project.name, Project.wallet_id, Project.wallet_address).order_by(Project.id))
+        return {row.name: row for row in rows}
+
+
+def _winner_projects(projects: Dict[str, tuple], winners: List[str]) -> Dict[str, tuple]:
+    unknown = [winner for winner in winners if winner not in projects]
+    if unknown:
+        raise ValueError(f"There is no project with such name: {', '.join(unknown)}")
+    return {winner: projects[winner] for winner in winners}
+
+
+async def build_plan(winners: List[str]) -> dict:
+    """Netted payout plan for ``winners`` from the current balances and contributions.
+
+    Raises ValueError when a winner is not a registered project.
+    """
+    projects_by_name = await _projects_by_name()
+    winner_projects = _winner_projects(projects_by_name, winners)
+    projects = list(projects_by_name.values())
+    balances = await ledger.balances_for(project.wallet_id for project in projects)
+
+    async def winner_contributions(winner: str) -> Dict[str, Decimal]:
+        address = winner_projects[winner].wallet_address
+        await tx_index.refresh(address)
+        return await tx_index.contributions(address)
+
+    contributions = dict(zip(winners, await asyncio.gather(*(winner_contributions(winner) for winner in winners))))
+    wallets = [{"name": project.name, "wallet_id": project.wallet_id, "address": project.wallet_address,
+                "balance": balances.get(project.wallet_id, "0") or "0"}
+               for project in projects if project.wallet_id]
+    return payout_planner.plan(wallets, winners, contributions, MASTER_WALLET_ADDRESS)
+
+
+def describe_plan(plan: dict) -> dict:
+    """JSON-friendly form of a plan, as returned for a dry run."""
+    return {
+        "total_collected": format(plan["total_collected"], 'f'),
+        "amount_per_winner": format(plan["amount_per_winner"], 'f'),
+        "payouts": [dict(payout, amount=format(payout["amount"], 'f')) for payout in plan["payouts"]],
+        "transfers": [dict(transfer, amount=format(transfer["amount"], 'f')) for transfer in plan["transfers"]],
+        "transfer_count": len(plan["transfers"]),
+        "naive_transfer_count": plan["naive_transfers"],
+    }
+
+
+async def _plan_transfers(job_id: str):
+    """Record the share and transfer steps of the job's netted plan."""
+    async with SessionLocal() as db:
+        job = await db.get(PayoutJob, job_id)
+        plan = await build_plan(json.loads(job.winners))
+        for payout in plan["payouts"]:
+            db.add(PayoutStep(job_id=job_id, kind="share", project_name=payout["winner"], address=payout["address"],
+                              amount=format(payout["amount"], 'f'), idempotency_key=str(uuid.uuid4()),
+                              status="planned"))
+        for transfer in plan["transfers"]:
+            db.add(PayoutStep(job_id=job_id, kind="transfer", project_name=transfer["from_project"],
+                              wallet_id=transfer["from_wallet_id"], address=transfer["to_address"],
+                              amount=format(transfer["amount"], 'f'), idempotency_key=str(uuid.uuid4())))
+        logger.info(f"Payout job {job_id}: collected {plan['total_collected']}, {plan['amount_per_winner']} "
+                    f"per winner in {len(plan['transfers'])} transfer(s) instead of {plan['naive_transfers']}")
+        await _touch(db, job, status="paying", total_collected=format(plan["total_collected"], 'f'),
+                     amount_per_winner=format(plan["amount_per_winner"], 'f'))
+
+
+async def _run_step(step: PayoutStep, semaphore: asyncio.Semaphore):
+    async with semaphore:
+        transfer_id = await circle_bender_async.create_transfer(step.wallet_id, ETH_SEPOLIA_ADDRESS, step.amount,
+                                                                step.address, step.idempotency_key,
+                                                                reference=f"payout:{step.job_id}")
+        ok = transfer_id is not None
+
+    async with SessionLocal() as db:
+        await db.execute(update(PayoutStep)
+                         .where(PayoutStep.id == step.id)
+                         .values(status="done" if ok else "failed", transfer_id=transfer_id,
+                                 error=None if ok else "transfer was not accepted"))
+        await db.commit()
+
+
+async def _run_pending_steps(job_id: str):
+    async with SessionLocal() as db:
+        steps = (await db.scalars(select(PayoutStep)
+                                  .where(PayoutStep.job_id == job_id, PayoutStep.kind == "transfer",
+                                         PayoutStep.status == "pending"))).all()
+    semaphore = asyncio.Semaphore(PAYOUT_CONCURRENCY)
+    # One step's error must not abandon its siblings mid-flight: let all of them finish first
+    results = await asyncio.gather(*(_run_step(step, semaphore) for step in steps), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, Exception)]
+    for error in errors[1:]:
+        logger.error(f"Payout job {job_id}: step interrupted", exc_info=error)
+    if errors:
+        raise errors[0]
+
+
+async def run_job(job_id: str):
+    """Drive a job to completion from whatever state it was persisted in."""
+    try:
+        async with SessionLocal() as db:
+            status = await db.scalar(select(PayoutJob.status).where(PayoutJob.id == job_id))
+
+        if status == "pending":
+            await _plan_transfers(job_id)
+            status = "paying"
+        if status == "paying":
+            await _run_pending_steps(job_id)
+
+        async with SessionLocal() as db:
+            failed = await db.scalar(select(func.count())
+                                     .select_from(PayoutStep)
+                                     .where(PayoutStep.job_id == job_id, PayoutStep.status == "failed"))
+            await _touch(db, await db.get(PayoutJob, job_id), status="completed",
+                         error=f"{failed} step(s) failed" if failed else None)
+        logger.info(f"Payout job {job_id} completed")
+    except ValueError as e:
+        # The plan cannot be made (e.g. an unknown winner): running again would not help
+        logger.exception(f"Payout job {job_id} failed")
+        async with SessionLocal() as db:
+            await _touch(db, await db.get(PayoutJob, job_id), status="failed", error=str(e))
+    except Exception:
+        # Unsent steps stay pending and the job active, so a rerun (or a restart) finishes it
+        logger.exception(f"Payout job {job_id} interrupted, running it again in {PAYOUT_RETRY_SECONDS:.0f}s")
+        _schedule_rerun(job_id)
+
+
+_tasks: Dict[str, asyncio.Task] = {}
+_retry_handles: Dict[str, asyncio.TimerHandle] = {}
+
+
+def _schedule_rerun(job_id: str):
+    def rerun():
+        _retry_handles.pop(job_id, None)
+        start_job(job_id)
+    _retry_handles[job_id] = asyncio.get_running_loop().call_later(PAYOUT_RETRY_SECONDS, rerun)
+
+
+def start_job(job_id: str):
+    if job_id in _tasks:
+        return
+    task = asyncio.get_running_loop().create_task(run_job(job_id))
+    _tasks[job_id] = task
+    task.add_done_callback(lambda _: _tasks.pop(job_id, None))
+
+
+async def resume_unfinished():
+    """Restart every job a previous process left unfinished."""
+    async with SessionLocal() as db:
+        job_ids = (await db.scalars(select(PayoutJob.id).where(PayoutJob.status.in_(ACTIVE_STATUSES)))).all()
+    for job_id in job_ids:
+        logger.info(f"Resuming payout job {job_id}")
+        start_job(job_id)
+
+
+async def job_status(db, job_id: str) -> Optional[dict]:
+    job = await db.get(PayoutJob, job_id)
+    if job is None:
+        return None
+    steps = (await db.scalars(select(PayoutStep).where(PayoutStep.job_id == job_id))).all()
+    transfer_steps = [step for step in steps if step.kind == "transfer"]
+    progress = {"transfer": {
+        "total": len(transfer_steps),
+        "done": sum(step.status == "done" for step in transfer_steps),
+        "failed": sum(step.status == "failed" for step in transfer_steps),
+    }}
+    # A share is paid once every transfer to its address went through
+    transfers_to = {}
+    for step in transfer_steps:
+        transfers_to.setdefault(step.address, []).append(step)
+    payments = []
+    for step in steps:
+        if step.kind == "share":
+            transfers = transfers_to.get(step.address, [])
+            paid = bool(transfers) and all(transfer.status == "done" for transfer in transfers)
+            payments.append({"winner": step.project_name, "amount": step.amount, "source_address": step.address,
+                             "transfer_result": [transfer.transfer_id for transfer in transfers] if paid else None})
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "winners": json.loads(job.winners),
+        "total_collected": job.total_collected,
+        "amount_per_winner": job.amount_per_winner,
+        "progress": progress,
+        "winners_payments": payments,
+        # States of the submitted transfers, as last seen by the transaction tracker
+        "transfers": await tx_tracker.summary(db, f"payout:{job.id}"),
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+
+
+async def stop():
+    for handle in _retry_handles.values():
+        handle.cancel()
+    _retry_handles.clear()
+    for task in list(_tasks.values()):
+        task.cancel()
+    await asyncio.gather(*_tasks.values(), return_exceptions=True)
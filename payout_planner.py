@@ -0,0 +1,131 @@
+"""Netted transfer plan for a payout.
+
+A payout collects every project's balance, divides the total evenly among the
+winners and splits each winner's share among the addresses that funded the
+winner, in proportion to what they contributed.  Doing that literally means
+one transfer per project into the master wallet and one transfer per
+contributor back out of it.  That costs two transfers (and two fees) even for
+funds that end up where they started, or that could have gone straight from
+a project wallet to a contributor.
+
+The planner works out the balance every address should end with instead, and
+the difference from what it holds now.  Project wallets are the only
+addresses that pay.  Contributors receive their shares, and the master wallet
+keeps what is not paid out (rounding remainders and the shares of winners
+nobody contributed to).  Offsetting flows cancel in that difference.  What
+remains is settled with as few transfers as possible: first a debit and a
+credit of equal size are paired, then the largest remaining debit pays the
+largest remaining credit.  That never needs more than one transfer less than
+the number of addresses involved.
+
+All arithmetic is exact Decimal arithmetic.  Shares are rounded down to
+PAYOUT_QUANTUM, so nothing is paid out that was not collected.
+"""
+import heapq
+from collections import defaultdict
+from decimal import Decimal, ROUND_DOWN, localcontext
+from typing import Dict, List
+
+# Payout shares are sent with six decimal places, rounded down
+PAYOUT_QUANTUM = Decimal('0.000001')
+# Enough digits for 18-decimal token amounts without rounding
+PRECISION = 60
+
+
+def _shares(amount: Decimal, contributions: Dict[str, Decimal]) -> Dict[str, Decimal]:
+    """``amount`` split in proportion to ``contributions``, each share rounded down."""
+    total = sum(contributions.values(), Decimal(0))
+    if total <= 0:
+        return {}
+    shares = {}
+    for address, contributed in sorted(contributions.items()):
+        share = (amount * contributed / total).quantize(PAYOUT_QUANTUM, rounding=ROUND_DOWN)
+        if share > 0:
+            shares[address] = share
+    return shares
+
+
+def _settle(debits: Dict[str, Decimal], credits: Dict[str, Decimal]) -> List[tuple]:
+    """Fewest-transfers settlement as ``(from address, to address, amount)`` tuples.
+
+    ``debits`` and ``credits`` must add up to the same total.
+    """
+    transfers = []
+    debits = dict(debits)
+    credits = dict(credits)
+
+    # A debit that exactly covers a credit settles both in one transfer
+    by_amount = defaultdict(list)
+    for address in sorted(debits):
+        by_amount[debits[address]].append(address)
+    for creditor in sorted(credits):
+        matches = by_amount.get(credits[creditor])
+        if matches:
+            debtor = matches.pop(0)
+            transfers.append((debtor, creditor, credits[creditor]))
+            del debits[debtor]
+            del credits[creditor]
+
+    # Largest first for the rest; each transfer settles at least one side
+    debtors = [(-amount, address) for address, amount in debits.items()]
+    creditors = [(-amount, address) for address, amount in credits.items()]
+    heapq.heapify(debtors)
+    heapq.heapify(creditors)
+    while debtors and creditors:
+        debit, debtor = heapq.heappop(debtors)
+        credit, creditor = heapq.heappop(creditors)
+        amount = min(-debit, -credit)
+        transfers.append((debtor, creditor, amount))
+        if -debit > amount:
+            heapq.heappush(debtors, (debit + amount, debtor))
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor))
+    return transfers
+
+
+def plan(wallets: List[dict], winners: List[str], contributions: Dict[str, Dict[str, Decimal]],
+         master_address: str) -> dict:
+    """Netted plan for paying ``winners``.
+
+    ``wallets`` holds one ``{"name", "wallet_id", "address", "balance"}`` dict
+    per project wallet, ``contributions`` maps each winner to the amount every
+    source address contributed to it.  Returns the payout totals, the
+    ``payouts`` each contributor is owed per winner, and the ``transfers``
+    that bring every address to its final balance; ``naive_transfers`` is the
+    number of transfers collecting into the master wallet would have taken.
+    """
+    with localcontext() as context:
+        context.prec = PRECISION
+        holdings = {wallet["address"]: Decimal(wallet["balance"]) for wallet in wallets
+                    if wallet["address"] and Decimal(wallet["balance"]) > 0}
+        total = sum(holdings.values(), Decimal(0))
+        per_winner = (total / len(winners)).quantize(PAYOUT_QUANTUM, rounding=ROUND_DOWN) if winners else Decimal(0)
+
+        payouts = []
+        final = defaultdict(Decimal)
+        for winner in winners:
+            for address, share in _shares(per_winner, contributions.get(winner, {})).items():
+                payouts.append({"winner": winner, "address": address, "amount": share})
+                final[address] += share
+        # What is not paid out stays collected in the master wallet
+        final[master_address] += total - sum((payout["amount"] for payout in payouts), Decimal(0))
+
+        debits, credits = {}, {}
+        for address in holdings.keys() | final.keys():
+            difference = final.get(address, Decimal(0)) - holdings.get(address, Decimal(0))
+            if difference < 0:
+                debits[address] = -difference
+            elif difference > 0:
+                credits[address] = difference
+        transfers = _settle(debits, credits)
+
+    senders = {wallet["address"]: wallet for wallet in wallets}
+    return {
+        "total_collected": total,
+        "amount_per_winner": per_winner,
+        "payouts": payouts,
+        "transfers": [{"from_project": senders[debtor]["name"], "from_wallet_id": senders[debtor]["wallet_id"],
+                       "from_address": debtor, "to_address": creditor, "amount": amount}
+                      for debtor, creditor, amount in transfers],
+        "naive_transfers": len(holdings) + len(payouts),
+    }
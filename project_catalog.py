@@ -0,0 +1,285 @@
+"""Structured, full-text-searchable catalog of hackathon finalist projects.
+
+Every ``*.txt`` file in the finalists input directory (see finalists_index)
+is split into project blocks, and each block is parsed into a record: name,
+showcase URL, event, short summary, description, "how it's made" notes and
+the prizes won, each prize as ``(sponsor, prize)``.  Records live in the
+``catalog_projects`` and ``catalog_prizes`` tables.  On SQLite they are also
+indexed in the FTS5 table ``catalog_fts``, so keyword lookups are ranked with
+BM25 and take milliseconds.  Other databases fall back to LIKE matching.
+
+Ingestion is incremental.  A file is re-parsed only when its content hash
+differs from the one recorded in ``catalog_sources``, and projects of removed
+files are dropped.
+"""
+import os
+import re
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy import (DDL, Column, Float, ForeignKey, Integer, String, Text, column, delete, event, func,
+                        literal_column, or_, select, table, text)
+
+from database import IS_SQLITE, Base, SessionLocal
+from finalists_index import CHANGE_CHECK_SECONDS, FINALISTS_INPUT_DIR, split_projects, tokenize
+
+logger = logging.getLogger(__name__)
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+MIN_PREFIX_LENGTH = 4
+
+# Lines of the showcase page that are navigation, not content
+NAVIGATION_LINES = {"Live Demo", "Source Code", "Prize Pool"}
+LEADING_SYMBOLS = re.compile(r"^[^\w(\[]+")
+
+
+class CatalogProject(Base):
+    __tablename__ = "catalog_projects"
+
+    id = Column(Integer, primary_key=True)
+    source = Column(String, index=True, nullable=False)
+    name = Column(String, index=True, nullable=False)
+    url = Column(String, index=True)
+    event = Column(String, index=True)
+    summary = Column(Text)
+    description = Column(Text)
+    how_its_made = Column(Text)
+
+
+class CatalogPrize(Base):
+    __tablename__ = "catalog_prizes"
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey("catalog_projects.id", ondelete="CASCADE"), index=True, nullable=False)
+    sponsor = Column(String, index=True, nullable=False)
+    prize = Column(String, nullable=False)
+
+
+class CatalogSource(Base):
+    __tablename__ = "catalog_sources"
+
+    source = Column(String, primary_key=True)
+    sha256 = Column(String, nullable=False)
+    ingested_at = Column(Float, nullable=False)
+
+
+# Standalone FTS5 table keyed by catalog_projects.id; prizes are indexed as one text column
+catalog_fts = table("catalog_fts", column("rowid"))
+event.listen(Base.metadata, "after_create", DDL(
+    "CREATE VIRTUAL TABLE IF NOT EXISTS catalog_fts USING fts5("
+    "name, summary, description, how_its_made, prizes, tokenize='porter unicode61')"
+).execute_if(dialect="sqlite"))
+
+
+def _clean(line: str) -> str:
+    return LEADING_SYMBOLS.sub("", line).strip()
+
+
+def _section(lines: List[str], start: str, ends: tuple) -> List[str]:
+    """Lines after the ``start`` heading up to the first of ``ends``."""
+    try:
+        first = lines.index(start) + 1
+    except ValueError:
+        return []
+    for i in range(first, len(lines)):
+        if lines[i] in ends:
+            return lines[first:i]
+    return lines[first:]
+
+
+def parse_project(title: str, block: str, source: str) -> dict:
+    """Structured record of one project block as produced by ``split_projects``."""
+    lines = [line.strip() for line in block.splitlines()]
+    url = lines[1] if len(lines) > 1 else None
+
+    header = _section(lines, url, ("Created At",)) if url else []
+    header = [line for line in header if line and line not in NAVIGATION_LINES]
+    # The page repeats the display name right above "Created At"
+    display_name = header[-1] if header else None
+    summary = " ".join(line for line in header if line != display_name)
+
+    event_lines = [line for line in _section(lines, "Created At", ("Winner of", "Project Description")) if line]
+    prizes = []
+    for line in _section(lines, "Winner of", ("Project Description",)):
+        if not line or line in NAVIGATION_LINES:
+            continue
+        sponsor, _, prize = line.partition(" - ")
+        prizes.append({"sponsor": sponsor.strip(), "prize": _clean(prize) if prize else sponsor.strip()})
+
+    description = _section(lines, "Project Description", ("How it's Made",))
+    how_its_made = _section(lines, "How it's Made", ())
+    return {
+        "source": source,
+        "name": _clean(title) or display_name,
+        "url": url,
+        "event": event_lines[0] if event_lines else os.path.splitext(source)[0],
+        "summary": summary,
+        "description": "\n".join(description).strip(),
+        "how_its_made": "\n".join(how_its_made).strip(),
+        "prizes": prizes,
+    }
+
+
+def fts_query(keywords: str) -> Optional[str]:
+    """FTS5 MATCH expression requiring every keyword.
+
+    The last keyword also matches as a prefix (for search-as-you-type) unless
+    it is short enough that a prefix would match most of the corpus.
+    """
+    terms = tokenize(keywords)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    if len(terms[-1]) >= MIN_PREFIX_LENGTH:
+        quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+class ProjectCatalog:
+    def __init__(self, input_dir: str = FINALISTS_INPUT_DIR):
+        self.input_dir = input_dir
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _input_files(self) -> Dict[str, str]:
+        if not os.path.isdir(self.input_dir):
+            return {}
+        return {name: os.path.join(self.input_dir, name) for name in sorted(os.listdir(self.input_dir))
+                if name.endswith(".txt")}
+
+    async def refresh(self, force: bool = False):
+        """Re-ingest input files whose content changed since they were last ingested."""
+        now = time.monotonic()
+        if not force and now - self._checked_at < CHANGE_CHECK_SECONDS:
+            return
+        async with self._lock:
+            self._checked_at = now
+            files = self._input_files()
+            signature = tuple((name, os.stat(path).st_mtime_ns, os.stat(path).st_size)
+                              for name, path in files.items())
+            if not force and signature == self._signature:
+                return
+
+            async with SessionLocal() as db:
+                ingested = dict((await db.execute(select(CatalogSource.source, CatalogSource.sha256))).all())
+                changed = 0
+                for name, path in files.items():
+                    with open(path, "r", encoding="utf-8") as file:
+                        content = file.read()
+                    sha256 = hashlib.sha256(content.encode("utf-8")).hexdigest()
+                    if ingested.get(name) != sha256:
+                        changed += await self._replace(db, name, content, sha256)
+                for name in ingested.keys() - files.keys():
+                    await self._replace(db, name, None, None)
+                await db.commit()
+            self._signature = signature
+            if changed:
+                logger.info("Catalog ingested %d project(s) from %d file(s)", changed, len(files))
+
+    async def _replace(self, db, source: str, content: Optional[str], sha256: Optional[str]) -> int:
+        """Swap the catalog rows of ``source`` for the projects in ``content`` (None drops them)."""
+        old_ids = select(CatalogProject.id).where(CatalogProject.source == source).scalar_subquery()
+        if IS_SQLITE:
+            await db.execute(text("DELETE FROM catalog_fts WHERE rowid IN "
+                                  "(SELECT id FROM catalog_projects WHERE source = :source)"), {"source": source})
+        await db.execute(delete(CatalogPrize).where(CatalogPrize.project_id.in_(old_ids)))
+        await db.execute(delete(CatalogProject).where(CatalogProject.source == source))
+        await db.execute(delete(CatalogSource).where(CatalogSource.source == source))
+        if content is None:
+            return 0
+
+        records = [parse_project(title, block, source) for title, block in split_projects(content)]
+        projects = [CatalogProject(**{key: value for key, value in record.items() if key != "prizes"})
+                    for record in records]
+        db.add_all(projects)
+        await db.flush()
+        db.add_all(CatalogPrize(project_id=project.id, **prize)
+                   for project, record in zip(projects, records) for prize in record["prizes"])
+        if IS_SQLITE and projects:
+            await db.execute(
+                text("INSERT INTO catalog_fts (rowid, name, summary, description, how_its_made, prizes) "
+                     "VALUES (:id, :name, :summary, :description, :how_its_made, :prizes)"),
+                [{"id": project.id, "name": project.name, "summary": project.summary,
+                  "description": project.description, "how_its_made": project.how_its_made,
+                  "prizes": "\n".join(f"{prize['sponsor']} {prize['prize']}" for prize in record["prizes"])}
+                 for project, record in zip(projects, records)])
+        db.add(CatalogSource(source=source, sha256=sha256, ingested_at=time.time()))
+        return len(projects)
+
+    async def search(self, db, keywords: Optional[str] = None, sponsor: Optional[str] = None,
+                     prize: Optional[str] = None, event: Optional[str] = None,
+                     offset: int = 0, limit: int = SEARCH_DEFAULT_LIMIT) -> dict:
+        """Page of projects matching every given filter, best keyword matches first.
+
+        ``sponsor`` matches a prize sponsor exactly (case-insensitive); ``prize``
+        and ``event`` match substrings.  When both ``sponsor`` and ``prize`` are
+        given they must match the same prize.
+        """
+        limit = min(limit, SEARCH_MAX_LIMIT)
+        conditions = []
+        match = fts_query(keywords) if keywords and IS_SQLITE else None
+        if keywords and not IS_SQLITE:
+            for term in tokenize(keywords):
+                pattern = f"%{term}%"
+                conditions.append(or_(CatalogProject.name.ilike(pattern), CatalogProject.summary.ilike(pattern),
+                                      CatalogProject.description.ilike(pattern)))
+            if not conditions:
+                return {"results": [], "total": 0, "offset": offset, "limit": limit}
+
+        if sponsor or prize:
+            prize_filter = select(CatalogPrize.project_id)
+            if sponsor:
+                prize_filter = prize_filter.where(func.lower(CatalogPrize.sponsor) == sponsor.strip().lower())
+            if prize:
+                prize_filter = prize_filter.where(CatalogPrize.prize.ilike(f"%{prize.strip()}%"))
+            conditions.append(CatalogProject.id.in_(prize_filter))
+        if event:
+            conditions.append(CatalogProject.event.ilike(f"%{event.strip()}%"))
+
+        if match:
+            fts = literal_column("catalog_fts")
+            statement = (select(CatalogProject, func.snippet(fts, 2, "[", "]", "…", 16))
+                         .join(catalog_fts, catalog_fts.c.rowid == CatalogProject.id)
+                         .where(fts.op("MATCH")(match), *conditions)
+                         .order_by(func.bm25(fts)))
+        elif keywords and IS_SQLITE:
+            # Only stopwords or punctuation: nothing to match
+            return {"results": [], "total": 0, "offset": offset, "limit": limit}
+        else:
+            statement = select(CatalogProject).where(*conditions).order_by(CatalogProject.event, CatalogProject.name)
+
+        total = await db.scalar(select(func.count()).select_from(statement.order_by(None).subquery()))
+        rows = (await db.execute(statement.offset(offset).limit(limit))).all()
+
+        prizes: Dict[int, List[dict]] = {}
+        if rows:
+            project_ids = [row[0].id for row in rows]
+            for project_id, prize_sponsor, prize_name in (await db.execute(
+                    select(CatalogPrize.project_id, CatalogPrize.sponsor, CatalogPrize.prize)
+                    .where(CatalogPrize.project_id.in_(project_ids))
+                    .order_by(CatalogPrize.id))).all():
+                prizes.setdefault(project_id, []).append({"sponsor": prize_sponsor, "prize": prize_name})
+
+        results = []
+        for row in rows:
+            project = row[0]
+            result = {
+                "name": project.name,
+                "url": project.url,
+                "event": project.event,
+                "summary": project.summary,
+                "description": project.description,
+                "prizes": prizes.get(project.id, []),
+            }
+            if len(row) > 1:
+                result["snippet"] = row[1]
+            results.append(result)
+        return {"results": results, "total": total, "offset": offset, "limit": limit}
+
+
+catalog = ProjectCatalog()
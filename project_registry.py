@@ -0,0 +1,139 @@
+"""Process-local, compact registry of registered projects.
+
+Read endpoints need every project (leaderboard, payout sweep) or one random
+or named project, which used to mean hydrating ORM objects for the whole
+``projects`` table on every request.  The registry loads the table once at
+startup into ``__slots__`` records plus a name->index dict and an id array,
+and is updated in place whenever this process registers a project.
+
+When several worker processes serve the app, each one only sees its own
+registrations in place; a periodic reload picks up the others'.
+
+Configuration (environment):
+    REGISTRY_RELOAD_SECONDS  interval of the reload from the database (default 30,
+                             0 disables it)
+"""
+import os
+import random
+import asyncio
+import logging
+import threading
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import select
+
+from database import Project, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_RELOAD_SECONDS = float(os.getenv('REGISTRY_RELOAD_SECONDS', '30'))
+
+
+class ProjectRecord:
+    __slots__ = ("id", "name", "wallet_id", "wallet_address", "ens_address")
+
+    def __init__(self, id, name, wallet_id, wallet_address, ens_address):
+        self.id = id
+        self.name = name
+        self.wallet_id = wallet_id
+        self.wallet_address = wallet_address
+        self.ens_address = ens_address
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "wallet_id": self.wallet_id,
+            "wallet_address": self.wallet_address,
+            "ens_address": self.ens_address,
+        }
+
+
+class ProjectRegistry:
+    def __init__(self):
+        self._records: List[ProjectRecord] = []
+        self._index_by_name: Dict[str, int] = {}
+        self._ids = array('q')
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def load(self):
+        """(Re)load every project from the database using plain column tuples."""
+        async with SessionLocal() as db:
+            rows = (await db.execute(select(Project.id, Project.name, Project.wallet_id, Project.wallet_address,
+                                            Project.ens_address)
+                                     .order_by(Project.id))).all()
+        records = [ProjectRecord(*row) for row in rows]
+        changed = len(records) != len(self._records)
+        with self._lock:
+            self._records = records
+            self._index_by_name = {record.name: i for i, record in enumerate(records)}
+            self._ids = array('q', (record.id for record in records))
+        logger.log(logging.INFO if changed else logging.DEBUG, "Project registry loaded %d projects", len(records))
+
+    def upsert(self, project) -> ProjectRecord:
+        """Add or replace a project from anything with Project's attributes."""
+        record = ProjectRecord(project.id, project.name, project.wallet_id, project.wallet_address,
+                               project.ens_address)
+        with self._lock:
+            i = self._index_by_name.get(record.name)
+            if i is None:
+                self._index_by_name[record.name] = len(self._records)
+                self._records.append(record)
+                self._ids.append(record.id)
+            else:
+                self._records[i] = record
+                self._ids[i] = record.id
+        return record
+
+    def get(self, name: str) -> Optional[ProjectRecord]:
+        i = self._index_by_name.get(name)
+        return self._records[i] if i is not None else None
+
+    def get_many(self, names: Iterable[str]) -> Dict[str, ProjectRecord]:
+        """Known projects among ``names``, keyed by name."""
+        found = {}
+        for name in names:
+            record = self.get(name)
+            if record is not None:
+                found[name] = record
+        return found
+
+    def random(self) -> Optional[ProjectRecord]:
+        records = self._records
+        return random.choice(records) if records else None
+
+    def ids(self) -> array:
+        return self._ids
+
+    def __iter__(self) -> Iterator[ProjectRecord]:
+        # Iterate over a snapshot so concurrent registrations don't disturb readers
+        return iter(list(self._records))
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    async def _reload_forever(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.load()
+            except Exception:
+                logger.exception("Project registry reload failed")
+
+    def start(self, interval: float = REGISTRY_RELOAD_SECONDS):
+        """Reload the registry every ``interval`` seconds; call after the initial ``load``."""
+        if interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._reload_forever(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+registry = ProjectRegistry()
@@ -0,0 +1,346 @@
+"""Queued project registration pipeline.
+
+``/register-project`` used to create the wallet and submit the ENS
+registration inside the request and answer with an ENS URL before the
+registration transaction was confirmed.  Now the request only records a
+registration and returns its id; the work moves through three stages, each
+served by its own pool of workers:
+
+    wallet   create the project wallet in the shared wallet set
+    ens      submit the ENS registration (coalesced with concurrent ones by ens_batcher)
+    confirm  wait for tx_tracker to see the registration transaction settle
+
+Only a confirmed registration is stored as a project.  Every transition is
+persisted in ``registrations`` (with the idempotency keys used for the Circle
+calls, so a restarted process resumes without creating duplicates) and
+published to subscribers of the registration's event stream.  Subscribers
+only hear this process's transitions directly; with several worker processes
+the stages may run elsewhere, so event streams also re-read the persisted
+state every REGISTRATION_EVENTS_POLL_SECONDS.
+
+Configuration (environment):
+    REGISTRATION_WORKERS              workers per stage (default 4)
+    REGISTRATION_CONFIRM_TIMEOUT      seconds to wait for the ENS transaction (default 900)
+    REGISTRATION_EVENTS_POLL_SECONDS  interval of the event streams' state re-read (default 2)
+"""
+import os
+import time
+import uuid
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from sqlalchemy import Column, Float, Integer, String, Text, select, update
+
+import bulk_registration
+import circle_bender_async
+import ens_batcher
+import tx_tracker
+from database import Base, Project, SessionLocal
+from project_registry import registry
+
+logger = logging.getLogger(__name__)
+
+REGISTRATION_WORKERS = int(os.getenv('REGISTRATION_WORKERS', '4'))
+REGISTRATION_CONFIRM_TIMEOUT = float(os.getenv('REGISTRATION_CONFIRM_TIMEOUT', '900'))
+REGISTRATION_EVENTS_POLL_SECONDS = float(os.getenv('REGISTRATION_EVENTS_POLL_SECONDS', '2'))
+
+# The tracker requeues a registration as soon as its transaction settles; this
+# local re-check only covers state changes observed by another worker process
+CONFIRM_RECHECK_SECONDS = 30.0
+
+CONFIRMED_STATES = tx_tracker.SETTLED_STATES
+FAILED_STATES = tx_tracker.FAILED_STATES
+
+# Status a registration is in while waiting for each stage
+STAGE_FOR_STATUS = {
+    "queued": "wallet",
+    "wallet_created": "ens",
+    "ens_submitted": "confirm",
+}
+FINAL_STATUSES = ("registered", "failed")
+
+
+class Registration(Base):
+    __tablename__ = "registrations"
+
+    id = Column(String, primary_key=True)
+    project_name = Column(String, index=True, nullable=False)
+    status = Column(String, nullable=False, default="queued")
+    wallet_key = Column(String, nullable=False)
+    ens_key = Column(String, nullable=False)
+    wallet_id = Column(String)
+    wallet_address = Column(String)
+    ens_transaction_id = Column(String)
+    ens_address = Column(String)
+    confirm_attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    created_at = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)
+
+
+def _as_dict(registration: Registration) -> dict:
+    return {
+        "registration_id": registration.id,
+        "project": registration.project_name,
+        "status": registration.status,
+        "wallet_id": registration.wallet_id,
+        "wallet_address": registration.wallet_address,
+        "ens_transaction_id": registration.ens_transaction_id,
+        "ens_address": registration.ens_address,
+        "error": registration.error,
+        "created_at": registration.created_at,
+        "updated_at": registration.updated_at,
+    }
+
+
+_queues: Dict[str, asyncio.Queue] = {}
+_workers: List[asyncio.Task] = []
+_retry_handles: Dict[str, asyncio.TimerHandle] = {}
+_subscribers: Dict[str, List[asyncio.Queue]] = defaultdict(list)
+
+
+def _publish(state: dict):
+    for queue in list(_subscribers.get(state["registration_id"], ())):
+        queue.put_nowait(state)
+
+
+async def _update(registration_id: str, **fields) -> dict:
+    async with SessionLocal() as db:
+        registration = await db.get(Registration, registration_id)
+        for name, value in fields.items():
+            setattr(registration, name, value)
+        registration.updated_at = time.time()
+        await db.commit()
+        state = _as_dict(registration)
+    _publish(state)
+    return state
+
+
+async def _load(registration_id: str) -> Optional[Registration]:
+    async with SessionLocal() as db:
+        return await db.get(Registration, registration_id)
+
+
+def _enqueue(registration_id: str, status: str):
+    stage = STAGE_FOR_STATUS.get(status)
+    if stage is not None and stage in _queues:
+        _queues[stage].put_nowait(registration_id)
+
+
+async def submit(db, project_name: str) -> dict:
+    """Record a registration for ``project_name`` and queue its first stage.
+
+    A name that already has a registration in flight returns that one.
+    """
+    active = await db.scalar(select(Registration)
+                             .where(Registration.project_name == project_name,
+                                    Registration.status.notin_(FINAL_STATUSES))
+                             .limit(1))
+    if active is not None:
+        return _as_dict(active)
+    return await _record(db, project_name, "queued")
+
+
+async def submit_with_wallet(db, project_name: str, wallet_id: str, wallet_address: str) -> dict:
+    """Record a registration whose wallet already exists and queue its ENS stage.
+
+    Used for bulk-registered projects whose ENS registration failed.
+    """
+    return await _record(db, project_name, "wallet_created", wallet_id=wallet_id, wallet_address=wallet_address)
+
+
+async def _record(db, project_name: str, status: str, **fields) -> dict:
+    now = time.time()
+    registration = Registration(id=str(uuid.uuid4()), project_name=project_name, status=status,
+                                wallet_key=str(uuid.uuid4()), ens_key=str(uuid.uuid4()),
+                                confirm_attempts=0, created_at=now, updated_at=now, **fields)
+    db.add(registration)
+    await db.commit()
+    state = _as_dict(registration)
+    _enqueue(state["registration_id"], status)
+    return state
+
+
+async def _create_wallet(registration: Registration):
+    wallet_set_id = await bulk_registration.shared_wallet_set_id()
+    wallets = await circle_bender_async.create_wallets(
+        wallet_set_id, [{"name": registration.project_name, "refId": registration.project_name}],
+        idempotency_key=registration.wallet_key)
+    wallet = wallets[0]
+    await _update(registration.id, status="wallet_created", wallet_id=wallet.get('id'),
+                  wallet_address=wallet.get('address'))
+    _enqueue(registration.id, "wallet_created")
+
+
+async def _submit_ens(registration: Registration):
+    transaction_id = await ens_batcher.batcher.submit(
+        registration.project_name, registration.wallet_address, idempotency_key=registration.ens_key)
+    await _update(registration.id, status="ens_submitted", ens_transaction_id=transaction_id)
+    _enqueue(registration.id, "ens_submitted")
+
+
+async def _store_project(registration: Registration, ens_address: str):
+    async with SessionLocal() as db:
+        project = await db.scalar(select(Project).where(Project.name == registration.project_name))
+        if project is None:
+            project = Project(name=registration.project_name)
+            db.add(project)
+        project.wallet_id = registration.wallet_id
+        project.wallet_address = registration.wallet_address
+        project.ens_address = ens_address
+        await db.commit()
+    registry.upsert(project)
+
+
+def _schedule_confirm(registration_id: str, delay: float):
+    def requeue():
+        _retry_handles.pop(registration_id, None)
+        _enqueue(registration_id, "ens_submitted")
+    _retry_handles[registration_id] = asyncio.get_running_loop().call_later(delay, requeue)
+
+
+async def _confirm(registration: Registration):
+    transaction = await tx_tracker.get(registration.ens_transaction_id)
+    if transaction is None:
+        # Submitted before transactions were tracked, or tracking it at submission failed
+        try:
+            await tx_tracker.track(registration.ens_transaction_id, "contract_execution",
+                                   circle_bender_async.ENS_WALLET_ID, reference="ens")
+            transaction = await tx_tracker.get(registration.ens_transaction_id)
+        except Exception as e:
+            logger.warning(f"Could not track ENS transaction {registration.ens_transaction_id}: {e!r}")
+    state = transaction["state"] if transaction is not None else None
+    if state in CONFIRMED_STATES:
+        ens_address = circle_bender_async.ens_url(registration.project_name)
+        await _store_project(registration, ens_address)
+        await _update(registration.id, status="registered", ens_address=ens_address)
+        logger.info(f"Registered project {registration.project_name}")
+        return
+    if state in FAILED_STATES:
+        await _update(registration.id, status="failed",
+                      error=f"ENS registration transaction {state}: {transaction['error_reason']}")
+        return
+    if time.time() - registration.updated_at > REGISTRATION_CONFIRM_TIMEOUT:
+        await _update(registration.id, status="failed", error="ENS registration was not confirmed in time")
+        return
+
+    async with SessionLocal() as db:
+        await db.execute(update(Registration)
+                         .where(Registration.id == registration.id)
+                         .values(confirm_attempts=registration.confirm_attempts + 1))
+        await db.commit()
+    _schedule_confirm(registration.id, CONFIRM_RECHECK_SECONDS)
+
+
+async def _on_transaction_change(transaction: dict):
+    """Move registrations waiting on a settled or failed ENS transaction to their final state."""
+    if transaction["kind"] != "contract_execution" or transaction["state"] not in CONFIRMED_STATES | FAILED_STATES:
+        return
+    async with SessionLocal() as db:
+        waiting = (await db.scalars(select(Registration.id)
+                                    .where(Registration.ens_transaction_id == transaction["id"],
+                                           Registration.status == "ens_submitted"))).all()
+    for registration_id in waiting:
+        handle = _retry_handles.pop(registration_id, None)
+        if handle is not None:
+            handle.cancel()
+        _enqueue(registration_id, "ens_submitted")
+
+
+STAGES = {
+    "wallet": ("queued", _create_wallet),
+    "ens": ("wallet_created", _submit_ens),
+    "confirm": ("ens_submitted", _confirm),
+}
+
+
+async def _worker(stage: str):
+    expected_status, handler = STAGES[stage]
+    queue = _queues[stage]
+    while True:
+        registration_id = await queue.get()
+        try:
+            registration = await _load(registration_id)
+            # Skip stale entries, e.g. queued twice around a restart
+            if registration is None or registration.status != expected_status:
+                continue
+            await handler(registration)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"Registration {registration_id} failed in stage {stage}")
+            await _update(registration_id, status="failed", error=str(e))
+        finally:
+            queue.task_done()
+
+
+async def start(workers: int = REGISTRATION_WORKERS, resume: bool = True):
+    """Start the stage workers and, with ``resume``, requeue registrations a previous process left unfinished."""
+    if _workers:
+        return
+    tx_tracker.listen(_on_transaction_change)
+    loop = asyncio.get_running_loop()
+    for stage in STAGES:
+        _queues[stage] = asyncio.Queue()
+        # ENS workers mostly wait on the batcher; enough of them to fill a batch
+        stage_workers = max(workers, ens_batcher.ENS_BATCH_MAX_SIZE) if stage == "ens" else workers
+        for _ in range(stage_workers):
+            _workers.append(loop.create_task(_worker(stage)))
+
+    if not resume:
+        return
+    async with SessionLocal() as db:
+        pending = (await db.execute(select(Registration.id, Registration.status)
+                                    .where(Registration.status.notin_(FINAL_STATUSES))
+                                    .order_by(Registration.created_at))).all()
+    for registration_id, status in pending:
+        _enqueue(registration_id, status)
+    if pending:
+        logger.info(f"Resumed {len(pending)} unfinished registration(s)")
+
+
+async def stop():
+    for handle in _retry_handles.values():
+        handle.cancel()
+    _retry_handles.clear()
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _queues.clear()
+
+
+async def status(registration_id: str) -> Optional[dict]:
+    registration = await _load(registration_id)
+    return _as_dict(registration) if registration is not None else None
+
+
+async def events(registration_id: str, poll: float = REGISTRATION_EVENTS_POLL_SECONDS):
+    """Yield the registration's state now and after every transition until it is final.
+
+    Transitions made by this process arrive as they happen; those made by
+    another worker process are picked up by re-reading the state every
+    ``poll`` seconds.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    _subscribers[registration_id].append(queue)
+    try:
+        state = await status(registration_id)
+        seen = None
+        while state is not None:
+            # A re-read can return what was already published, or lag behind it
+            if seen is None or state["updated_at"] > seen:
+                seen = state["updated_at"]
+                yield state
+                if state["status"] in FINAL_STATUSES:
+                    return
+            try:
+                state = await asyncio.wait_for(queue.get(), poll)
+            except asyncio.TimeoutError:
+                state = await status(registration_id)
+    finally:
+        _subscribers[registration_id].remove(queue)
+        if not _subscribers[registration_id]:
+            del _subscribers[registration_id]
@@ -0,0 +1,181 @@
+"""Non-blocking, structured logging for the backend.
+
+``configure_logging()`` installs a single ``QueueHandler`` on the root
+logger; records are put on an in-memory queue by the calling thread and
+formatted and written as one JSON object per line by a ``QueueListener``
+thread, so request handlers and sweeps never wait on stderr.  Formatting of
+the message itself is also deferred to that thread: pass payloads as
+``%s`` arguments (wrapped in ``lazy()`` when producing them is expensive)
+and they are only rendered for records that pass every level and filter.
+
+High-volume per-item debug events can be sampled by tagging them with a
+sample key; only every LOG_SAMPLE_EVERY-th record per key is kept:
+
+    logger.debug("Transaction %s", lazy(json.dumps, transaction), extra=sampled("pay_to_winner.transaction"))
+
+Other ``extra`` fields are emitted as top-level JSON keys.
+
+Configuration (environment):
+    LOG_LEVEL         root level (default INFO)
+    LOG_LEVELS        per-logger levels, e.g. "circle_bender_async=DEBUG,httpx=WARNING"
+    LOG_FORMAT        "json" (default) or "text"
+    LOG_SAMPLE_EVERY  keep one in N sampled records per sample key (default 100)
+"""
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', '100'))
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+_SAMPLE_KEY = "sample_key"
+
+
+class lazy:
+    """Defer ``fn(*args)`` until the log message is actually rendered."""
+    __slots__ = ("fn", "args")
+
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+
+    def __str__(self):
+        return str(self.fn(*self.args))
+
+    __repr__ = __str__
+
+
+def sampled(key: str, **fields) -> dict:
+    """``extra`` for a record that is subject to sampling under ``key``."""
+    return dict(fields, **{_SAMPLE_KEY: key})
+
+
+class SamplingFilter(logging.Filter):
+    """Keep one in ``every`` records per sample key; untagged records always pass."""
+
+    def __init__(self, every: int = LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.every = max(1, every)
+        self._counts: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, _SAMPLE_KEY, None)
+        if key is None:
+            return True
+        with self._lock:
+            count = self._counts[key]
+            self._counts[key] = count + 1
+        if count % self.every:
+            return False
+        record.sample_rate = self.every
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and not name.startswith("_"):
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread.
+
+    The stock handler renders the message in the calling thread; here only
+    exceptions are rendered eagerly, since tracebacks must not outlive the
+    frame they describe.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+_listener: Optional[QueueListener] = None
+# Process that started _listener; a forked child inherits the listener but not its thread
+_listener_pid: Optional[int] = None
+
+
+def configure_logging(level: Optional[str] = None, levels: Optional[str] = None, fmt: Optional[str] = None,
+                      sample_every: Optional[int] = None):
+    """Route all logging through the background queue; safe to call more than once.
+
+    Arguments left as None are read from the environment at call time, so a
+    ``.env`` loaded after this module was imported still applies.  Call it in
+    every process that logs: after a fork the inherited listener thread no
+    longer runs, so a child calling this again gets a queue and thread of its own.
+    """
+    global _listener, _listener_pid
+    if _listener is not None and _listener_pid == os.getpid():
+        return
+    level = level or os.getenv('LOG_LEVEL', LOG_LEVEL).upper()
+    levels = os.getenv('LOG_LEVELS', LOG_LEVELS) if levels is None else levels
+    fmt = (fmt or os.getenv('LOG_FORMAT', LOG_FORMAT)).lower()
+    sample_every = sample_every or int(os.getenv('LOG_SAMPLE_EVERY', str(LOG_SAMPLE_EVERY)))
+
+    output = logging.StreamHandler(sys.stderr)
+    if fmt == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    records = queue.SimpleQueue()
+    handler = DeferredQueueHandler(records)
+    handler.addFilter(SamplingFilter(sample_every))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name, logger_level in parse_levels(levels).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    _listener = QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    _listener_pid = os.getpid()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        if _listener_pid == os.getpid():
+            _listener.stop()
+        _listener = None
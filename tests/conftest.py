@@ -0,0 +1,37 @@
+import os
+import sys
+import asyncio
+import tempfile
+
+import pytest
+
+# Modules live at the repository root and read their configuration at import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/test.db")
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine on a fresh event loop; pooled connections are dropped afterwards."""
+    import database
+
+    def run(coroutine):
+        async def main():
+            try:
+                return await coroutine
+            finally:
+                await database.engine.dispose()
+        return asyncio.run(main())
+    return run
+
+
+@pytest.fixture
+def db_tables(run):
+    """Empty tables of every model for one test."""
+    import database
+
+    async def reset():
+        async with database.engine.begin() as connection:
+            await connection.run_sync(database.Base.metadata.drop_all)
+            await connection.run_sync(database.Base.metadata.create_all)
+    run(reset())
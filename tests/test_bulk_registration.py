@@ -0,0 +1,81 @@
+from sqlalchemy import select
+
+import bulk_registration
+import circle_bender_async
+import ens_batcher
+from database import Project, SessionLocal
+from project_registry import ProjectRegistry
+from registrations import Registration
+
+
+async def _add_project(name):
+    async with SessionLocal() as db:
+        db.add(Project(name=name, wallet_id=f"wallet-{name}", wallet_address=f"0x{name}"))
+        await db.commit()
+
+
+def _register(monkeypatch, run, names, ens_fails=(), stored_meanwhile=(), stored_before=()):
+    """Bulk register ``names`` against a fake Circle; returns the result, the wallets created and the projects."""
+    created = []
+
+    async def create_wallets(wallet_set_id, metadata, idempotency_key=None):
+        created.extend(entry["name"] for entry in metadata)
+        return [{"id": f"wallet-{entry['name']}", "address": f"0x{entry['name']}", "refId": entry["refId"]}
+                for entry in metadata]
+
+    async def register(name, address):
+        if name in stored_meanwhile:
+            # Another worker stores the name while this one is registering it
+            await _add_project(name)
+        return None if name in ens_fails else f"{name}.benderbite.eth"
+
+    monkeypatch.setattr(bulk_registration, "_wallet_set_id", "wallet-set")
+    monkeypatch.setattr(bulk_registration, "registry", ProjectRegistry())
+    monkeypatch.setattr(circle_bender_async, "create_wallets", create_wallets)
+    monkeypatch.setattr(ens_batcher, "register", register)
+
+    async def scenario():
+        for name in stored_before:
+            await _add_project(name)
+        result = await bulk_registration.register_projects(names)
+        async with SessionLocal() as db:
+            projects = {project.name: project.ens_address for project in await db.scalars(select(Project))}
+            queued = {registration.project_name: (registration.status, registration.wallet_id)
+                      for registration in await db.scalars(select(Registration))}
+        return result, created, projects, queued
+
+    return run(scenario())
+
+
+def test_names_stored_by_another_worker_are_skipped_before_creating_wallets(db_tables, run, monkeypatch):
+    result, created, projects, _ = _register(monkeypatch, run, ["old", "new"], stored_before=["old"])
+
+    assert created == ["new"]
+    assert [project["name"] for project in result["registered"]] == ["new"]
+    assert result["skipped"] == ["old"]
+    assert projects == {"old": None, "new": "new.benderbite.eth"}
+
+
+def test_invalid_labels_are_reported_before_creating_wallets(db_tables, run, monkeypatch):
+    result, created, _, _ = _register(monkeypatch, run, ["Clarity", "two words", "fine"])
+
+    assert created == ["fine"]
+    assert set(result["invalid"]) == {"Clarity", "two words"}
+
+
+def test_conflicting_insert_skips_only_that_name(db_tables, run, monkeypatch):
+    result, _, projects, _ = _register(monkeypatch, run, ["a", "b"], stored_meanwhile=["a"])
+
+    assert [project["name"] for project in result["registered"]] == ["b"]
+    assert result["skipped"] == ["a"]
+    # The other worker's row is left as it stored it
+    assert projects == {"a": None, "b": "b.benderbite.eth"}
+
+
+def test_failed_ens_registration_is_handed_to_the_pipeline(db_tables, run, monkeypatch):
+    result, _, projects, queued = _register(monkeypatch, run, ["a", "b"], ens_fails=["b"])
+
+    assert [project["name"] for project in result["registered"]] == ["a"]
+    assert "b" not in projects
+    assert [registration["project"] for registration in result["queued"]] == ["b"]
+    assert queued == {"b": ("wallet_created", "wallet-b")}
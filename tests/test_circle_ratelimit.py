@@ -0,0 +1,157 @@
+import time
+import asyncio
+from email.utils import formatdate
+
+import httpx
+import pytest
+
+import circle_bender_async
+import circle_ratelimit
+
+
+def test_throttle_cuts_rate_multiplicatively_down_to_floor():
+    bucket = circle_ratelimit.TokenBucket(10.0)
+
+    bucket.on_throttle()
+    assert bucket.rate == pytest.approx(7.0)
+    assert bucket._tokens <= 0
+
+    for _ in range(50):
+        bucket.on_throttle()
+    assert bucket.rate == bucket.min_rate == 0.5
+
+
+def test_successes_recover_rate_additively_up_to_ceiling():
+    bucket = circle_ratelimit.TokenBucket(10.0)
+    bucket.on_throttle()
+    throttled = bucket.rate
+
+    bucket.on_success()
+    assert throttled < bucket.rate < throttled + 1
+
+    for _ in range(1000):
+        bucket.on_success()
+    assert bucket.rate == 10.0
+
+
+def test_concurrency_halves_on_throttle_and_grows_back():
+    concurrency = circle_ratelimit.AdaptiveConcurrency(8)
+
+    concurrency.on_throttle()
+    assert concurrency.limit == 4
+    for _ in range(10):
+        concurrency.on_throttle()
+    assert concurrency.limit == 1
+
+    concurrency.on_success()
+    assert concurrency.limit == 2
+    for _ in range(1000):
+        concurrency.on_success()
+    assert concurrency.limit == 8
+
+
+def test_concurrency_slot_waits_for_a_free_slot():
+    async def scenario():
+        concurrency = circle_ratelimit.AdaptiveConcurrency(2)
+        peak = 0
+
+        async def work():
+            nonlocal peak
+            async with concurrency.slot():
+                peak = max(peak, concurrency.in_flight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(work() for _ in range(6)))
+        return peak, concurrency.in_flight
+
+    assert asyncio.run(scenario()) == (2, 0)
+
+
+def test_retry_after_seconds_wins_over_backoff():
+    assert circle_ratelimit.retry_delay(0, "3") == 3.0
+    assert circle_ratelimit.retry_delay(4, "0.5") == 0.5
+    assert circle_ratelimit.retry_delay(0, "-1") == 0.0
+
+
+def test_retry_after_http_date():
+    delay = circle_ratelimit.retry_delay(0, formatdate(time.time() + 20, usegmt=True))
+    assert 18 <= delay <= 20
+
+    # A date in the past means retry right away
+    assert circle_ratelimit.retry_delay(0, formatdate(time.time() - 60, usegmt=True)) == 0.0
+
+
+def test_retry_after_is_capped():
+    assert circle_ratelimit.retry_delay(0, "86400") == circle_ratelimit.RETRY_MAX_SECONDS
+    far = formatdate(time.time() + 3600, usegmt=True)
+    assert circle_ratelimit.retry_delay(0, far) == circle_ratelimit.RETRY_MAX_SECONDS
+
+
+def test_backoff_window_grows_and_is_capped(monkeypatch):
+    monkeypatch.setattr(circle_ratelimit.random, "uniform", lambda low, high: high)
+
+    assert circle_ratelimit.retry_delay(0) == circle_ratelimit.RETRY_BASE_SECONDS
+    assert circle_ratelimit.retry_delay(2) == circle_ratelimit.RETRY_BASE_SECONDS * 4
+    assert circle_ratelimit.retry_delay(20) == circle_ratelimit.RETRY_MAX_SECONDS
+    # An unparseable Retry-After falls back to the backoff window
+    assert circle_ratelimit.retry_delay(1, "soon") == circle_ratelimit.RETRY_BASE_SECONDS * 2
+
+
+def test_parse_rates_overrides_listed_classes_only():
+    rates = circle_ratelimit._parse_rates("balances=2, transfers = 1.5,bogus")
+
+    assert rates["balances"] == 2.0
+    assert rates["transfers"] == 1.5
+    assert rates["wallets"] == circle_ratelimit.DEFAULT_RATES["wallets"]
+
+
+@pytest.fixture
+def circle_responses(monkeypatch):
+    """Serve Circle requests from a list of responses and record when they arrived."""
+    responses, seen = [], []
+
+    def handler(request):
+        seen.append(time.monotonic())
+        return responses.pop(0)
+
+    client = httpx.AsyncClient(base_url="http://circle.test", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(circle_bender_async, "_client", client)
+    return responses, seen
+
+
+def test_request_retries_429_after_retry_after_and_backs_off(circle_responses):
+    responses, seen = circle_responses
+    responses += [httpx.Response(429, headers={"Retry-After": "0.2"}), httpx.Response(200, json={"data": {}})]
+
+    async def scenario():
+        response = await circle_bender_async.request("balances", "GET", "/v1/w3s/wallets")
+        return response, circle_ratelimit.budget("balances")
+
+    response, budget = asyncio.run(scenario())
+
+    assert response.status_code == 200
+    assert len(seen) == 2 and seen[1] - seen[0] >= 0.2
+    assert budget.throttled == 1
+    # One success after the throttle only partly restores the rate
+    assert budget.bucket.rate < budget.bucket.max_rate
+
+
+def test_request_returns_last_response_when_retries_run_out(circle_responses, monkeypatch):
+    responses, seen = circle_responses
+    monkeypatch.setattr(circle_ratelimit, "CIRCLE_MAX_RETRIES", 2)
+    responses += [httpx.Response(503, headers={"Retry-After": "0"}) for _ in range(3)]
+
+    response = asyncio.run(circle_bender_async.request("transfers", "GET", "/v1/w3s/transactions"))
+
+    assert response.status_code == 503
+    assert len(seen) == 3
+
+
+def test_request_does_not_retry_client_errors(circle_responses):
+    responses, seen = circle_responses
+    responses += [httpx.Response(400, json={"message": "bad request"})]
+
+    response = asyncio.run(circle_bender_async.request("other", "GET", "/v1/w3s/wallets"))
+
+    assert response.status_code == 400
+    assert len(seen) == 1
@@ -0,0 +1,200 @@
+import asyncio
+
+import pytest
+
+import leaderboard
+from leaderboard import Leaderboard, LeaderboardSnapshot, _diff, _merge, _top, event_id, parse_event_id
+from project_registry import ProjectRecord
+
+
+def _snapshot(version, *ranking):
+    """Snapshot of ``(name, balance)`` pairs, ranked in the given order."""
+    entries = [{"name": name, "balance": balance, "wallet_address": f"0x{name}", "rank": rank}
+               for rank, (name, balance) in enumerate(ranking, start=1)]
+    return LeaderboardSnapshot(entries, version)
+
+
+def _changed(diff):
+    return {entry["name"]: (entry["rank"], entry["previous_rank"]) for entry in diff["changed"]}
+
+
+def _removed(diff):
+    return {entry["name"]: entry["previous_rank"] for entry in diff["removed"]}
+
+
+def test_diff_reports_changed_added_and_removed_entries():
+    old = _snapshot(1, ("a", "5"), ("b", "3"), ("c", "1"))
+    new = _snapshot(2, ("b", "6"), ("a", "5"), ("d", "2"))
+
+    diff = _diff(old, new)
+
+    assert (diff["from_version"], diff["version"], diff["total"]) == (1, 2, 3)
+    assert _changed(diff) == {"b": (1, 2), "a": (2, 1), "d": (3, None)}
+    assert _removed(diff) == {"c": 3}
+
+
+def test_diff_skips_unchanged_entries():
+    old = _snapshot(1, ("a", "5"), ("b", "3"))
+    new = _snapshot(2, ("a", "5"), ("b", "4"))
+
+    assert _changed(_diff(old, new)) == {"b": (2, 2)}
+
+
+def test_diff_from_nothing_adds_everything():
+    diff = _diff(None, _snapshot(1, ("a", "5"), ("b", "3")))
+
+    assert diff["from_version"] == 0
+    assert _changed(diff) == {"a": (1, None), "b": (2, None)}
+    assert diff["removed"] == []
+
+
+def test_merge_keeps_first_previous_rank_and_last_state():
+    v1 = _snapshot(1, ("a", "5"), ("b", "3"), ("c", "1"))
+    v2 = _snapshot(2, ("b", "6"), ("a", "5"), ("c", "1"))
+    v3 = _snapshot(3, ("c", "9"), ("b", "6"), ("a", "5"))
+
+    merged = _merge([_diff(v1, v2), _diff(v2, v3)])
+
+    assert (merged["from_version"], merged["version"], merged["total"]) == (1, 3, 3)
+    assert _changed(merged) == {"c": (1, 3), "b": (2, 2), "a": (3, 1)}
+    # Sorted by the new rank
+    assert [entry["name"] for entry in merged["changed"]] == ["c", "b", "a"]
+    assert merged["removed"] == []
+
+
+def test_merge_drops_entries_added_and_removed_in_between():
+    v1 = _snapshot(1, ("a", "5"))
+    v2 = _snapshot(2, ("a", "5"), ("new", "1"))
+    v3 = _snapshot(3, ("a", "5"))
+
+    merged = _merge([_diff(v1, v2), _diff(v2, v3)])
+
+    assert merged["changed"] == []
+    assert merged["removed"] == []
+
+
+def test_merge_of_removed_and_added_back_is_a_change():
+    v1 = _snapshot(1, ("a", "5"), ("b", "3"))
+    v2 = _snapshot(2, ("a", "5"))
+    v3 = _snapshot(3, ("b", "7"), ("a", "5"))
+
+    merged = _merge([_diff(v1, v2), _diff(v2, v3)])
+
+    assert _changed(merged) == {"b": (1, 2), "a": (2, 1)}
+    assert merged["removed"] == []
+
+
+def test_merge_of_changed_then_removed_is_a_removal_from_the_first_rank():
+    v1 = _snapshot(1, ("a", "5"), ("b", "3"))
+    v2 = _snapshot(2, ("b", "8"), ("a", "5"))
+    v3 = _snapshot(3, ("a", "5"))
+
+    merged = _merge([_diff(v1, v2), _diff(v2, v3)])
+
+    assert _changed(merged) == {"a": (1, 1)}
+    assert _removed(merged) == {"b": 2}
+
+
+def test_top_hides_changes_below_the_shown_ranks():
+    old = _snapshot(1, ("a", "5"), ("b", "4"), ("c", "3"), ("d", "2"))
+    new = _snapshot(2, ("a", "5"), ("b", "4"), ("d", "3.5"), ("c", "3"))
+
+    top = _top(_diff(old, new), 2)
+
+    assert top["changed"] == [] and top["removed"] == []
+
+
+def test_top_turns_entries_pushed_out_into_removals():
+    old = _snapshot(1, ("a", "5"), ("b", "4"), ("c", "3"))
+    new = _snapshot(2, ("c", "9"), ("a", "5"), ("b", "4"))
+
+    top = _top(_diff(old, new), 2)
+
+    # c enters the shown ranks from below, b drops out of them
+    assert _changed(top) == {"c": (1, 3), "a": (2, 1)}
+    assert _removed(top) == {"b": 2}
+
+
+def test_top_keeps_removals_of_shown_ranks_only():
+    old = _snapshot(1, ("a", "5"), ("b", "4"), ("c", "3"))
+    new = _snapshot(2, ("a", "5"), ("b", "4"))
+
+    assert _removed(_top(_diff(old, new), 2)) == {}
+    assert _removed(_top(_diff(old, new), 3)) == {"c": 3}
+
+
+def test_top_without_limit_is_the_whole_diff():
+    diff = _diff(_snapshot(1, ("a", "1")), _snapshot(2, ("a", "2")))
+
+    assert _top(diff, None) is diff
+
+
+def test_event_id_round_trip():
+    message = _snapshot(7, ("a", "1")).as_message()
+
+    assert parse_event_id(event_id(message)) == (7, message["etag"])
+    assert parse_event_id("") == (None, None)
+    assert parse_event_id("7") == (None, None)
+    assert parse_event_id("x-abc") == (None, None)
+
+
+@pytest.fixture
+def balances(monkeypatch):
+    """Rank three projects on balances the test sets."""
+    balances = {"wallet-a": "5", "wallet-b": "3", "wallet-c": "1"}
+    projects = [ProjectRecord(i, name, f"wallet-{name}", f"0x{name}", None) for i, name in enumerate("abc", start=1)]
+
+    async def balances_for(wallet_ids, token_id=None):
+        return {wallet_id: balances[wallet_id] for wallet_id in wallet_ids}
+
+    monkeypatch.setattr(leaderboard, "registry", projects)
+    monkeypatch.setattr(leaderboard.ledger, "balances_for", balances_for)
+    return balances
+
+
+def _first_message(board, since, etag):
+    async def first():
+        subscription = board.subscribe(since, etag, heartbeat=0.01)
+        try:
+            return await subscription.__anext__()
+        finally:
+            await subscription.aclose()
+    return asyncio.run(first())
+
+
+def _board_with_two_versions(balances):
+    board = Leaderboard()
+
+    async def build():
+        first = await board.refresh()
+        balances["wallet-c"] = "9"
+        await board.refresh()
+        return first
+    return board, asyncio.run(build())
+
+
+def test_subscribe_resumes_from_a_version_with_its_etag(balances):
+    board, first = _board_with_two_versions(balances)
+
+    event, message = _first_message(board, first.version, first.etag)
+
+    assert event == "diff"
+    assert (message["from_version"], message["version"]) == (1, 2)
+    assert message["etag"] == board.snapshot.etag
+    assert _changed(message) == {"c": (1, 3), "a": (2, 1), "b": (3, 2)}
+
+
+def test_subscribe_sends_snapshot_for_another_workers_version(balances):
+    board, first = _board_with_two_versions(balances)
+    # Same version number, different ranking: what another worker would have had
+    other = _snapshot(1, ("b", "3"), ("a", "1"))
+
+    assert _first_message(board, first.version, other.etag)[0] == "snapshot"
+    assert _first_message(board, first.version, None)[0] == "snapshot"
+    assert _first_message(board, None, None)[0] == "snapshot"
+
+
+def test_subscribe_at_the_current_version_waits(balances):
+    board, _ = _board_with_two_versions(balances)
+
+    assert _first_message(board, board.snapshot.version, board.snapshot.etag) == ("heartbeat", None)
@@ -0,0 +1,95 @@
+import time
+import asyncio
+
+import ledger
+from database import SessionLocal
+
+WALLET = "wallet-a"
+
+
+def _notification(transaction_id, amount, transaction_type="INBOUND", state="COMPLETE", notification_id=None):
+    return {"notificationType": "transactions.outbound" if transaction_type == "OUTBOUND" else "transactions.inbound",
+            "notificationId": notification_id or f"n-{transaction_id}-{state}",
+            "notification": {"id": transaction_id, "walletId": WALLET, "transactionType": transaction_type,
+                             "state": state, "amounts": [amount]}}
+
+
+async def _apply(payload):
+    async with SessionLocal() as db:
+        return await ledger.apply_notification(db, payload)
+
+
+async def _set_balance(amount, observed_at):
+    async with SessionLocal() as db:
+        await ledger.set_balances(db, {WALLET: amount}, observed_at)
+        await db.commit()
+
+
+async def _balance():
+    async with SessionLocal() as db:
+        return (await ledger.get_balances(db, [WALLET])).get(WALLET)
+
+
+def test_duplicate_notifications_apply_once(db_tables, run):
+    async def scenario():
+        applied = [await _apply(_notification("tx-1", "5")) for _ in range(2)]
+        # Redelivered under another notification id, and again once the transaction moved on
+        applied.append(await _apply(_notification("tx-1", "5", notification_id="n-other")))
+        applied.append(await _apply(_notification("tx-1", "5", state="CONFIRMED")))
+        return applied, await _balance()
+
+    applied, balance = run(scenario())
+
+    assert applied == [True, False, False, False]
+    assert balance == "5"
+
+
+def test_unsettled_and_foreign_notifications_are_ignored(db_tables, run):
+    async def scenario():
+        applied = [await _apply(_notification("tx-1", "5", state="SENT")),
+                   await _apply(dict(_notification("tx-2", "5"), notificationType="webhooks.test"))]
+        return applied, await _balance()
+
+    assert run(scenario()) == ([False, False], None)
+
+
+def test_inbound_and_outbound_in_any_order(db_tables, run):
+    async def scenario():
+        await _apply(_notification("tx-out", "3", transaction_type="OUTBOUND"))
+        await _apply(_notification("tx-in", "10"))
+        return await _balance()
+
+    assert run(scenario()) == "7"
+
+
+def test_concurrent_notifications_for_one_wallet_all_count(db_tables, run):
+    async def scenario():
+        await asyncio.gather(*(_apply(_notification(f"tx-{i}", "1")) for i in range(20)))
+        return await _balance()
+
+    assert run(scenario()) == "20"
+
+
+def test_older_reconcile_read_does_not_overwrite_a_newer_one(db_tables, run):
+    async def scenario():
+        await _set_balance("8", observed_at=200.0)
+        await _set_balance("3", observed_at=100.0)
+        first = await _balance()
+        await _set_balance("9", observed_at=300.0)
+        return first, await _balance()
+
+    assert run(scenario()) == ("8", "9")
+
+
+def test_reconcile_read_taken_before_a_webhook_leaves_it_alone(db_tables, run):
+    async def scenario():
+        await _set_balance("10", observed_at=100.0)
+        # The sweep reads Circle, a webhook lands, then the sweep writes what it read
+        observed_at = time.time()
+        await _apply(_notification("tx-1", "5"))
+        await _set_balance("10", observed_at)
+        raced = await _balance()
+        await _set_balance("15", time.time())
+        return raced, await _balance()
+
+    assert run(scenario()) == ("15", "15")
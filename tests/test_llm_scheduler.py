@@ -0,0 +1,214 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import llm_scheduler
+import main
+from llm_cache import LLMAnswerCache
+from llm_scheduler import LLMScheduler, SchedulerBusy
+
+SHORT = "short?"
+LONG = "long " * llm_scheduler.LLM_SHORT_QUESTION_CHARS
+
+
+async def _hold(scheduler, question, release: asyncio.Event, order=None):
+    async with scheduler.slot(question):
+        if order is not None:
+            order.append(question)
+        await release.wait()
+
+
+def test_concurrency_is_bounded():
+    async def scenario():
+        scheduler = LLMScheduler(concurrency=2, max_queue=10, queue_timeout=5)
+        peak = 0
+
+        async def call():
+            nonlocal peak
+            peak = max(peak, scheduler.in_flight)
+            await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(scheduler.run(SHORT, call) for _ in range(6)))
+        return peak, scheduler.snapshot()
+
+    peak, snapshot = asyncio.run(scenario())
+
+    assert peak == 2
+    assert snapshot["in_flight"] == 0 and snapshot["queued"] == 0
+
+
+def test_short_questions_overtake_long_ones():
+    async def scenario():
+        scheduler = LLMScheduler(concurrency=1, max_queue=10, queue_timeout=5)
+        release, done = asyncio.Event(), asyncio.Event()
+        order = []
+        holder = asyncio.create_task(_hold(scheduler, "first", release))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(_hold(scheduler, question, done, order)) for question in (LONG, SHORT)]
+        await asyncio.sleep(0)
+        assert scheduler.queued == 2
+        release.set()
+        done.set()
+        await asyncio.gather(holder, *waiters)
+        return order
+
+    assert asyncio.run(scenario()) == [SHORT, LONG]
+
+
+def test_equal_questions_are_served_in_arrival_order():
+    async def scenario():
+        scheduler = LLMScheduler(concurrency=1, max_queue=10, queue_timeout=5)
+        release, done = asyncio.Event(), asyncio.Event()
+        order = []
+        holder = asyncio.create_task(_hold(scheduler, "first", release))
+        await asyncio.sleep(0)
+        waiters = []
+        for question in ("one", "two", "three"):
+            waiters.append(asyncio.create_task(_hold(scheduler, question, done, order)))
+            await asyncio.sleep(0.001)
+        release.set()
+        done.set()
+        await asyncio.gather(holder, *waiters)
+        return order
+
+    assert asyncio.run(scenario()) == ["one", "two", "three"]
+
+
+def test_full_queue_rejects_immediately():
+    async def scenario():
+        scheduler = LLMScheduler(concurrency=1, max_queue=1, queue_timeout=5)
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(_hold(scheduler, SHORT, release)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerBusy):
+            scheduler.check()
+        with pytest.raises(SchedulerBusy):
+            async with scheduler.slot(SHORT):
+                pass
+        release.set()
+        await asyncio.gather(*tasks)
+        return scheduler.snapshot()
+
+    snapshot = asyncio.run(scenario())
+
+    assert snapshot["rejected"] == 2
+    assert snapshot["in_flight"] == 0
+
+
+def test_waiting_too_long_for_a_slot_is_rejected():
+    async def scenario():
+        scheduler = LLMScheduler(concurrency=1, max_queue=10, queue_timeout=0.05)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(scheduler, SHORT, release))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerBusy):
+            await scheduler.run(SHORT, lambda: asyncio.sleep(0))
+        queued = scheduler.queued
+        release.set()
+        await holder
+        return queued, scheduler.snapshot()
+
+    queued, snapshot = asyncio.run(scenario())
+
+    assert queued == 0
+    assert snapshot["rejected"] == 1 and snapshot["in_flight"] == 0
+
+
+def test_slow_completion_times_out_and_frees_its_slot():
+    async def scenario():
+        scheduler = LLMScheduler(concurrency=1, max_queue=10, queue_timeout=5, timeout=0.05)
+        with pytest.raises(asyncio.TimeoutError):
+            await scheduler.run(SHORT, lambda: asyncio.sleep(5))
+        return await scheduler.run(SHORT, lambda: asyncio.sleep(0, result="answer")), scheduler.in_flight
+
+    assert asyncio.run(scenario()) == ("answer", 0)
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def scenario():
+        scheduler = LLMScheduler(concurrency=1, max_queue=10, queue_timeout=5)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(scheduler, SHORT, release))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(_hold(scheduler, SHORT, release))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        release.set()
+        await holder
+        return scheduler.snapshot()
+
+    snapshot = asyncio.run(scenario())
+
+    assert snapshot["in_flight"] == 0 and snapshot["queued"] == 0
+
+
+@pytest.fixture
+def ask(db_tables, monkeypatch, run):
+    """Answer a question through main.cached_answer with a tiny scheduler and a slow model."""
+    monkeypatch.setattr(main, "answer_cache", LLMAnswerCache())
+
+    def ask(scheduler, question=SHORT, hold=None):
+        monkeypatch.setattr(main, "scheduler", scheduler)
+
+        async def complete(messages):
+            await asyncio.sleep(1)
+            return "answer"
+        monkeypatch.setattr(main, "complete", complete)
+
+        async def scenario():
+            release = asyncio.Event()
+            holder = asyncio.create_task(_hold(scheduler, "busy", release)) if hold else None
+            await asyncio.sleep(0)
+            try:
+                return await main.cached_answer(None, "ask-llm", question, "", lambda q: [], stream=False)
+            finally:
+                if holder is not None:
+                    release.set()
+                    await holder
+        return run(scenario())
+    return ask
+
+
+def test_saturated_scheduler_answers_503(ask):
+    with pytest.raises(HTTPException) as error:
+        ask(LLMScheduler(concurrency=1, max_queue=0, queue_timeout=5), hold=True)
+
+    assert error.value.status_code == 503
+    assert error.value.headers == {"Retry-After": "1"}
+
+
+def test_queue_timeout_answers_503(ask):
+    with pytest.raises(HTTPException) as error:
+        ask(LLMScheduler(concurrency=1, max_queue=10, queue_timeout=0.05), hold=True)
+
+    assert error.value.status_code == 503
+
+
+def test_slow_model_answers_504(ask):
+    with pytest.raises(HTTPException) as error:
+        ask(LLMScheduler(concurrency=1, max_queue=10, queue_timeout=5, timeout=0.05))
+
+    assert error.value.status_code == 504
+
+
+def test_streamed_misses_count_towards_the_hit_ratio(db_tables, monkeypatch, run):
+    monkeypatch.setattr(main, "answer_cache", LLMAnswerCache())
+    monkeypatch.setattr(main, "scheduler", LLMScheduler(concurrency=1, max_queue=0, queue_timeout=5))
+
+    async def scenario():
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(main.scheduler, "busy", release))
+        await asyncio.sleep(0)
+        try:
+            await main.cached_answer(None, "ask-llm", SHORT, "", lambda q: [], stream=True)
+        finally:
+            release.set()
+            await holder
+
+    with pytest.raises(HTTPException):
+        run(scenario())
+
+    snapshot = main.answer_cache.snapshot()
+    assert snapshot["misses"] == 1 and snapshot["hit_ratio"] == 0.0
@@ -0,0 +1,146 @@
+import json
+import asyncio
+from types import SimpleNamespace
+
+import llm_streaming
+
+
+class FakeStream:
+    def __init__(self, deltas, delay, fail):
+        self.deltas = deltas
+        self.delay = delay
+        self.fail = fail
+        self.closed = False
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        for delta in self.deltas:
+            await asyncio.sleep(self.delay)
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+        if self.fail:
+            raise RuntimeError("upstream went away")
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeOpenAI:
+    """Just enough of the OpenAI client for streamed chat completions."""
+
+    def __init__(self, deltas=("Bite ", "my ", "shiny ", "answer"), delay=0.02, fail=False):
+        self.streams = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.deltas, self.delay, self.fail = deltas, delay, fail
+
+    async def create(self, **kwargs):
+        stream = FakeStream(self.deltas, self.delay, self.fail)
+        self.streams.append(stream)
+        return stream
+
+
+class FakeRequest:
+    async def is_disconnected(self):
+        return False
+
+
+def _text(events):
+    text = ""
+    for event in events:
+        data = json.loads(event.split("data: ", 1)[1])
+        text += data.get("delta", "")
+    return text
+
+
+async def _listen(question, client, stored, start_after=0.0):
+    await asyncio.sleep(start_after)
+    completion = llm_streaming.shared_completion(question)
+    if completion is None:
+        async def on_complete(text):
+            stored.append(text)
+        completion = llm_streaming.start_completion(question, client, [], on_complete=on_complete)
+    return [event async for event in completion.listen(FakeRequest())]
+
+
+def test_identical_questions_share_one_stream():
+    client, stored = FakeOpenAI(), []
+
+    async def scenario():
+        return await asyncio.gather(*(_listen("q", client, stored, start_after) for start_after in (0, 0, 0.05)))
+
+    results = asyncio.run(scenario())
+
+    assert len(client.streams) == 1
+    for events in results:
+        assert _text(events) == "Bite my shiny answer"
+        assert events[-1].startswith("event: done")
+    assert stored == ["Bite my shiny answer"]
+    assert llm_streaming.shared_completion("q") is None
+
+
+def test_different_questions_stream_separately():
+    client, stored = FakeOpenAI(), []
+
+    async def scenario():
+        return await asyncio.gather(_listen("q1", client, stored), _listen("q2", client, stored))
+
+    asyncio.run(scenario())
+
+    assert len(client.streams) == 2
+
+
+def test_upstream_error_reaches_every_listener():
+    client, stored = FakeOpenAI(fail=True), []
+
+    async def scenario():
+        return await asyncio.gather(_listen("q", client, stored), _listen("q", client, stored, 0.03))
+
+    for events in asyncio.run(scenario()):
+        assert events[-1].startswith("event: error")
+        assert "upstream went away" in events[-1]
+    assert stored == []
+
+
+def test_upstream_is_closed_when_every_listener_leaves():
+    client = FakeOpenAI(delay=0.05)
+
+    async def scenario():
+        completion = llm_streaming.start_completion("q", client, [])
+        listeners = [completion.listen(FakeRequest()) for _ in range(2)]
+        for listener in listeners:
+            await listener.__anext__()
+        await listeners[0].aclose()
+        await asyncio.sleep(0)
+        still_running = not completion._task.done()
+        await listeners[1].aclose()
+        await asyncio.gather(completion._task, return_exceptions=True)
+        return still_running, completion._task.cancelled()
+
+    still_running, cancelled = asyncio.run(scenario())
+
+    assert still_running and cancelled
+    assert client.streams[0].closed
+
+
+def test_abandoned_stream_is_not_joined_and_reports_an_error():
+    client, stored = FakeOpenAI(delay=0.05), []
+
+    async def scenario():
+        completion = llm_streaming.start_completion("q", client, [])
+        listener = completion.listen(FakeRequest())
+        await listener.__anext__()
+        await listener.aclose()
+        joinable = llm_streaming.shared_completion("q")
+        # A client that got hold of it just before the abort
+        late = [event async for event in completion.listen(FakeRequest())]
+        restarted = await _listen("q", client, stored)
+        return joinable, late, restarted
+
+    joinable, late, restarted = asyncio.run(scenario())
+
+    assert joinable is None
+    assert late[-1].startswith("event: error") and "abandoned" in late[-1]
+    assert len(client.streams) == 2
+    assert _text(restarted) == "Bite my shiny answer" and restarted[-1].startswith("event: done")
+    assert llm_streaming.shared_completion("q") is None
@@ -0,0 +1,224 @@
+import asyncio
+from collections import defaultdict
+from decimal import Decimal
+
+import pytest
+
+import circle_bender_async
+import ledger
+import payout_jobs
+import payout_planner
+import tx_index
+from database import Project, SessionLocal
+
+MASTER = "0xmaster"
+
+
+def _wallet(name, balance):
+    return {"name": name, "wallet_id": f"wallet-{name}", "address": f"0x{name}", "balance": balance}
+
+
+def _after(wallets, plan):
+    """Balance of every address once the plan's transfers went through (master starts at zero)."""
+    balances = defaultdict(Decimal)
+    for wallet in wallets:
+        balances[wallet["address"]] += Decimal(wallet["balance"])
+    for transfer in plan["transfers"]:
+        balances[transfer["from_address"]] -= transfer["amount"]
+        balances[transfer["to_address"]] += transfer["amount"]
+    return balances
+
+
+def _owed(plan):
+    owed = defaultdict(Decimal)
+    for payout in plan["payouts"]:
+        owed[payout["address"]] += payout["amount"]
+    return owed
+
+
+def test_plan_conserves_amounts():
+    wallets = [_wallet("a", "10"), _wallet("b", "5"), _wallet("c", "3")]
+    contributions = {"a": {"0xx": Decimal(3), "0xb": Decimal(1)},
+                     "b": {"0xx": Decimal(1), "0xy": Decimal(1)}}
+
+    plan = payout_planner.plan(wallets, ["a", "b"], contributions, MASTER)
+
+    assert plan["total_collected"] == Decimal(18)
+    assert plan["amount_per_winner"] == Decimal(9)
+    assert dict(_owed(plan)) == {"0xx": Decimal("11.25"), "0xb": Decimal("2.25"), "0xy": Decimal("4.5")}
+    after = _after(wallets, plan)
+    # Contributors end with exactly what they are owed, project wallets are emptied
+    assert after["0xx"] == Decimal("11.25")
+    assert after["0xb"] == Decimal("2.25")
+    assert after["0xy"] == Decimal("4.5")
+    assert after["0xa"] == after["0xc"] == after[MASTER] == 0
+    assert sum(after.values()) == plan["total_collected"]
+    assert all(transfer["amount"] > 0 for transfer in plan["transfers"])
+    # Only project wallets send
+    assert {transfer["from_address"] for transfer in plan["transfers"]} <= {"0xa", "0xb", "0xc"}
+
+
+def test_plan_uses_fewest_transfers():
+    wallets = [_wallet("a", "10"), _wallet("b", "5"), _wallet("c", "3")]
+    contributions = {"a": {"0xx": Decimal(3), "0xb": Decimal(1)},
+                     "b": {"0xx": Decimal(1), "0xy": Decimal(1)}}
+
+    plan = payout_planner.plan(wallets, ["a", "b"], contributions, MASTER)
+
+    # Five addresses change balance: never more than four transfers, against seven collecting via master
+    assert len(plan["transfers"]) <= 4
+    assert plan["naive_transfers"] == 7
+
+
+def test_plan_cancels_offsetting_flows():
+    # Each winner was funded by the other project's wallet with exactly what it holds
+    wallets = [_wallet("a", "4"), _wallet("b", "4")]
+    contributions = {"a": {"0xb": Decimal(1)}, "b": {"0xa": Decimal(1)}}
+
+    plan = payout_planner.plan(wallets, ["a", "b"], contributions, MASTER)
+
+    assert plan["transfers"] == []
+    assert plan["naive_transfers"] == 4
+
+
+def test_settle_pairs_equal_amounts():
+    transfers = payout_planner._settle({"0xa": Decimal(5), "0xb": Decimal(3)},
+                                       {"0xx": Decimal(3), "0xy": Decimal(5)})
+
+    assert sorted(transfers) == [("0xa", "0xy", Decimal(5)), ("0xb", "0xx", Decimal(3))]
+
+
+def test_rounding_dust_stays_in_master_wallet():
+    wallets = [_wallet("a", "1")]
+    contributions = {"a": {"0xx": Decimal(1), "0xy": Decimal(1), "0xz": Decimal(1)},
+                     "b": {"0xx": Decimal(1)},
+                     "c": {}}
+
+    plan = payout_planner.plan(wallets, ["a", "b", "c"], contributions, MASTER)
+
+    assert plan["amount_per_winner"] == Decimal("0.333333")
+    for payout in plan["payouts"]:
+        assert payout["amount"] == payout["amount"].quantize(payout_planner.PAYOUT_QUANTUM)
+    paid = sum(_owed(plan).values())
+    assert paid == Decimal("0.666666")
+    after = _after(wallets, plan)
+    # The rounding remainders and the share of the winner nobody funded go to the master wallet
+    assert after[MASTER] == Decimal(1) - paid
+    assert paid + after[MASTER] == plan["total_collected"]
+
+
+def test_plan_of_no_balances_sends_nothing():
+    plan = payout_planner.plan([_wallet("a", "0")], ["a"], {"a": {"0xx": Decimal(1)}}, MASTER)
+
+    assert plan["total_collected"] == 0
+    assert plan["payouts"] == []
+    assert plan["transfers"] == []
+
+
+@pytest.fixture
+def circle(monkeypatch):
+    """Balances and contributions served locally; transfers are recorded instead of sent."""
+    balances = {"wallet-a": "10", "wallet-b": "5", "wallet-c": "3"}
+    contributions = {"0xa": {"0xx": Decimal(3), "0xb": Decimal(1)},
+                     "0xb": {"0xx": Decimal(1), "0xy": Decimal(1)}}
+    sent = []
+
+    async def balances_for(wallet_ids, token_id=None):
+        return {wallet_id: balances[wallet_id] for wallet_id in wallet_ids if wallet_id in balances}
+
+    async def refresh(address):
+        return 0
+
+    async def winner_contributions(address):
+        return contributions.get(address, {})
+
+    async def create_transfer(wallet_id, token_id, amount, address, idempotency_key=None, reference=None):
+        sent.append((wallet_id, address, amount))
+        return f"tx-{len(sent)}"
+
+    monkeypatch.setattr(ledger, "balances_for", balances_for)
+    monkeypatch.setattr(tx_index, "refresh", refresh)
+    monkeypatch.setattr(tx_index, "contributions", winner_contributions)
+    monkeypatch.setattr(circle_bender_async, "create_transfer", create_transfer)
+    return sent
+
+
+async def _add_projects(*names):
+    async with SessionLocal() as db:
+        db.add_all([Project(name=name, wallet_id=f"wallet-{name}", wallet_address=f"0x{name}") for name in names])
+        await db.commit()
+
+
+def test_dry_run_matches_execution(db_tables, circle, run):
+    async def scenario():
+        await _add_projects("a", "b", "c")
+        dry_run = payout_jobs.describe_plan(await payout_jobs.build_plan(["a", "b"]))
+        async with SessionLocal() as db:
+            job_id = await payout_jobs.create_job(db, ["a", "b"])
+        await payout_jobs.run_job(job_id)
+        async with SessionLocal() as db:
+            job = await db.get(payout_jobs.PayoutJob, job_id)
+        return dry_run, job
+
+    dry_run, job = run(scenario())
+
+    assert job.status == "completed" and job.error is None
+    assert job.total_collected == dry_run["total_collected"]
+    assert job.amount_per_winner == dry_run["amount_per_winner"]
+    planned = [(transfer["from_wallet_id"], transfer["to_address"], transfer["amount"])
+               for transfer in dry_run["transfers"]]
+    assert sorted(circle) == sorted(planned)
+
+
+def test_unknown_winner_fails_the_job(db_tables, circle, run):
+    async def scenario():
+        await _add_projects("a")
+        with pytest.raises(ValueError, match="nobody"):
+            await payout_jobs.build_plan(["a", "nobody"])
+        async with SessionLocal() as db:
+            job_id = await payout_jobs.create_job(db, ["a", "nobody"])
+        await payout_jobs.run_job(job_id)
+        async with SessionLocal() as db:
+            return await db.get(payout_jobs.PayoutJob, job_id)
+
+    job = run(scenario())
+
+    assert job.status == "failed"
+    assert "nobody" in job.error
+    assert circle == []
+
+
+def test_interrupted_step_leaves_the_job_to_be_rerun(db_tables, circle, run, monkeypatch):
+    monkeypatch.setattr(payout_jobs, "PAYOUT_RETRY_SECONDS", 0.05)
+    create_transfer = circle_bender_async.create_transfer
+    calls = []
+
+    async def flaky_transfer(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        return await create_transfer(*args, **kwargs)
+    monkeypatch.setattr(circle_bender_async, "create_transfer", flaky_transfer)
+
+    async def job_after(job_id):
+        async with SessionLocal() as db:
+            return await db.get(payout_jobs.PayoutJob, job_id)
+
+    async def scenario():
+        await _add_projects("a", "b", "c")
+        async with SessionLocal() as db:
+            job_id = await payout_jobs.create_job(db, ["a", "b"])
+        await payout_jobs.run_job(job_id)
+        interrupted = await job_after(job_id)
+        sent_before_rerun, calls_before_rerun = len(circle), len(calls)
+        while job_id in payout_jobs._retry_handles or job_id in payout_jobs._tasks:
+            await asyncio.sleep(0.01)
+        return interrupted, sent_before_rerun, calls_before_rerun, await job_after(job_id)
+
+    interrupted, sent_before_rerun, calls_before_rerun, job = run(scenario())
+
+    assert interrupted.status == "paying"
+    # The sibling transfers went out regardless
+    assert sent_before_rerun == calls_before_rerun - 1 > 0
+    assert job.status == "completed" and job.error is None
+    assert len(circle) == sent_before_rerun + 1
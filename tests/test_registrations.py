@@ -0,0 +1,84 @@
+import time
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import update
+
+import main
+import registrations
+from database import SessionLocal
+from registrations import Registration
+
+
+async def _add_registration() -> str:
+    now = time.time()
+    async with SessionLocal() as db:
+        db.add(Registration(id="r1", project_name="bender", status="queued", wallet_key="w", ens_key="e",
+                            confirm_attempts=0, created_at=now, updated_at=now))
+        await db.commit()
+    return "r1"
+
+
+async def _update_elsewhere(registration_id: str, status: str):
+    """Change the persisted state the way a stage worker in another process would: no local publish."""
+    async with SessionLocal() as db:
+        await db.execute(update(Registration).where(Registration.id == registration_id)
+                         .values(status=status, updated_at=time.time()))
+        await db.commit()
+
+
+def test_events_see_transitions_made_by_another_process(db_tables, run):
+    async def scenario():
+        registration_id = await _add_registration()
+        stream = registrations.events(registration_id, poll=0.05)
+        seen = [(await stream.__anext__())["status"]]
+        await _update_elsewhere(registration_id, "wallet_created")
+        seen.append((await asyncio.wait_for(stream.__anext__(), 1))["status"])
+        await _update_elsewhere(registration_id, "registered")
+        seen += [state["status"] async for state in stream]
+        return seen
+
+    assert run(scenario()) == ["queued", "wallet_created", "registered"]
+
+
+def test_events_get_local_transitions_once(db_tables, run):
+    async def scenario():
+        registration_id = await _add_registration()
+        stream = registrations.events(registration_id, poll=0.05)
+        seen = [(await stream.__anext__())["status"]]
+
+        async def transitions():
+            await asyncio.sleep(0.1)
+            await registrations._update(registration_id, status="ens_submitted")
+            await asyncio.sleep(0.1)
+            await registrations._update(registration_id, status="failed", error="boom")
+
+        task = asyncio.create_task(transitions())
+        seen += [state["status"] async for state in stream]
+        await task
+        return seen, dict(registrations._subscribers)
+
+    seen, subscribers = run(scenario())
+
+    assert seen == ["queued", "ens_submitted", "failed"]
+    assert subscribers == {}
+
+
+def test_invalid_ens_label_is_rejected_before_queueing(db_tables, run, monkeypatch):
+    submitted = []
+
+    async def submit(db, project):
+        submitted.append(project)
+    monkeypatch.setattr(registrations, "submit", submit)
+
+    async def scenario():
+        async with SessionLocal() as db:
+            await main.register_project("Clarity", db)
+
+    with pytest.raises(HTTPException) as error:
+        run(scenario())
+
+    assert error.value.status_code == 400
+    assert "lowercase" in error.value.detail
+    assert submitted == []
@@ -0,0 +1,102 @@
+from decimal import Decimal
+
+import httpx
+import pytest
+
+import circle_bender_async
+import tx_index
+from circle_bender import ETH_SEPOLIA_ADDRESS
+
+DESTINATION = "0xwinner"
+
+
+def _transaction(transaction_id, source, amount, state="COMPLETE", created="2026-01-01T00:00:00Z",
+                 token_id=ETH_SEPOLIA_ADDRESS, transaction_type="INBOUND"):
+    return {"id": transaction_id, "sourceAddress": source, "amounts": [amount], "state": state,
+            "createDate": created, "tokenId": token_id, "transactionType": transaction_type}
+
+
+@pytest.fixture
+def circle(monkeypatch):
+    """Serve the transaction list from ``history`` (newest last) in pages of two; records every query."""
+    monkeypatch.setattr(tx_index, "PAGE_SIZE", 2)
+    history, queries = [], []
+
+    async def request(rate_class, method, path, params=None, **kwargs):
+        queries.append(dict(params))
+        transactions = [transaction for transaction in history
+                        if transaction["createDate"] >= params.get("from", "")]
+        if params.get("pageAfter"):
+            ids = [transaction["id"] for transaction in transactions]
+            transactions = transactions[ids.index(params["pageAfter"]) + 1:]
+        page = transactions[:params["pageSize"]]
+        return httpx.Response(200, json={"data": {"transactions": page}},
+                              request=httpx.Request(method, f"http://circle.test{path}"))
+
+    monkeypatch.setattr(circle_bender_async, "request", request)
+    return history, queries
+
+
+def test_backfill_walks_every_page_and_counts_settled_inbound_transfers(db_tables, circle, run):
+    history, queries = circle
+    history += [_transaction("t1", "0xa", "1"), _transaction("t2", "0xb", "2"),
+                _transaction("t3", "0xa", "3"), _transaction("t4", "0xb", "4", state="FAILED"),
+                _transaction("t5", "0xa", "5", token_id="other-token")]
+
+    async def scenario():
+        counted = await tx_index.refresh(DESTINATION)
+        return counted, await tx_index.contributions(DESTINATION)
+
+    counted, contributions = run(scenario())
+
+    assert counted == 3
+    assert contributions == {"0xa": Decimal(4), "0xb": Decimal(2)}
+    assert [query.get("pageAfter") for query in queries] == [None, "t2", "t4"]
+
+
+def test_refresh_picks_up_new_and_newly_settled_transfers_once(db_tables, circle, run):
+    history, queries = circle
+    history += [_transaction("t1", "0xa", "1", created="2026-01-01T00:00:00Z"),
+                _transaction("t2", "0xb", "2", state="SENT", created="2026-01-02T00:00:00Z")]
+
+    async def scenario():
+        first = await tx_index.refresh(DESTINATION)
+        history[1]["state"] = "COMPLETE"
+        history.append(_transaction("t3", "0xa", "3", created="2026-01-03T00:00:00Z"))
+        queries.clear()
+        second = await tx_index.refresh(DESTINATION)
+        third = await tx_index.refresh(DESTINATION)
+        return first, second, third, await tx_index.contributions(DESTINATION)
+
+    first, second, third, contributions = run(scenario())
+
+    assert (first, second, third) == (1, 2, 0)
+    assert contributions == {"0xa": Decimal(4), "0xb": Decimal(2)}
+    # Incremental refreshes start at the oldest transfer still in flight
+    assert queries[0]["from"] == "2026-01-02T00:00:00Z"
+
+
+def test_interrupted_backfill_resumes_after_the_last_stored_page(db_tables, circle, monkeypatch, run):
+    history, queries = circle
+    history += [_transaction(f"t{i}", "0xa", "1") for i in range(1, 6)]
+    serve = circle_bender_async.request
+    failures = [httpx.ConnectError("connection reset")]
+
+    async def failing_third_page(rate_class, method, path, params=None, **kwargs):
+        if params.get("pageAfter") == "t4" and failures:
+            raise failures.pop()
+        return await serve(rate_class, method, path, params=params, **kwargs)
+    monkeypatch.setattr(circle_bender_async, "request", failing_third_page)
+
+    async def scenario():
+        with pytest.raises(httpx.ConnectError):
+            await tx_index.refresh(DESTINATION)
+        queries.clear()
+        counted = await tx_index.refresh(DESTINATION)
+        return counted, await tx_index.contributions(DESTINATION)
+
+    counted, contributions = run(scenario())
+
+    assert counted == 1
+    assert contributions == {"0xa": Decimal(5)}
+    assert queries[0]["pageAfter"] == "t4"
@@ -0,0 +1,107 @@
+import time
+import asyncio
+
+import httpx
+import pytest
+
+import circle_bender_async
+import tx_tracker
+
+
+@pytest.fixture
+def circle(monkeypatch):
+    """Circle's transaction states by id; list queries and single lookups are recorded."""
+    states, queries, lookups = {}, [], []
+
+    async def request(rate_class, method, path, params=None, **kwargs):
+        queries.append(params["walletIds"].split(","))
+        transactions = [dict(transaction, id=transaction_id) for transaction_id, transaction in states.items()
+                        if transaction.get("walletId") in params["walletIds"].split(",")]
+        return httpx.Response(200, json={"data": {"transactions": transactions}},
+                              request=httpx.Request(method, f"http://circle.test{path}"))
+
+    async def get_transaction(transaction_id):
+        lookups.append(transaction_id)
+        return states.get(transaction_id)
+
+    monkeypatch.setattr(circle_bender_async, "request", request)
+    monkeypatch.setattr(circle_bender_async, "get_transaction", get_transaction)
+    monkeypatch.setattr(tx_tracker, "_listeners", [])
+    return states, queries, lookups
+
+
+def _due():
+    """A time at which every transaction tracked just now is due."""
+    return time.time() + tx_tracker.TX_POLL_MIN_SECONDS
+
+
+def test_state_changes_are_recorded_and_announced(db_tables, circle, run):
+    states, queries, _ = circle
+    seen = []
+
+    async def listener(transaction):
+        seen.append((transaction["id"], transaction["state"]))
+    tx_tracker.listen(listener)
+
+    async def scenario():
+        await tx_tracker.track("tx-1", "transfer", "wallet-a", reference="payout:job")
+        await tx_tracker.track("tx-1", "transfer", "wallet-a", reference="payout:job")
+        await tx_tracker.track("tx-2", "transfer", "wallet-b", reference="payout:job")
+        states["tx-1"] = {"walletId": "wallet-a", "state": "COMPLETE", "txHash": "0xhash"}
+        states["tx-2"] = {"walletId": "wallet-b", "state": "INITIATED"}
+        changed = await tx_tracker.poll_once(_due())
+        return changed, await tx_tracker.get("tx-1"), await tx_tracker.get("tx-2")
+
+    changed, first, second = run(scenario())
+
+    assert changed == 1
+    assert seen == [("tx-1", "COMPLETE")]
+    assert (first["state"], first["tx_hash"], first["final"], first["polls"]) == ("COMPLETE", "0xhash", True, 1)
+    assert (second["state"], second["final"], second["polls"]) == ("INITIATED", False, 1)
+    # Both wallets were read with a single list query
+    assert [sorted(wallet_ids) for wallet_ids in queries] == [["wallet-a", "wallet-b"]]
+
+
+def test_due_transactions_are_claimed_by_one_poller_only(db_tables, circle, run):
+    states, queries, _ = circle
+
+    async def scenario():
+        for i in range(5):
+            await tx_tracker.track(f"tx-{i}", "transfer", "wallet-a")
+        now = _due()
+        claimed = await asyncio.gather(tx_tracker._claim_due(now), tx_tracker._claim_due(now))
+        return [sorted(transaction.id for transaction in batch) for batch in claimed]
+
+    first, second = run(scenario())
+
+    assert sorted(first + second) == [f"tx-{i}" for i in range(5)]
+    assert not set(first) & set(second)
+
+
+def test_transactions_missing_from_the_list_are_looked_up(db_tables, circle, run):
+    states, queries, lookups = circle
+
+    async def scenario():
+        await tx_tracker.track("tx-orphan", "contract_execution")
+        await tx_tracker.track("tx-unlisted", "transfer", "wallet-a")
+        states["tx-orphan"] = {"state": "COMPLETE"}
+        states["tx-unlisted"] = {"state": "COMPLETE"}
+        now = _due()
+        rounds = []
+        for _ in range(3):
+            rounds.append(await tx_tracker.poll_once(now))
+            now += tx_tracker.TX_POLL_MAX_SECONDS
+        return rounds, await tx_tracker.get("tx-unlisted")
+
+    rounds, unlisted = run(scenario())
+
+    # A transaction without a wallet is looked up right away, one the list keeps missing after two polls
+    assert lookups == ["tx-orphan", "tx-unlisted"]
+    assert rounds == [1, 0, 1]
+    assert unlisted["state"] == "COMPLETE"
+
+
+def test_poll_interval_grows_with_age_within_bounds():
+    assert tx_tracker.poll_interval(0) == tx_tracker.TX_POLL_MIN_SECONDS
+    assert tx_tracker.poll_interval(100) == 100 * tx_tracker.POLL_AGE_FACTOR
+    assert tx_tracker.poll_interval(10 ** 6) == tx_tracker.TX_POLL_MAX_SECONDS
@@ -0,0 +1,192 @@
+"""Locally persisted index of inbound transfers per destination address.
+
+``pay_to_winner`` splits a winner's share among the addresses that funded the
+winner's wallet.  Rather than re-reading (only the first page of) the Circle
+transaction list on every payout, inbound transactions are stored in
+``inbound_transactions`` and per-source totals are kept in
+``inbound_contributions``, updated as each transaction settles.
+
+The first refresh of an address walks the full history with cursor-based
+pagination.  Later refreshes only ask for transactions created since the
+newest one already indexed (or since the oldest one still in flight, so its
+later settlement is picked up), which makes a refresh O(new transactions).
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, Optional
+
+from sqlalchemy import Boolean, Column, String, select
+
+import circle_bender_async
+from circle_bender import ETH_SEPOLIA_ADDRESS
+from database import Base, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Largest page the Circle list endpoints return
+PAGE_SIZE = 50
+
+# States in which an inbound transfer counts as a contribution
+SETTLED_STATES = {"CONFIRMED", "COMPLETE"}
+# States a transaction never leaves
+TERMINAL_STATES = {"COMPLETE", "FAILED", "CANCELLED", "DENIED"}
+
+
+class InboundTransaction(Base):
+    __tablename__ = "inbound_transactions"
+
+    id = Column(String, primary_key=True)
+    destination_address = Column(String, index=True, nullable=False)
+    source_address = Column(String)
+    token_id = Column(String)
+    amount = Column(String, nullable=False)
+    state = Column(String)
+    create_date = Column(String)
+    counted = Column(Boolean, nullable=False, default=False)
+
+
+class InboundContribution(Base):
+    __tablename__ = "inbound_contributions"
+
+    destination_address = Column(String, primary_key=True)
+    source_address = Column(String, primary_key=True)
+    total = Column(String, nullable=False, default="0")
+
+
+class InboundIndexCursor(Base):
+    __tablename__ = "inbound_index_cursors"
+
+    destination_address = Column(String, primary_key=True)
+    newest_create_date = Column(String)
+    # Resume point of an interrupted first backfill (pageAfter id)
+    backfill_after = Column(String)
+    backfilled = Column(Boolean, nullable=False, default=False)
+
+
+_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+
+def _counts(transaction: dict) -> bool:
+    return (transaction.get('tokenId') == ETH_SEPOLIA_ADDRESS
+            and transaction.get('transactionType') == 'INBOUND'
+            and transaction.get('state') in SETTLED_STATES)
+
+
+async def _apply_page(db, destination_address: str, transactions) -> int:
+    """Upsert a page of transactions and fold newly settled ones into the totals."""
+    ids = [transaction.get('id') for transaction in transactions]
+    known = {row.id: row for row in await db.scalars(select(InboundTransaction).where(InboundTransaction.id.in_(ids)))}
+    newly_counted = 0
+    deltas: Dict[str, Decimal] = defaultdict(Decimal)
+    for transaction in transactions:
+        row = known.get(transaction.get('id'))
+        if row is None:
+            row = InboundTransaction(
+                id=transaction.get('id'),
+                destination_address=destination_address,
+                source_address=transaction.get('sourceAddress'),
+                token_id=transaction.get('tokenId'),
+                amount=format(sum((Decimal(a) for a in transaction.get('amounts', [])), Decimal(0)), 'f'),
+                create_date=transaction.get('createDate'),
+                counted=False,
+            )
+            db.add(row)
+        row.state = transaction.get('state')
+        if not row.counted and _counts(transaction):
+            row.counted = True
+            deltas[row.source_address] += Decimal(row.amount)
+            newly_counted += 1
+
+    if not deltas:
+        return newly_counted
+    contributions = {row.source_address: row for row in await db.scalars(
+        select(InboundContribution)
+        .where(InboundContribution.destination_address == destination_address,
+               InboundContribution.source_address.in_(list(deltas))))}
+    for source_address, delta in deltas.items():
+        contribution = contributions.get(source_address)
+        if contribution is None:
+            contribution = InboundContribution(destination_address=destination_address,
+                                               source_address=source_address, total="0")
+            db.add(contribution)
+        contribution.total = format(Decimal(contribution.total) + delta, 'f')
+    return newly_counted
+
+
+async def _incremental_from(db, cursor: InboundIndexCursor) -> Optional[str]:
+    """Oldest create date a refresh has to look at again."""
+    oldest_open = await db.scalar(select(InboundTransaction.create_date)
+                                  .where(InboundTransaction.destination_address == cursor.destination_address,
+                                         InboundTransaction.counted.is_(False),
+                                         InboundTransaction.state.notin_(TERMINAL_STATES))
+                                  .order_by(InboundTransaction.create_date)
+                                  .limit(1))
+    candidates = [date for date in (oldest_open, cursor.newest_create_date) if date]
+    return min(candidates) if candidates else None
+
+
+async def refresh(destination_address: str) -> int:
+    """Pull transactions for ``destination_address`` that the index has not seen.
+
+    Returns the number of transactions that became countable contributions.
+    """
+    async with _locks[destination_address]:
+        async with SessionLocal() as db:
+            cursor = await db.get(InboundIndexCursor, destination_address)
+            if cursor is None:
+                cursor = InboundIndexCursor(destination_address=destination_address, backfilled=False)
+                db.add(cursor)
+                await db.commit()
+
+            params = {
+                'blockchain': 'ETH-SEPOLIA',
+                'custodyType': 'DEVELOPER',
+                'destinationAddress': destination_address,
+                'operation': 'TRANSFER',
+                'pageSize': PAGE_SIZE,
+            }
+            page_after = None
+            if cursor.backfilled:
+                since = await _incremental_from(db, cursor)
+                if since:
+                    params['from'] = since
+            else:
+                page_after = cursor.backfill_after
+
+            newly_counted = 0
+            pages = 0
+            while True:
+                page_params = dict(params, pageAfter=page_after) if page_after else params
+                response = await circle_bender_async.request("transactions", "GET", "/v1/w3s/transactions",
+                                                             params=page_params)
+                response.raise_for_status()
+                transactions = response.json().get('data', {}).get('transactions', [])
+                pages += 1
+                if transactions:
+                    newly_counted += await _apply_page(db, destination_address, transactions)
+                    newest = max(t.get('createDate') or '' for t in transactions)
+                    if newest and (cursor.newest_create_date or '') < newest:
+                        cursor.newest_create_date = newest
+                    page_after = transactions[-1].get('id')
+                    if not cursor.backfilled:
+                        cursor.backfill_after = page_after
+                # Commit per page so an interrupted backfill resumes where it stopped
+                await db.commit()
+                if len(transactions) < PAGE_SIZE:
+                    break
+
+            cursor.backfilled = True
+            cursor.backfill_after = None
+            await db.commit()
+            logger.info(f"Indexed {destination_address}: {pages} page(s), {newly_counted} new contribution(s)")
+            return newly_counted
+
+
+async def contributions(destination_address: str) -> Dict[str, Decimal]:
+    """Per-source contributed totals for ``destination_address`` from the index."""
+    async with SessionLocal() as db:
+        rows = await db.execute(select(InboundContribution.source_address, InboundContribution.total)
+                                .where(InboundContribution.destination_address == destination_address))
+        return {source_address: Decimal(total) for source_address, total in rows}
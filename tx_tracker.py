@@ -0,0 +1,301 @@
+"""Background tracker of outbound Circle transactions.
+
+Transfers and contract executions are only submitted by the calls that create
+them; Circle settles them later.  Every submitted transaction is recorded in
+``tracked_transactions`` and a poller brings the recorded state up to date
+until the transaction reaches a terminal state.
+
+Polling is batched.  Due transactions are grouped by the wallet that sent them,
+and each group is read with one paginated ``GET /v1/w3s/transactions``
+query (``walletIds`` + ``from``), so a payout with hundreds of transfers in
+flight costs a few list calls per round instead of one lookup each.  The
+interval between polls grows with the transaction's age, from
+TX_POLL_MIN_SECONDS up to TX_POLL_MAX_SECONDS.
+
+Due rows are claimed with a conditional UPDATE, so several worker processes
+can run the poller over the same table without polling a transaction twice.
+Listeners registered with ``listen`` are called on every state change seen by
+this process.
+
+Configuration (environment):
+    TX_POLL_MIN_SECONDS       first poll delay and shortest interval (default 2)
+    TX_POLL_MAX_SECONDS       longest interval between polls (default 60)
+    TX_POLL_BATCH_SIZE        transactions claimed per polling round (default 500)
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import Boolean, Column, Float, Integer, String, Text, func, select, update
+from sqlalchemy.exc import IntegrityError
+
+import circle_bender_async
+from database import Base, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+TX_POLL_MIN_SECONDS = float(os.getenv('TX_POLL_MIN_SECONDS', '2'))
+TX_POLL_MAX_SECONDS = float(os.getenv('TX_POLL_MAX_SECONDS', '60'))
+TX_POLL_BATCH_SIZE = int(os.getenv('TX_POLL_BATCH_SIZE', '500'))
+
+# The interval is this fraction of the transaction's age, within the bounds above
+POLL_AGE_FACTOR = 0.25
+# How often the poller looks for due transactions
+TICK_SECONDS = 1.0
+# Circle list query limits
+PAGE_SIZE = 50
+MAX_PAGES = 20
+WALLETS_PER_QUERY = 20
+# Allowance for clock skew between us and Circle in the ``from`` filter
+FROM_SLACK_SECONDS = 60
+
+SETTLED_STATES = {"CONFIRMED", "COMPLETE"}
+FAILED_STATES = {"FAILED", "CANCELLED", "DENIED"}
+# States a transaction never leaves
+TERMINAL_STATES = {"COMPLETE", "FAILED", "CANCELLED", "DENIED"}
+
+
+class TrackedTransaction(Base):
+    __tablename__ = "tracked_transactions"
+
+    id = Column(String, primary_key=True)
+    kind = Column(String, nullable=False)  # "transfer" or "contract_execution"
+    wallet_id = Column(String)
+    reference = Column(String, index=True)  # what the transaction is for, e.g. "payout:<job id>"
+    state = Column(String, nullable=False, default="INITIATED")
+    tx_hash = Column(String)
+    error_reason = Column(Text)
+    final = Column(Boolean, nullable=False, default=False)
+    polls = Column(Integer, nullable=False, default=0)
+    created_at = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)
+    next_poll_at = Column(Float, index=True, nullable=False)
+
+
+def _as_dict(transaction: TrackedTransaction) -> dict:
+    return {
+        "id": transaction.id,
+        "kind": transaction.kind,
+        "wallet_id": transaction.wallet_id,
+        "reference": transaction.reference,
+        "state": transaction.state,
+        "tx_hash": transaction.tx_hash,
+        "error_reason": transaction.error_reason,
+        "final": transaction.final,
+        "polls": transaction.polls,
+        "created_at": transaction.created_at,
+        "updated_at": transaction.updated_at,
+    }
+
+
+def poll_interval(age: float) -> float:
+    return min(max(TX_POLL_MIN_SECONDS, age * POLL_AGE_FACTOR), TX_POLL_MAX_SECONDS)
+
+
+_listeners: List[Callable[[dict], Awaitable[None]]] = []
+
+
+def listen(callback: Callable[[dict], Awaitable[None]]):
+    """Call ``callback(transaction)`` whenever this process sees a transaction change state."""
+    if callback not in _listeners:
+        _listeners.append(callback)
+
+
+async def track(transaction_id: str, kind: str, wallet_id: Optional[str] = None,
+                reference: Optional[str] = None):
+    """Start tracking a submitted transaction; tracking the same id again is a no-op."""
+    if not transaction_id:
+        return
+    now = time.time()
+    async with SessionLocal() as db:
+        db.add(TrackedTransaction(id=transaction_id, kind=kind, wallet_id=wallet_id, reference=reference,
+                                  state="INITIATED", final=False, polls=0, created_at=now, updated_at=now,
+                                  next_poll_at=now + TX_POLL_MIN_SECONDS))
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Resubmitted with the same idempotency key: Circle returned the same transaction
+            await db.rollback()
+
+
+async def get(transaction_id: str) -> Optional[dict]:
+    async with SessionLocal() as db:
+        transaction = await db.get(TrackedTransaction, transaction_id)
+        return _as_dict(transaction) if transaction is not None else None
+
+
+async def find(db, reference: Optional[str] = None, state: Optional[str] = None, pending: Optional[bool] = None,
+               offset: int = 0, limit: int = 100) -> dict:
+    """Page of tracked transactions, newest first, with per-state counts over all matches."""
+    conditions = []
+    if reference is not None:
+        conditions.append(TrackedTransaction.reference == reference)
+    if state is not None:
+        conditions.append(TrackedTransaction.state == state.upper())
+    if pending is not None:
+        conditions.append(TrackedTransaction.final.is_(not pending))
+    counts = dict((await db.execute(select(TrackedTransaction.state, func.count())
+                                    .where(*conditions)
+                                    .group_by(TrackedTransaction.state))).all())
+    rows = (await db.scalars(select(TrackedTransaction)
+                             .where(*conditions)
+                             .order_by(TrackedTransaction.created_at.desc())
+                             .offset(offset)
+                             .limit(limit))).all()
+    return {"transactions": [_as_dict(row) for row in rows], "states": counts,
+            "total": sum(counts.values()), "offset": offset, "limit": limit}
+
+
+async def summary(db, reference: str) -> Dict[str, int]:
+    """Number of tracked transactions per state for ``reference``."""
+    return dict((await db.execute(select(TrackedTransaction.state, func.count())
+                                  .where(TrackedTransaction.reference == reference)
+                                  .group_by(TrackedTransaction.state))).all())
+
+
+async def _claim_due(now: float) -> List[TrackedTransaction]:
+    """Take due transactions for this round, pushing their next poll out so no one else polls them."""
+    async with SessionLocal() as db:
+        due = (select(TrackedTransaction.id)
+               .where(TrackedTransaction.final.is_(False), TrackedTransaction.next_poll_at <= now)
+               .order_by(TrackedTransaction.next_poll_at)
+               .limit(TX_POLL_BATCH_SIZE))
+        claimed = (await db.scalars(update(TrackedTransaction)
+                                    .where(TrackedTransaction.id.in_(due.scalar_subquery()),
+                                           TrackedTransaction.next_poll_at <= now)
+                                    .values(next_poll_at=now + TX_POLL_MAX_SECONDS)
+                                    .returning(TrackedTransaction)
+                                    .execution_options(synchronize_session=False))).all()
+        await db.commit()
+        return claimed
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+async def _list_states(wallet_ids: List[str], wanted: set, since: float) -> Dict[str, dict]:
+    """Circle's view of the ``wanted`` transactions sent by ``wallet_ids`` since ``since``."""
+    params = {
+        'walletIds': ",".join(wallet_ids),
+        'from': _iso(since - FROM_SLACK_SECONDS),
+        'pageSize': PAGE_SIZE,
+    }
+    found = {}
+    page_after = None
+    for _ in range(MAX_PAGES):
+        page_params = dict(params, pageAfter=page_after) if page_after else params
+        response = await circle_bender_async.request("transactions", "GET", "/v1/w3s/transactions",
+                                                     params=page_params)
+        response.raise_for_status()
+        transactions = response.json().get('data', {}).get('transactions', [])
+        for transaction in transactions:
+            if transaction.get('id') in wanted:
+                found[transaction['id']] = transaction
+        if len(found) == len(wanted) or len(transactions) < PAGE_SIZE:
+            break
+        page_after = transactions[-1].get('id')
+    return found
+
+
+async def _fetch_states(claimed: List[TrackedTransaction]) -> Dict[str, dict]:
+    by_wallet = defaultdict(list)
+    for transaction in claimed:
+        by_wallet[transaction.wallet_id].append(transaction)
+
+    queries = []
+    wallet_ids = sorted(wallet_id for wallet_id in by_wallet if wallet_id)
+    for start in range(0, len(wallet_ids), WALLETS_PER_QUERY):
+        group = [transaction for wallet_id in wallet_ids[start:start + WALLETS_PER_QUERY]
+                 for transaction in by_wallet[wallet_id]]
+        queries.append(_list_states(wallet_ids[start:start + WALLETS_PER_QUERY],
+                                    {transaction.id for transaction in group},
+                                    min(transaction.created_at for transaction in group)))
+    results = await asyncio.gather(*queries, return_exceptions=True)
+
+    states = {}
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning("Transaction list query failed: %r", result)
+        else:
+            states.update(result)
+
+    # Transactions without a known wallet, and ones the list keeps missing, are read one by one
+    missing = [transaction.id for transaction in claimed
+               if transaction.id not in states and (not transaction.wallet_id or transaction.polls >= 2)]
+    lookups = await asyncio.gather(*(circle_bender_async.get_transaction(transaction_id)
+                                     for transaction_id in missing), return_exceptions=True)
+    for transaction_id, result in zip(missing, lookups):
+        if isinstance(result, Exception):
+            logger.warning("Transaction %s lookup failed: %r", transaction_id, result)
+        elif result:
+            states[transaction_id] = result
+    return states
+
+
+async def poll_once(now: Optional[float] = None) -> int:
+    """Run one polling round; returns the number of transactions that changed state."""
+    now = time.time() if now is None else now
+    claimed = await _claim_due(now)
+    if not claimed:
+        return 0
+    states = await _fetch_states(claimed)
+
+    changed = []
+    async with SessionLocal() as db:
+        for claimed_transaction in claimed:
+            transaction = await db.get(TrackedTransaction, claimed_transaction.id)
+            observed = states.get(transaction.id)
+            transaction.polls += 1
+            transaction.next_poll_at = now + poll_interval(now - transaction.created_at)
+            if observed is None or observed.get('state') in (None, transaction.state):
+                continue
+            transaction.state = observed['state']
+            transaction.tx_hash = observed.get('txHash') or transaction.tx_hash
+            transaction.error_reason = observed.get('errorReason') or transaction.error_reason
+            transaction.final = transaction.state in TERMINAL_STATES
+            transaction.updated_at = now
+            changed.append(_as_dict(transaction))
+        await db.commit()
+
+    for transaction in changed:
+        for listener in list(_listeners):
+            try:
+                await listener(transaction)
+            except Exception:
+                logger.exception("Transaction listener failed for %s", transaction["id"])
+    logger.debug("Polled %d transaction(s), %d changed", len(claimed), len(changed))
+    return len(changed)
+
+
+async def _poll_forever():
+    while True:
+        try:
+            await poll_once()
+        except Exception:
+            logger.exception("Transaction polling round failed")
+        await asyncio.sleep(TICK_SECONDS)
+
+
+_task: Optional[asyncio.Task] = None
+
+
+def start():
+    global _task
+    if _task is None:
+        _task = asyncio.get_running_loop().create_task(_poll_forever())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -0,0 +1,83 @@
+"""Replay Circle-style transaction notifications against a running backend.
+
+Stands in for Circle's webhook delivery when developing locally, so the
+balance ledger can be exercised without a real subscription.  Run the backend
+with CIRCLE_WEBHOOK_VERIFY=0, then either replay recorded payloads:
+
+    python webhook_replay.py --file notifications.jsonl
+
+or generate synthetic ones for a wallet:
+
+    python webhook_replay.py --wallet-id <id> --inbound 0.5 --inbound 0.25 --outbound 0.1
+
+Each payload is sent twice when --duplicate is given, which should leave the
+ledger unchanged the second time.
+"""
+import sys
+import json
+import uuid
+import argparse
+from datetime import datetime, timezone
+
+import requests
+
+from circle_bender import ETH_SEPOLIA_ADDRESS
+
+
+def synthetic_notification(wallet_id: str, amount: str, transaction_type: str, state: str = "COMPLETE"):
+    return {
+        "subscriptionId": str(uuid.uuid4()),
+        "notificationId": str(uuid.uuid4()),
+        "notificationType": f"transactions.{transaction_type.lower()}",
+        "notification": {
+            "id": str(uuid.uuid4()),
+            "blockchain": "ETH-SEPOLIA",
+            "walletId": wallet_id,
+            "tokenId": ETH_SEPOLIA_ADDRESS,
+            "amounts": [amount],
+            "state": state,
+            "transactionType": transaction_type,
+            "createDate": datetime.now(timezone.utc).isoformat(),
+        },
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "version": 2,
+    }
+
+
+def load_notifications(path: str):
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8282/circle/notifications")
+    parser.add_argument("--file", help="JSON-lines file of recorded notification payloads")
+    parser.add_argument("--wallet-id", help="wallet to generate synthetic notifications for")
+    parser.add_argument("--inbound", action="append", default=[], help="amount of a synthetic inbound transfer")
+    parser.add_argument("--outbound", action="append", default=[], help="amount of a synthetic outbound transfer")
+    parser.add_argument("--duplicate", action="store_true", help="deliver every payload twice")
+    args = parser.parse_args(argv)
+
+    notifications = []
+    if args.file:
+        notifications.extend(load_notifications(args.file))
+    if args.wallet_id:
+        notifications.extend(synthetic_notification(args.wallet_id, amount, "INBOUND") for amount in args.inbound)
+        notifications.extend(synthetic_notification(args.wallet_id, amount, "OUTBOUND") for amount in args.outbound)
+    if not notifications:
+        parser.error("nothing to replay: pass --file and/or --wallet-id with amounts")
+
+    with requests.Session() as session:
+        for notification in notifications:
+            for _ in range(2 if args.duplicate else 1):
+                response = session.post(args.url, json=notification)
+                print(response.status_code, response.text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())